@@ -13,17 +13,19 @@ st.set_page_config(
 
 # Internal modules
 from src.styles import load_custom_css
-from src.database import init_db
+from src.bootstrap import bootstrap
+from src.changes import sync_caches
+from src.config import METRICS_ADMINS
+from src.metrics import page_rerun
 from src.auth import validate_session_token
+from src.pages import PAGES
 from src.pages.auth import render_login
-from src.pages.dashboard import render_dashboard
-from src.pages.administrative import render_clients, render_debtors, render_debts
-from src.pages.judicial import render_judicial, render_petitions
-from src.pages.calculations import render_negotiation, render_payments, render_agreements
-from src.pages.settings import render_settings
 
 # --- INITIALIZATION ---
-init_db()
+# Schema, seeding and CSS once per server process; a set lookup on later reruns
+bootstrap()
+# Drop cached data other processes changed (throttled; see src/changes.py)
+sync_caches()
 load_custom_css()
 
 # --- AUTHENTICATION ---
@@ -89,34 +91,11 @@ else:
 
     # --- PAGE RENDERING ---
     page = st.session_state.get('page', 'Dashboard')
-    
-    if page == "Dashboard":
-        render_dashboard()
-        
-    elif page == "Clientes":
-        render_clients()
-        
-    elif page == "Devedores":
-        render_debtors()
-        
-    elif page == "Dívidas":
-        render_debts()
-        
-    elif page == "Judicial":
-        render_judicial()
-        
-    elif page == "Petições":
-        render_petitions()
-        
-    elif page == "Simulação":
-        render_negotiation()
-        
-    elif page == "Acordos":
-        render_agreements()
-        
-    elif page == "Pagamentos":
-        render_payments()
-        
-    elif page == "Configurações":
-        render_settings()
-        
+    if page in PAGES:
+        # Imported on first visit (reportlab, streamlit_sortables... load with the page that needs them)
+        module_name, function_name = PAGES[page]
+        with page_rerun(page) as rerun:
+            getattr(importlib.import_module(module_name), function_name)()
+        if st.session_state.get('username') in METRICS_ADMINS:
+            from src.pages.metrics_panel import render_metrics_panel
+            render_metrics_panel(rerun)
@@ -0,0 +1 @@
+"""`python -m credminer`: the batch command line (src/cli.py)."""
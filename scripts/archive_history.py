@@ -0,0 +1,21 @@
+import argparse
+from datetime import date
+from src.archive import ARCHIVE_BATCH_SIZE, archive_history
+from src.changes import sync_kpi_summary
+from src.database import init_db
+
+if __name__ == '__main__':
+    # Run yearly (cron, early January) or whenever the hot tables grow too much
+    parser = argparse.ArgumentParser(description='Move pagamentos e contatos antigos de devedores sem acordo ativo para o arquivo anual.')
+    parser.add_argument('--before', type=date.fromisoformat, help='arquiva o que for anterior a esta data (AAAA-MM-DD; padrão: 1º de janeiro deste ano)')
+    parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE, help='linhas por transação')
+    args = parser.parse_args()
+
+    init_db()
+    moved = archive_history(args.before, args.batch_size,
+                            progress=lambda table, year, rows: print(f'\r{table} {year}: {rows:,} linhas', end='', flush=True))
+    print()
+    for table, rows in moved.items():
+        print(f'{table}: {rows:,} linhas arquivadas')
+    # Moving rows logs them as deletes; let the kpi_summary consumer catch up now
+    sync_kpi_summary()
@@ -0,0 +1,45 @@
+import argparse
+from datetime import datetime, timezone
+from src.backup import BACKUP_KEEP_SNAPSHOTS, capture_journal, create_snapshot, list_snapshots, prune, restore
+from src.database import init_db
+
+
+def _point_in_time(value):
+    # Local time unless an offset is given (2026-10-18T15:30 or 2026-10-18T18:30+00:00)
+    moment = datetime.fromisoformat(value)
+    return moment if moment.tzinfo else moment.astimezone()
+
+
+if __name__ == '__main__':
+    # Cron: "snapshot" daily, "journal" every minute, "prune" weekly
+    parser = argparse.ArgumentParser(description='Backup online do banco SQLite: snapshots, journal e restauração.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('snapshot', help='copia o banco em uso para um snapshot deduplicado')
+    commands.add_parser('journal', help='grava as alterações desde a última execução')
+    commands.add_parser('list', help='lista os snapshots')
+    restore_parser = commands.add_parser('restore', help='reconstrói o banco em um novo arquivo')
+    restore_parser.add_argument('target', help='arquivo de destino (não pode existir)')
+    restore_parser.add_argument('--at', type=_point_in_time, help='data/hora a restaurar (padrão: último estado gravado)')
+    prune_parser = commands.add_parser('prune', help='remove snapshots antigos e o que só eles usam')
+    prune_parser.add_argument('--keep', type=int, default=BACKUP_KEEP_SNAPSHOTS, help='snapshots mantidos')
+    args = parser.parse_args()
+
+    if args.command == 'snapshot':
+        init_db()
+        stats = create_snapshot(progress=lambda remaining, total: print(f'\r{total - remaining:,}/{total:,} páginas', end='', flush=True))
+        print(f"\rSnapshot {stats['name']}: {stats['size'] / 1024 / 1024:,.0f} MB em {stats['seconds']:.1f} s, "
+              f"{stats['new_chunks']} chunks novos ({stats['new_bytes'] / 1024 / 1024:,.1f} MB gravados)")
+    elif args.command == 'journal':
+        init_db()
+        segment = capture_journal()
+        if segment:
+            print(f"Journal {segment['from_seq']}-{segment['to_seq']}: {segment['rows']:,} linhas")
+    elif args.command == 'list':
+        for manifest in list_snapshots():
+            print(f"{manifest['name']}  {manifest['created_at']}  seq {manifest['seq']}  {manifest['size'] / 1024 / 1024:,.0f} MB")
+    elif args.command == 'restore':
+        stats = restore(args.target, args.at, progress=print)
+        print(f"Restaurado até {stats['restored_to']} (snapshot {stats['snapshot']} + {stats['segments']} segmentos, "
+              f"{stats['rows_applied']:,} linhas) em {stats['seconds']:.1f} s -> {args.target}")
+    else:
+        print(f'{prune(args.keep)} arquivos removidos')
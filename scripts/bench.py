@@ -0,0 +1,13 @@
+import sys
+from src.benchmarks import BENCHMARKS
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS)
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        print('Unknown benchmark(s):', ', '.join(unknown))
+        print('Available:', ', '.join(BENCHMARKS))
+        raise SystemExit(2)
+    for name in names:
+        print(f'== {name} ==')
+        BENCHMARKS[name]()
@@ -0,0 +1,19 @@
+from src.database import init_db, get_connection
+from src.migrations import explain_index_usage
+
+if __name__ == '__main__':
+    init_db()
+    conn = get_connection()
+    try:
+        results = explain_index_usage(conn)
+    finally:
+        conn.close()
+    missing = 0
+    for r in results:
+        mark = 'OK ' if r['uses_index'] else 'SCAN'
+        print(f"[{mark}] {r['label']}: {r['expected_index']}")
+        if not r['uses_index']:
+            missing += 1
+            print('       ' + r['plan'].replace('\n', '\n       '))
+    print(f"{len(results) - missing}/{len(results)} queries use their index.")
+    raise SystemExit(1 if missing else 0)
@@ -0,0 +1,19 @@
+import argparse
+import os
+from src.database import init_db
+from src.export import FORMATS, export_portfolio
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Exporta a carteira (devedores e dívidas) em CSV, XLSX ou Parquet.')
+    parser.add_argument('path', help='arquivo de saída; o formato vem da extensão')
+    parser.add_argument('--client', type=int, help='somente este cliente')
+    parser.add_argument('--valuation', action='store_true', help='inclui valor corrigido, juros, multa e total')
+    args = parser.parse_args()
+
+    fmt = os.path.splitext(args.path)[1].lstrip('.').lower()
+    if fmt not in FORMATS:
+        parser.error(f'extensão deve ser uma de: {", ".join(FORMATS)}')
+    init_db()
+    stats = export_portfolio(args.path, fmt, client_id=args.client, valuation=args.valuation,
+                             progress=lambda rows: print(f'\r{rows:,} linhas', end='', flush=True))
+    print(f"\r{stats['rows']:,} linhas em {stats['seconds']:.1f} s ({stats['rows_per_sec']:,.0f} linhas/s) -> {args.path}")
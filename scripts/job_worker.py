@@ -0,0 +1,14 @@
+import argparse
+from src.config import JOB_WORKERS
+from src.database import init_db
+from src.jobs import run_pool
+
+if __name__ == '__main__':
+    # Started by the app (JOB_WORKERS > 0) and exits with it; run it yourself with JOB_WORKERS=0
+    parser = argparse.ArgumentParser(description='Processos que executam as tarefas em segundo plano (importações, exportações, PDFs, índices).')
+    parser.add_argument('--processes', type=int, default=max(JOB_WORKERS, 1), help='quantos processos de trabalho')
+    parser.add_argument('--drain', action='store_true', help='sai quando a fila estiver vazia')
+    args = parser.parse_args()
+
+    init_db()
+    run_pool(args.processes, exit_when_idle=args.drain)
@@ -0,0 +1,33 @@
+import argparse
+from src.config import SLOW_QUERY_LOG, SLOW_QUERY_MS
+from src.slow_queries import read_slow_log, summarize
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Resumo do log de consultas lentas: comandos SQL ordenados pelo tempo total.')
+    parser.add_argument('--log', default=SLOW_QUERY_LOG, help='arquivo de log (os arquivos rotacionados .1, .2... também são lidos)')
+    parser.add_argument('--top', type=int, default=10, help='quantos comandos mostrar')
+    parser.add_argument('--dialect', choices=['sqlite', 'postgres'], help='só um backend')
+    parser.add_argument('--plans', action='store_true', help='mostra o último plano (EXPLAIN) de cada comando')
+    parser.add_argument('--full', action='store_true', help='mostra o SQL inteiro')
+    args = parser.parse_args()
+
+    records = [r for r in read_slow_log(args.log) if args.dialect in (None, r['dialect'])]
+    if not records:
+        print(f'Nenhuma consulta lenta em {args.log} (limite atual: {SLOW_QUERY_MS:g} ms).')
+        raise SystemExit(0)
+    groups = summarize(records)
+    total_ms = sum(g['total_ms'] for g in groups)
+    print(f'{len(records):,} execuções lentas de {len(groups)} comandos, {total_ms / 1000:.1f} s no total '
+          f'({records[0]["at"]} a {records[-1]["at"]})')
+    for rank, group in enumerate(groups[:args.top], 1):
+        sql = group['sql'] if args.full or len(group['sql']) <= 160 else group['sql'][:157] + '...'
+        print(f'\n#{rank} [{group["dialect"]}] total {group["total_ms"]:,.0f} ms ({group["total_ms"] / total_ms:.0%}) | '
+              f'{group["count"]}x | média {group["mean_ms"]:,.1f} ms | máx {group["max_ms"]:,.1f} ms | '
+              f'{group["rows"]:,.0f} linhas em média')
+        print(f'   {sql}')
+        for caller, count in sorted(group['callers'].items(), key=lambda item: -item[1])[:3]:
+            print(f'   <- {caller} ({count}x)')
+        if args.plans and group['plan']:
+            print('   plano:')
+            for line in group['plan']:
+                print(f'     {line}')
@@ -0,0 +1,9 @@
+from src.changes import compact_change_log, latest_seq, sync_kpi_summary
+from src.database import init_db
+
+if __name__ == '__main__':
+    # Run periodically (cron): catches kpi_summary up with the change log, then compacts it
+    init_db()
+    handled = sync_kpi_summary()
+    print(f'kpi_summary: {handled} changes processed (log at seq {latest_seq()})')
+    print(f'change_log: {compact_change_log()} rows compacted')
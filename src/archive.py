@@ -0,0 +1,152 @@
+"""Yearly archive of payments and contact_history (see ARCHIVED_TABLES).
+
+Both tables only grow, while the pages and aggregates mostly care about the
+current year and about debtors still negotiating. archive_history() moves rows
+dated before the current year, of debtors whose agreements are all closed, out
+of the hot table into a per-year archive (debtors never in an agreement are
+still being worked, so their history stays):
+
+  * Postgres: {table}_archive, declaratively partitioned by year
+    ({table}_archive_y2023 = FOR VALUES FROM ('2023-01-01') TO ('2024-01-01'));
+  * SQLite: one {table}_archive_y2023 table per year.
+
+Ids are kept, so a row is the same row in the hot table or in the archive.
+Reads that need the whole history (KPI recounts, the debtor bundle) go through
+the {table}_all view; queries on the hot table see only open and current-year
+history, and the view's date filters hit only the matching year's partition.
+
+    moved = archive_history()     # {"payments": 812345, "contact_history": 40211}
+"""
+import re
+from datetime import date
+
+from src.connection import current_dialect
+from src.migrations import ARCHIVED_TABLES
+from src.query import execute, fetch_all, fetch_scalar, transaction
+
+ARCHIVE_BATCH_SIZE = 10_000
+
+# Rows of debtors with an active agreement, or none yet, stay hot whatever their date
+_AGREEMENTS_CLOSED = ("EXISTS (SELECT 1 FROM agreements a WHERE a.debtor_id = {table}.debtor_id AND a.status <> 'active') "
+                      "AND NOT EXISTS (SELECT 1 FROM agreements a WHERE a.debtor_id = {table}.debtor_id AND a.status = 'active')")
+
+# SQLite: indexes of each year's archive table (index suffix, columns). SQLite can't
+# prune a view's UNION ALL arms; the date index lets a date filter skip a year with one seek.
+_SQLITE_ARCHIVE_INDEXES = {
+    "payments": (("date", "payment_date"), ("debtor_date", "debtor_id, payment_date"),
+                 ("client_date", "client_id, payment_date"), ("agreement_id", "agreement_id"), ("debt_id", "debt_id")),
+    "contact_history": (("date", "attempt_date"), ("debtor_date", "debtor_id, attempt_date"),
+                        ("client_date", "client_id, attempt_date")),
+}
+
+
+def partition_name(table, year):
+    return f"{table}_archive_y{year}"
+
+
+def archive_partitions(table, tx=None):
+    """Years that have an archive partition for `table`, ascending."""
+    if current_dialect().is_postgres:
+        rows = fetch_all("""
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            WHERE p.relname = :parent
+        """, {"parent": f"{table}_archive"}, tx=tx)
+    else:
+        rows = fetch_all("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE :pattern",
+                         {"pattern": f"{table}_archive_y%"}, tx=tx)
+    years = (re.fullmatch(rf"{table}_archive_y(\d{{4}})", name) for (name,) in rows)
+    return sorted(int(match.group(1)) for match in years if match)
+
+
+def _rebuild_sqlite_view(table, tx):
+    selects = [f"SELECT * FROM {table}"]
+    selects += [f"SELECT * FROM {partition_name(table, year)}" for year in archive_partitions(table, tx)]
+    execute(f"DROP VIEW IF EXISTS {table}_all", tx=tx)
+    execute(f"CREATE VIEW {table}_all AS " + " UNION ALL ".join(selects), tx=tx)
+
+
+def ensure_partition(table, year, tx):
+    """Creates `table`'s archive partition for `year` if missing; returns its name."""
+    name = partition_name(table, year)
+    if current_dialect().is_postgres:
+        execute(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table}_archive "
+            f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')", tx=tx)
+        return name
+    if fetch_scalar("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name", {"name": name}, tx=tx):
+        return name
+    # Same columns (in the same order, for SELECT *) and foreign keys as the hot table
+    create_sql = fetch_scalar("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :table", {"table": table}, tx=tx)
+    execute(re.sub(r"CREATE TABLE( IF NOT EXISTS)? \"?\w+\"?", f"CREATE TABLE {name}", create_sql, count=1), tx=tx)
+    for suffix, columns in _SQLITE_ARCHIVE_INDEXES[table]:
+        execute(f"CREATE INDEX idx_{name}_{suffix} ON {name} ({columns})", tx=tx)
+    _rebuild_sqlite_view(table, tx)
+    return name
+
+
+def _archivable_years(table, date_column, before):
+    if current_dialect().is_postgres:
+        year = f"EXTRACT(YEAR FROM {date_column})::int"
+    else:
+        year = f"CAST(substr({date_column}, 1, 4) AS INTEGER)"
+    rows = fetch_all(f"""
+        SELECT DISTINCT {year} FROM {table}
+        WHERE {date_column} < :before AND {_AGREEMENTS_CLOSED.format(table=table)} ORDER BY 1
+    """, {"before": before})
+    return [row[0] for row in rows if row[0] is not None]
+
+
+def _move_batch(table, target, condition, params, batch_size):
+    """Moves up to `batch_size` archivable rows in one transaction; returns how many."""
+    with transaction() as tx:
+        if current_dialect().is_postgres:
+            return execute(f"""
+                WITH moved AS (
+                    DELETE FROM {table} WHERE id IN (SELECT id FROM {table} WHERE {condition} ORDER BY id LIMIT :limit)
+                    RETURNING *
+                )
+                INSERT INTO {target} SELECT * FROM moved
+            """, {**params, "limit": batch_size}, tx=tx)
+        bounds = fetch_all(f"SELECT id FROM {table} WHERE {condition} ORDER BY id LIMIT :limit",
+                           {**params, "limit": batch_size}, tx=tx)
+        if not bounds:
+            return 0
+        # Re-checks the condition under the write lock, so a row whose debtor got an
+        # agreement meanwhile is neither copied nor deleted
+        params = {**params, "low": bounds[0][0], "high": bounds[-1][0]}
+        where = f"id BETWEEN :low AND :high AND {condition}"
+        execute(f"INSERT INTO {target} SELECT * FROM {table} WHERE {where}", params, tx=tx)
+        return execute(f"DELETE FROM {table} WHERE {where}", params, tx=tx)
+
+
+def archive_history(before=None, batch_size=ARCHIVE_BATCH_SIZE, progress=None):
+    """Moves archivable rows dated before `before` (default: January 1st of this year)
+    from the hot tables to their yearly archive, in batches of `batch_size` rows.
+
+    `progress`, if given, is called with (table, year, rows moved so far) after each batch.
+    Returns {table: rows moved}.
+    """
+    from src.debtor_bundle import touch_debtor
+
+    before = (before or date(date.today().year, 1, 1)).isoformat()
+    moved = {}
+    for table, date_column in ARCHIVED_TABLES:
+        moved[table] = 0
+        condition = (f"{date_column} >= :start AND {date_column} < :end AND "
+                     + _AGREEMENTS_CLOSED.format(table=table))
+        for year in _archivable_years(table, date_column, before):
+            with transaction() as tx:
+                target = ensure_partition(table, year, tx)
+            params = {"start": f"{year}-01-01", "end": min(f"{year + 1}-01-01", before)}
+            while True:
+                count = _move_batch(table, target, condition, params, batch_size)
+                if not count:
+                    break
+                moved[table] += count
+                if progress:
+                    progress(table, year, moved[table])
+    if any(moved.values()):
+        touch_debtor()
+    return moved
@@ -0,0 +1,211 @@
+"""Async versions of the src.database calls used by batch services.
+
+Same names, arguments, return values, errors and side effects (kpi_summary
+deltas, touch_debtor) as in src.database, over src.async_query; the SQL is
+database's own. Meant for jobs that touch many debtors at once:
+
+    from src.async_database import get_debts, create_payment
+    from src.async_query import gather_limited, run
+
+    async def settle(debtor_id):
+        debts = await get_debts(debtor_id)
+        ...
+
+    run(gather_limited(settle(i) for i in debtor_ids))
+
+Reference data is not cached here (batch jobs read it once); the pages keep
+using src.database.
+"""
+from src.async_query import execute, fetch_all, fetch_one, fetch_scalar, insert, read_df, transaction
+from src.database import (_AGREEMENT_STATUS_SQL, _DEBTOR_CLIENT_SQL, _EMPTY_KPIS, _INSERT_AGREEMENT, _INSERT_DEBT,
+                          _INSERT_DEBTOR, _INSERT_LEGAL_EXPENSE, _INSERT_PAYMENT, _bump_kpis_query, _debtor_dict,
+                          _debtors_by_ids_query, _find_debtor_query, _kpi_dict, _kpi_query, _list_debtors_query,
+                          _refresh_kpi_queries, _update_query)
+from src.debtor_bundle import touch_debtor
+from src.validators import document_digits
+
+
+async def find_debtor_by_document(cpf_cnpj, client_id=None, tx=None):
+    """Return the id of the debtor with this CPF/CNPJ (any punctuation), or None."""
+    query = _find_debtor_query(cpf_cnpj, client_id)
+    if query is None:
+        return None
+    return await fetch_scalar(*query, tx=tx)
+
+
+async def get_clients():
+    """Retrieve all clients as a DataFrame."""
+    return await read_df("SELECT * FROM clients ORDER BY name")
+
+
+async def has_debtors(client_id=None):
+    """True if there is at least one debtor (for the client, if given)."""
+    if client_id:
+        return await fetch_scalar('SELECT 1 FROM debtors WHERE client_id = :client_id LIMIT 1', {'client_id': client_id}) is not None
+    return await fetch_scalar('SELECT 1 FROM debtors LIMIT 1') is not None
+
+
+async def get_debtors_by_ids(ids):
+    """Debtors with the given ids (id, client_id, name, cpf_cnpj dicts), in the order given."""
+    ids = [int(i) for i in ids]
+    if not ids:
+        return []
+    by_id = {row[0]: _debtor_dict(row) for row in await fetch_all(*_debtors_by_ids_query(ids))}
+    return [by_id[i] for i in ids if i in by_id]
+
+
+async def list_debtors(client_id=None, search=None, after_name=None, after_id=None, limit=50):
+    """One page of debtors ordered by (name, id); see src.database.list_debtors."""
+    rows = await fetch_all(*_list_debtors_query(client_id, search, after_name, after_id, limit))
+    return [_debtor_dict(row) for row in rows]
+
+
+async def get_debts(debtor_id=None):
+    """Retrieve debts as a DataFrame, optionally filtered by debtor_id."""
+    try:
+        if debtor_id:
+            return await read_df("SELECT * FROM debts WHERE debtor_id = :debtor_id", {'debtor_id': debtor_id})
+        return await read_df("SELECT * FROM debts")
+    except Exception as e:
+        print(f"Error fetching debts: {e}")
+        import pandas as pd
+        return pd.DataFrame()
+
+
+async def get_dashboard_kpis(client_id=None):
+    """All dashboard KPI metrics in one query (kpi_summary, or live aggregates)."""
+    try:
+        return _kpi_dict(await fetch_one(*_kpi_query(client_id)))
+    except Exception as e:
+        print(f"Error fetching KPIs: {e}")
+        return dict(_EMPTY_KPIS)
+
+
+async def _bump_kpis(client_id, tx, **deltas):
+    await execute(*_bump_kpis_query(client_id, deltas), tx=tx)
+
+
+async def refresh_kpi_summary(client_id=None, tx=None):
+    """Recomputes kpi_summary from the base tables (for one client, or all)."""
+    for sql, params in _refresh_kpi_queries(client_id):
+        await execute(sql, params, tx=tx)
+
+
+async def _debtor_client_id(debtor_id, tx):
+    client_id = await fetch_scalar(_DEBTOR_CLIENT_SQL, {'id': debtor_id}, tx=tx)
+    if client_id is None:
+        raise ValueError(f"Devedor {debtor_id} não encontrado.")
+    return client_id
+
+
+async def create_debtor(client_id, name, cpf_cnpj=None, rg=None, email=None, phone=None, notes=None):
+    """Create a debtor and return its id.
+
+    Raises ValueError if the client already has a debtor with the same CPF/CNPJ.
+    """
+    async with transaction() as tx:
+        if await find_debtor_by_document(cpf_cnpj, client_id, tx=tx) is not None:
+            raise ValueError("Já existe um devedor com este CPF/CNPJ para este cliente.")
+        new_id = await insert(_INSERT_DEBTOR, {
+            'client_id': client_id, 'name': name, 'cpf_cnpj': cpf_cnpj, 'cpf_cnpj_digits': document_digits(cpf_cnpj),
+            'rg': rg, 'email': email, 'phone': phone, 'notes': notes,
+        }, tx=tx)
+        await _bump_kpis(client_id, tx, total_debtors=1)
+    return new_id
+
+
+async def update_debtor(debtor_id, name=None, cpf_cnpj=None, rg=None, email=None, phone=None, notes=None):
+    """Update the given debtor fields, keeping cpf_cnpj_digits in sync."""
+    values = {'name': name, 'rg': rg, 'email': email, 'phone': phone, 'notes': notes}
+    if cpf_cnpj is not None:
+        client_id = await fetch_scalar(_DEBTOR_CLIENT_SQL, {'id': debtor_id})
+        existing = await find_debtor_by_document(cpf_cnpj, client_id)
+        if existing is not None and existing != debtor_id:
+            raise ValueError("Já existe um devedor com este CPF/CNPJ para este cliente.")
+        values['cpf_cnpj'] = cpf_cnpj
+        values['cpf_cnpj_digits'] = document_digits(cpf_cnpj)
+    query = _update_query('debtors', debtor_id, values)
+    if query is not None:
+        await execute(*query)
+    touch_debtor(debtor_id)
+    return query is not None
+
+
+async def delete_debtor(debtor_id):
+    """Delete a debtor (related rows follow the FK cascades). Returns True if deleted."""
+    async with transaction() as tx:
+        client_id = await fetch_scalar(_DEBTOR_CLIENT_SQL, {'id': debtor_id}, tx=tx)
+        if client_id is None:
+            return False
+        await execute('DELETE FROM debtors WHERE id = :id', {'id': debtor_id}, tx=tx)
+        await refresh_kpi_summary(client_id, tx=tx)
+    touch_debtor(debtor_id)
+    return True
+
+
+async def create_debt(debtor_id, contract_type, original_value, due_date, description=None, fine_type=None):
+    """Create a debt for a debtor and return its id."""
+    async with transaction() as tx:
+        client_id = await _debtor_client_id(debtor_id, tx)
+        new_id = await insert(_INSERT_DEBT, {
+            'debtor_id': debtor_id, 'client_id': client_id, 'contract_type': contract_type, 'description': description,
+            'original_value': original_value, 'due_date': due_date, 'fine_type': fine_type,
+        }, tx=tx)
+        await _bump_kpis(client_id, tx, total_debts=1, total_original_value=original_value)
+    touch_debtor(debtor_id)
+    return new_id
+
+
+async def create_agreement(debtor_id, agreement_date, agreed_value, total_installments=1, installment_value=None, interest_rate=0, first_installment_date=None, debt_id=None, notes=None, status='active'):
+    """Create an agreement for a debtor and return its id."""
+    async with transaction() as tx:
+        client_id = await _debtor_client_id(debtor_id, tx)
+        new_id = await insert(_INSERT_AGREEMENT, {
+            'debtor_id': debtor_id, 'client_id': client_id, 'debt_id': debt_id, 'status': status,
+            'agreement_date': agreement_date, 'agreed_value': agreed_value, 'total_installments': total_installments,
+            'installment_value': installment_value, 'interest_rate': interest_rate,
+            'first_installment_date': first_installment_date, 'notes': notes,
+        }, tx=tx)
+        if status == 'active':
+            await _bump_kpis(client_id, tx, active_agreements=1)
+    touch_debtor(debtor_id)
+    return new_id
+
+
+async def update_agreement_status(agreement_id, status):
+    """Change an agreement's status, keeping the active-agreement count current."""
+    async with transaction() as tx:
+        row = await fetch_one(_AGREEMENT_STATUS_SQL, {'id': agreement_id}, tx=tx)
+        if not row:
+            return False
+        client_id, old_status, debtor_id = row
+        await execute('UPDATE agreements SET status = :status WHERE id = :id', {'status': status, 'id': agreement_id}, tx=tx)
+        delta = (status == 'active') - (old_status == 'active')
+        if delta:
+            await _bump_kpis(client_id, tx, active_agreements=delta)
+    touch_debtor(debtor_id)
+    return True
+
+
+async def create_payment(debtor_id, payment_date, amount, payment_method=None, agreement_id=None, debt_id=None, installment_number=None, notes=None):
+    """Register a payment for a debtor and return its id."""
+    async with transaction() as tx:
+        client_id = await _debtor_client_id(debtor_id, tx)
+        new_id = await insert(_INSERT_PAYMENT, {
+            'agreement_id': agreement_id, 'debt_id': debt_id, 'debtor_id': debtor_id, 'client_id': client_id,
+            'payment_date': payment_date, 'amount': amount, 'installment_number': installment_number,
+            'payment_method': payment_method, 'notes': notes,
+        }, tx=tx)
+        await _bump_kpis(client_id, tx, total_recovered=amount, total_payments=1)
+    touch_debtor(debtor_id)
+    return new_id
+
+
+async def create_legal_expense(debtor_id, description, value, date):
+    """Record a legal expense (court fee) paid for a debtor and return its id."""
+    async with transaction() as tx:
+        client_id = await _debtor_client_id(debtor_id, tx)
+        new_id = await insert(_INSERT_LEGAL_EXPENSE, {'debtor_id': debtor_id, 'client_id': client_id,
+                                                      'description': description, 'value': value, 'date': date}, tx=tx)
+    touch_debtor(debtor_id)
+    return new_id
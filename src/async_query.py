@@ -0,0 +1,386 @@
+"""Async counterpart of src.query for batch services (revaluation, imports,
+exports, campaigns) that spend their time waiting on the database.
+
+Same SQL (named `:params`), same calls, awaited:
+
+    async def revalue(debtor_id):
+        async with transaction() as tx:
+            debts = await fetch_all("SELECT * FROM debts WHERE debtor_id = :id", {"id": debtor_id}, tx=tx)
+            ...
+
+    run(gather_limited(revalue(i) for i in debtor_ids))
+
+Postgres goes through an asyncpg pool of ASYNC_POOL_SIZE connections; SQLite
+through ASYNC_POOL_SIZE aiosqlite connections (each runs its statements on its
+own thread, so reads overlap under WAL; writes wait for one asyncio lock, like
+query's writer lock). The backend is picked like src.connection.get_connection:
+Postgres when configured and its circuit breaker allows, SQLite otherwise.
+
+Pools belong to the event loop that created them: start services with run(),
+or await close_pools() before the loop ends. Needs the optional asyncpg and
+aiosqlite packages.
+"""
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from functools import lru_cache
+
+from src.config import (ASYNC_POOL_SIZE, SQLITE_BUSY_TIMEOUT_MS, SQLITE_DB_PATH, SUPABASE_CONNECT_TIMEOUT, SUPABASE_DB, SUPABASE_HOST,
+                        SUPABASE_PASSWORD, SUPABASE_PORT, SUPABASE_USER, USE_SUPABASE)
+from src.connection import POSTGRES, SQLITE, SQLITE_PRAGMAS, supabase_breaker
+from src.cache import tables_written
+from src.query import _TOKEN, _WRITE_STATEMENT, _adapt, _note_writes, _record_timing
+
+
+@lru_cache(maxsize=1024)
+def translate_asyncpg(sql):
+    """`sql` with :name placeholders as $1, $2... and the parameter names in order (cached)."""
+    names = []
+
+    def replace(match):
+        if match.group(1) is None:
+            return match.group(0)
+        if match.group(1) not in names:
+            names.append(match.group(1))
+        return f"${names.index(match.group(1)) + 1}"
+
+    return _TOKEN.sub(replace, sql), tuple(names)
+
+
+def _pg_args(sql, params):
+    text, names = translate_asyncpg(sql)
+    params = _adapt(params)
+    return text, [params[name] for name in names]
+
+
+def _iso(value):
+    return value if isinstance(value, str) else value.isoformat()
+
+
+async def _init_postgres(conn):
+    # Dates travel as text, so the ISO strings the rest of the code passes work as
+    # with psycopg2 (asyncpg's binary codecs only take date/datetime objects)
+    await conn.set_type_codec("date", schema="pg_catalog", encoder=_iso, decoder=date.fromisoformat, format="text")
+    for name in ("timestamp", "timestamptz"):
+        await conn.set_type_codec(name, schema="pg_catalog", encoder=_iso, decoder=datetime.fromisoformat, format="text")
+
+
+def _import_driver(name):
+    try:
+        return __import__(name)
+    except ImportError:
+        raise ImportError(f"A camada assíncrona requer o pacote {name} (pip install {name}).")
+
+
+class AsyncSession:
+    """One pooled async connection, checked out for a transaction."""
+
+    __slots__ = ("conn", "pool", "dialect", "_pg_transaction", "writing", "changes")
+
+    def __init__(self, conn, pool):
+        self.conn = conn
+        self.pool = pool
+        self.dialect = pool.dialect
+        self._pg_transaction = None
+        self.writing = False
+        self.changes = None
+
+
+class AsyncPool:
+    """Connections of one backend for one event loop."""
+
+    def __init__(self, dialect, size=ASYNC_POOL_SIZE):
+        self.dialect = dialect
+        self.size = size
+        self._pg_pool = None
+        self._idle = asyncio.Queue()
+        self._opened = 0
+        self._open_lock = asyncio.Lock()
+        self.writer = asyncio.Lock()
+
+    async def open(self):
+        if self.dialect.is_postgres:
+            asyncpg = _import_driver("asyncpg")
+            self._pg_pool = await asyncpg.create_pool(
+                host=SUPABASE_HOST, port=SUPABASE_PORT, database=SUPABASE_DB, user=SUPABASE_USER,
+                password=SUPABASE_PASSWORD, timeout=SUPABASE_CONNECT_TIMEOUT, min_size=1, max_size=self.size,
+                init=_init_postgres,
+            )
+        return self
+
+    async def acquire(self):
+        if self.dialect.is_postgres:
+            return AsyncSession(await self._pg_pool.acquire(), self)
+        if self._idle.empty() and self._opened < self.size:
+            async with self._open_lock:
+                if self._opened < self.size:
+                    self._opened += 1
+                    conn = None
+                    try:
+                        aiosqlite = _import_driver("aiosqlite")
+                        os.makedirs(os.path.dirname(SQLITE_DB_PATH), exist_ok=True)
+                        conn = await aiosqlite.connect(SQLITE_DB_PATH, cached_statements=256,
+                                                       timeout=SQLITE_BUSY_TIMEOUT_MS / 1000)
+                        for pragma in SQLITE_PRAGMAS:
+                            await conn.execute(pragma)
+                    except BaseException:
+                        # Give the slot back, or once `size` opens failed acquire() would wait forever
+                        self._opened -= 1
+                        if conn is not None:
+                            await conn.close()
+                        raise
+                    return AsyncSession(conn, self)
+        return await self._idle.get()
+
+    async def release(self, session):
+        if self.dialect.is_postgres:
+            await self._pg_pool.release(session.conn)
+        else:
+            self._idle.put_nowait(session)
+
+    async def close(self):
+        if self._pg_pool is not None:
+            await self._pg_pool.close()
+        while not self._idle.empty():
+            await self._idle.get_nowait().conn.close()
+
+
+# (event loop, dialect name) -> AsyncPool
+_pools = {}
+
+
+async def get_pool():
+    """This loop's pool for the backend get_connection() would use now."""
+    loop = asyncio.get_running_loop()
+    if USE_SUPABASE and supabase_breaker.allow_request():
+        pool = _pools.get((loop, POSTGRES.name))
+        if pool is not None:
+            return pool
+        try:
+            pool = await AsyncPool(POSTGRES).open()
+        except ImportError:
+            raise
+        except Exception as e:
+            supabase_breaker.record_failure(e)
+        else:
+            supabase_breaker.record_success()
+            return _pools.setdefault((loop, POSTGRES.name), pool)
+    pool = _pools.get((loop, SQLITE.name))
+    if pool is None:
+        pool = _pools[(loop, SQLITE.name)] = AsyncPool(SQLITE)
+    return pool
+
+
+async def close_pools():
+    """Closes the current loop's pools."""
+    loop = asyncio.get_running_loop()
+    for key in [key for key in _pools if key[0] is loop]:
+        await _pools.pop(key).close()
+
+
+def run(coro):
+    """asyncio.run(coro), closing the pools it opened before the loop ends."""
+    async def main():
+        try:
+            return await coro
+        finally:
+            await close_pools()
+    return asyncio.run(main())
+
+
+async def gather_limited(coros, limit=None):
+    """Awaits `coros` with at most `limit` running at once (default: twice the pool
+    size, so each connection always has the next query queued). Results in order."""
+    semaphore = asyncio.Semaphore(limit or ASYNC_POOL_SIZE * 2)
+
+    async def limited(coro):
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*(limited(coro) for coro in coros))
+
+
+@asynccontextmanager
+async def transaction():
+    """Yields a pooled session; commits on success, rolls back on error.
+
+    After a commit, the tables written get a new data version, as in src.query.
+    """
+    pool = await get_pool()
+    session = await pool.acquire()
+    try:
+        if session.dialect.is_postgres:
+            session._pg_transaction = session.conn.transaction()
+            await session._pg_transaction.start()
+        yield session
+        if session.dialect.is_postgres:
+            await session._pg_transaction.commit()
+        else:
+            await session.conn.commit()
+        if session.changes:
+            tables_written(session.changes)
+    except BaseException:
+        if session.dialect.is_postgres:
+            await session._pg_transaction.rollback()
+        else:
+            await session.conn.rollback()
+        raise
+    finally:
+        session._pg_transaction = None
+        session.changes = None
+        if session.writing:
+            session.writing = False
+            pool.writer.release()
+        await pool.release(session)
+
+
+@asynccontextmanager
+async def _session(tx):
+    if tx is not None:
+        yield tx
+    else:
+        async with transaction() as session:
+            yield session
+
+
+async def _begin_write(session, sql):
+    _note_writes(session, sql)
+    if session.dialect.is_sqlite and not session.writing and _WRITE_STATEMENT.match(sql):
+        await session.pool.writer.acquire()
+        session.writing = True
+
+
+async def _run(session, sql, params, method):
+    """Runs `sql` and returns what `method` asks for: rows, row, value, lastrowid or the rowcount."""
+    await _begin_write(session, sql)
+    started = time.perf_counter()
+    if session.dialect.is_postgres:
+        text, args = _pg_args(sql, params)
+        if method == "rows":
+            result = [tuple(r) for r in await session.conn.fetch(text, *args)]
+        elif method == "row":
+            row = await session.conn.fetchrow(text, *args)
+            result = tuple(row) if row is not None else None
+        elif method == "value":
+            result = await session.conn.fetchval(text, *args)
+        else:
+            status = await session.conn.execute(text, *args)
+            result = int(status.split()[-1]) if status.split()[-1].isdigit() else -1
+    else:
+        cursor = await session.conn.execute(sql, _adapt(params))
+        if method == "rows":
+            result = await cursor.fetchall()
+        elif method in ("row", "value"):
+            row = await cursor.fetchone()
+            result = row if method == "row" or row is None else row[0]
+        elif method == "lastrowid":
+            result = cursor.lastrowid
+        else:
+            result = cursor.rowcount
+        await cursor.close()
+    _record_timing(sql, (time.perf_counter() - started) * 1000)
+    return result
+
+
+async def execute(sql, params=None, tx=None):
+    """Runs a statement and returns the affected row count."""
+    async with _session(tx) as session:
+        return await _run(session, sql, params, "status")
+
+
+async def executemany(sql, seq_of_params, tx=None):
+    """Runs a statement once per parameter dict."""
+    seq_of_params = list(seq_of_params)
+    async with _session(tx) as session:
+        await _begin_write(session, sql)
+        started = time.perf_counter()
+        if session.dialect.is_postgres:
+            text, names = translate_asyncpg(sql)
+            await session.conn.executemany(text, [[_adapt(p)[n] for n in names] for p in seq_of_params])
+        else:
+            await session.conn.executemany(sql, [_adapt(p) for p in seq_of_params])
+        _record_timing(sql, (time.perf_counter() - started) * 1000)
+    return len(seq_of_params)
+
+
+async def bulk_insert(table, columns, rows, tx=None):
+    """Inserts many rows (sequences in `columns` order): COPY on Postgres, executemany on SQLite."""
+    rows = [tuple(row) for row in rows]
+    if not rows:
+        return 0
+    async with _session(tx) as session:
+        started = time.perf_counter()
+        if session.dialect.is_postgres:
+            _note_writes(session, f"INSERT INTO {table}")
+            await session.conn.copy_records_to_table(table, records=rows, columns=list(columns))
+        else:
+            sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+            await _begin_write(session, sql)
+            await session.conn.executemany(sql, rows)
+        _record_timing(f"bulk_insert {table}", (time.perf_counter() - started) * 1000)
+    return len(rows)
+
+
+async def insert(sql, params=None, tx=None):
+    """Runs an INSERT and returns the new row id."""
+    async with _session(tx) as session:
+        if session.dialect.is_postgres:
+            return await _run(session, sql + " RETURNING id", params, "value")
+        return await _run(session, sql, params, "lastrowid")
+
+
+async def fetch_all(sql, params=None, tx=None):
+    async with _session(tx) as session:
+        return await _run(session, sql, params, "rows")
+
+
+async def fetch_one(sql, params=None, tx=None):
+    async with _session(tx) as session:
+        return await _run(session, sql, params, "row")
+
+
+async def fetch_scalar(sql, params=None, tx=None):
+    """Returns the first column of the first row, or None."""
+    async with _session(tx) as session:
+        return await _run(session, sql, params, "value")
+
+
+async def stream(sql, params=None, batch_size=10_000):
+    """Async generator of (column names, list of row tuples) batches (server-side cursor on Postgres)."""
+    async with transaction() as session:
+        if session.dialect.is_postgres:
+            text, args = _pg_args(sql, params)
+            statement = await session.conn.prepare(text)
+            columns = [attribute.name for attribute in statement.get_attributes()]
+            cursor = await statement.cursor(*args)
+            while True:
+                rows = await cursor.fetch(batch_size)
+                if not rows:
+                    break
+                yield columns, [tuple(r) for r in rows]
+        else:
+            async with session.conn.execute(sql, _adapt(params)) as cursor:
+                columns = [c[0] for c in cursor.description]
+                while True:
+                    rows = await cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield columns, rows
+
+
+async def read_df(sql, params=None, tx=None):
+    """Runs a query and returns the result as a pandas DataFrame."""
+    import pandas as pd
+    async with _session(tx) as session:
+        if session.dialect.is_postgres:
+            text, args = _pg_args(sql, params)
+            statement = await session.conn.prepare(text)
+            columns = [attribute.name for attribute in statement.get_attributes()]
+            rows = [tuple(r) for r in await statement.fetch(*args)]
+        else:
+            async with session.conn.execute(sql, _adapt(params)) as cursor:
+                columns = [c[0] for c in cursor.description]
+                rows = await cursor.fetchall()
+    return pd.DataFrame.from_records(rows, columns=columns)
@@ -1,15 +1,9 @@
 import bcrypt
-import sqlite3
-from src.database import get_connection
+from src.query import fetch_one
 
 def check_credentials(username, password):
     """Verifies username and password."""
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT password_hash FROM users WHERE username = ?', (username,))
-    result = cursor.fetchone()
-    conn.close()
+    result = fetch_one('SELECT password_hash FROM users WHERE username = :username', {'username': username})
     
     if result:
         stored_hash = result[0].encode('utf-8')
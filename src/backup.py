@@ -0,0 +1,367 @@
+"""Online backups of the SQLite database with point-in-time restore.
+
+Two kinds of files are kept under BACKUP_DIR:
+
+  * snapshots: copies of the database made with the SQLite online backup API,
+    BACKUP_PAGES_PER_STEP pages at a time inside one read transaction (so the
+    copy is a consistent snapshot and, under WAL, writers are never blocked).
+    The copy is cut into CHUNK_SIZE chunks stored zlib-compressed under their
+    SHA-256 (chunks/ab/abcd...); a snapshot is a JSON manifest listing its
+    chunks, so unchanged parts of the file are stored once across snapshots.
+  * journal segments: the "backup_journal" change_log consumer. Each
+    capture_journal() run reads, in one read transaction, every row changed since
+    the previous run and writes their current values (None for deleted rows).
+    Applying segment (a, b] to a database at change seq a brings it to seq b.
+
+restore(target, at) rebuilds the newest snapshot taken at or before `at` into
+`target` and applies the journal segments captured up to `at`; without `at`,
+the latest state captured. Rows archive_history() moved out of payments and
+contact_history are journaled as deletes of the hot table; the segment keeps
+their archived image, and the restore puts them back in their year's archive
+table (or in the hot table, if the snapshot predates that year's archive).
+Other tables outside CHANGE_LOG_TABLES (users, kanban_cards, judicial_petitions)
+come back as of the snapshot.
+A restored database starts a new timeline: take a snapshot once it is in place.
+
+    create_snapshot()        # cron: daily
+    capture_journal()        # cron: every minute (must run within CHANGE_LOG_MAX_AGE_HOURS)
+    restore("data/restored.db", at=datetime(2026, 10, 18, 15, 30, tzinfo=timezone.utc))
+
+Postgres/Supabase deployments use the provider's backups and PITR instead.
+"""
+import glob
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import zlib
+from datetime import datetime, timezone
+
+from src.config import SQLITE_DB_PATH
+from src.connection import _connect_sqlite
+from src.migrations import ARCHIVED_TABLES, KPI_SUMMARY_REFRESH_SQL, run_migrations
+
+BACKUP_DIR = os.path.join("data", "backups")
+CHUNK_SIZE = 256 * 1024
+# Pages copied per backup step (4 MB with 4 KB pages), and the pause between steps
+BACKUP_PAGES_PER_STEP = 1024
+BACKUP_STEP_SLEEP = 0.005
+BACKUP_KEEP_SNAPSHOTS = 14
+COMPRESS_LEVEL = 1
+
+JOURNAL_CONSUMER = "backup_journal"
+_ARCHIVE_DATE_COLUMNS = dict(ARCHIVED_TABLES)
+_TIMESTAMP = "%Y%m%dT%H%M%S%fZ"
+
+
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+
+def _path(*parts):
+    return os.path.join(BACKUP_DIR, *parts)
+
+
+def _chunk_path(digest):
+    return _path("chunks", digest[:2], digest)
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = f"{path}.partial"
+    with open(partial, "wb") as f:
+        f.write(data)
+    os.replace(partial, path)
+
+
+def _read_snapshot_seq(cursor):
+    # Same as changes.latest_seq, on the backup's own connection and snapshot
+    cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log")
+    newest = cursor.fetchone()[0]
+    cursor.execute("SELECT seq FROM change_cursors WHERE consumer = '_compacted'")
+    horizon = cursor.fetchone()
+    return max(newest, horizon[0] if horizon else 0)
+
+
+def create_snapshot(pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_SLEEP, progress=None):
+    """Backs up the live database and stores it as a deduplicated snapshot.
+
+    `progress`, if given, is called with (pages remaining, total pages) after each step.
+    Returns the manifest plus stats: seconds, new_chunks and new_bytes (compressed bytes written).
+    """
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    started = time.perf_counter()
+    copy_path = _path(f"snapshot-{os.getpid()}.db")
+    source = _connect_sqlite(SQLITE_DB_PATH)
+    source.isolation_level = None
+    try:
+        # Holding a read transaction pins the snapshot: the stepwise copy never
+        # restarts on concurrent commits, and the WAL keeps writers unblocked
+        source.execute("BEGIN")
+        created_at = _utcnow()
+        seq = _read_snapshot_seq(source.cursor())
+        target = sqlite3.connect(copy_path)
+        try:
+            source.backup(target, pages=pages, sleep=sleep,
+                          progress=(lambda status, remaining, total: progress(remaining, total)) if progress else None)
+            page_size = target.execute("PRAGMA page_size").fetchone()[0]
+        finally:
+            target.close()
+        source.execute("COMMIT")
+    finally:
+        source.close()
+
+    chunks, new_chunks, new_bytes, size = [], 0, 0, 0
+    try:
+        with open(copy_path, "rb") as f:
+            while True:
+                data = f.read(CHUNK_SIZE)
+                if not data:
+                    break
+                size += len(data)
+                digest = hashlib.sha256(data).hexdigest()
+                chunks.append(digest)
+                if not os.path.exists(_chunk_path(digest)):
+                    compressed = zlib.compress(data, COMPRESS_LEVEL)
+                    _write_atomic(_chunk_path(digest), compressed)
+                    new_chunks += 1
+                    new_bytes += len(compressed)
+    finally:
+        for path in glob.glob(copy_path + "*"):
+            os.remove(path)
+
+    manifest = {
+        "name": created_at.strftime(_TIMESTAMP),
+        "created_at": created_at.isoformat(),
+        "seq": seq,
+        "size": size,
+        "page_size": page_size,
+        "chunk_size": CHUNK_SIZE,
+        "chunks": chunks,
+    }
+    _write_atomic(_path("snapshots", manifest["name"] + ".json"), json.dumps(manifest).encode())
+    return {**manifest, "seconds": time.perf_counter() - started, "new_chunks": new_chunks, "new_bytes": new_bytes}
+
+
+def list_snapshots():
+    """Snapshot manifests, oldest first."""
+    manifests = []
+    for path in sorted(glob.glob(_path("snapshots", "*.json"))):
+        with open(path, encoding="utf-8") as f:
+            manifests.append(json.load(f))
+    return manifests
+
+
+def _row_images(cursor, table, ids):
+    # {id: row values}; always runs one query, so cursor.description has the columns
+    images = {}
+    for start in range(0, max(len(ids), 1), 500):
+        batch = ids[start:start + 500]
+        cursor.execute(f"SELECT * FROM {table} WHERE id IN ({', '.join('?' * len(batch))})", batch)
+        images.update((values[0], list(values)) for values in cursor.fetchall())
+    return images
+
+
+def capture_journal():
+    """Writes a journal segment with the rows changed since the last capture.
+
+    Returns the segment header (from_seq, to_seq, captured_at, rows), or None when
+    nothing changed. The first run only starts the journal at the current seq;
+    after a gap (entries compacted before being captured) the journal restarts and
+    points in time before the next snapshot can't be restored past the gap.
+    """
+    conn = _connect_sqlite(SQLITE_DB_PATH)
+    conn.isolation_level = None
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN")
+        captured_at = _utcnow()
+        to_seq = _read_snapshot_seq(cursor)
+        cursor.execute("SELECT seq FROM change_cursors WHERE consumer = ?", (JOURNAL_CONSUMER,))
+        row = cursor.fetchone()
+        from_seq = row[0] if row else None
+        cursor.execute("SELECT seq FROM change_cursors WHERE consumer = '_compacted'")
+        horizon = cursor.fetchone()
+        if from_seq is not None and horizon and from_seq < horizon[0]:
+            print(f"Backup journal: changes after seq {from_seq} were compacted before capture; restarting at {to_seq}")
+            from_seq = None
+        header, rows = None, []
+        if from_seq is not None and to_seq > from_seq:
+            cursor.execute("""
+                SELECT DISTINCT table_name, row_id FROM change_log WHERE seq > ? AND seq <= ?
+            """, (from_seq, to_seq))
+            changed = {}
+            for table, row_id in cursor.fetchall():
+                changed.setdefault(table, []).append(row_id)
+            columns = {}
+            for table, ids in sorted(changed.items()):
+                images = _row_images(cursor, table, ids)
+                columns[table] = [c[0] for c in cursor.description]
+                archived = {}
+                missing = [row_id for row_id in ids if row_id not in images]
+                if table in _ARCHIVE_DATE_COLUMNS and missing:
+                    # Deleted from the hot table but still in {table}_all: moved by archive_history()
+                    archived = _row_images(cursor, f"{table}_all", missing)
+                rows.extend([table, row_id, archived[row_id], True] if row_id in archived
+                            else [table, row_id, images.get(row_id)] for row_id in ids)
+            header = {"from_seq": from_seq, "to_seq": to_seq, "captured_at": captured_at.isoformat(),
+                      "columns": columns, "rows": len(rows)}
+        cursor.execute("COMMIT")
+    finally:
+        conn.close()
+
+    if header:
+        lines = [json.dumps(header)] + [json.dumps(row) for row in rows]
+        _write_atomic(_path("journal", f"{from_seq:012d}-{to_seq:012d}.jsonl.gz"),
+                      gzip.compress("\n".join(lines).encode(), COMPRESS_LEVEL))
+    if from_seq is None or header:
+        from src.changes import set_cursor
+        set_cursor(JOURNAL_CONSUMER, to_seq)
+    return header and {k: v for k, v in header.items() if k != "columns"}
+
+
+def _read_segment(path):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        return header, [json.loads(line) for line in f]
+
+
+def _segment_headers():
+    headers = []
+    for path in sorted(glob.glob(_path("journal", "*.jsonl.gz"))):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            headers.append((json.loads(f.readline()), path))
+    return headers
+
+
+def _apply_segment(conn, path):
+    header, rows = _read_segment(path)
+    columns = header["columns"]
+    statements = {}
+    for table, columns_list in columns.items():
+        names = ", ".join(columns_list)
+        updates = ", ".join(f"{c} = excluded.{c}" for c in columns_list if c != "id")
+        statements[table] = (f"INSERT INTO {table} ({names}) VALUES ({', '.join('?' * len(columns_list))}) "
+                             f"ON CONFLICT (id) DO UPDATE SET {updates}")
+    tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    applied = 0
+    for table, row_id, values, *archived in rows:
+        if values is None:
+            conn.execute(f"DELETE FROM {table} WHERE id = ?", (row_id,))
+        elif archived:
+            # Moved out by archive_history(): into its year's archive table when the restored
+            # database has it (the row may already be there), else back into the hot table
+            year = str(values[columns[table].index(_ARCHIVE_DATE_COLUMNS[table])])[:4]
+            target = f"{table}_archive_y{year}"
+            conn.execute(f"DELETE FROM {table} WHERE id = ?", (row_id,))
+            conn.execute(f"INSERT OR IGNORE INTO {target if target in tables else table} "
+                         f"({', '.join(columns[table])}) VALUES ({', '.join('?' * len(values))})", values)
+        else:
+            conn.execute(statements[table], values)
+        applied += 1
+    return applied
+
+
+def restore(target, at=None, progress=None):
+    """Rebuilds the database as of `at` (aware datetime; latest captured state if None)
+    into the new file `target`. Never touches the live database.
+
+    `progress`, if given, is called with a short message per phase.
+    Returns snapshot, segments, rows_applied, restored_to (ISO timestamp), size and seconds.
+    """
+    if os.path.exists(target):
+        raise ValueError(f"Arquivo de destino já existe: {target}")
+    if os.path.abspath(target) == os.path.abspath(SQLITE_DB_PATH):
+        raise ValueError("Restaure para outro arquivo e troque com o app parado.")
+    at_iso = at.astimezone(timezone.utc).isoformat() if at else None
+    snapshots = [m for m in list_snapshots() if at_iso is None or m["created_at"] <= at_iso]
+    if not snapshots:
+        raise ValueError("Nenhum snapshot anterior ao ponto pedido.")
+    snapshot = snapshots[-1]
+    started = time.perf_counter()
+
+    os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+    partial = f"{target}.partial"
+    with open(partial, "wb") as out:
+        for i, digest in enumerate(snapshot["chunks"]):
+            with open(_chunk_path(digest), "rb") as f:
+                data = zlib.decompress(f.read())
+            if hashlib.sha256(data).hexdigest() != digest:
+                os.remove(partial)
+                raise ValueError(f"Chunk corrompido no backup: {digest}")
+            out.write(data)
+            if progress and i % 256 == 0:
+                progress(f"snapshot {snapshot['name']}: {i * CHUNK_SIZE / 1024 / 1024:,.0f} MB")
+    os.replace(partial, target)
+
+    # Contiguous segments from the snapshot's seq up to `at`
+    headers = _segment_headers()
+    chain, seq = [], snapshot["seq"]
+    for header, path in headers:
+        if header["to_seq"] <= seq or (at_iso and header["captured_at"] > at_iso):
+            continue
+        if header["from_seq"] > seq:
+            print(f"Backup journal has a gap after seq {seq}; restoring up to there")
+            break
+        chain.append((header, path))
+        seq = header["to_seq"]
+
+    conn = sqlite3.connect(target, isolation_level=None)
+    try:
+        # Bring an older snapshot's schema up to date before applying newer row images
+        run_migrations(conn)
+        conn.execute("PRAGMA foreign_keys=OFF")
+        conn.execute("BEGIN")
+        # The restored database starts a new timeline: its change seqs continue past
+        # every seq in the journal, so its segments never chain onto old ones
+        top = max([snapshot["seq"]] + [header["to_seq"] for header, _ in headers])
+        if not conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'change_log'", (top,)).rowcount:
+            conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('change_log', ?)", (top,))
+        top = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()[0]
+        rows_applied = 0
+        for header, path in chain:
+            rows_applied += _apply_segment(conn, path)
+            if progress:
+                progress(f"journal {header['from_seq']}-{header['to_seq']}: {rows_applied:,} linhas")
+        # Replaying logged its own changes; they are in the journal already
+        conn.execute("DELETE FROM change_log WHERE seq > ?", (top,))
+        conn.execute("DELETE FROM change_cursors WHERE consumer = ?", (JOURNAL_CONSUMER,))
+        conn.execute("DELETE FROM kpi_summary")
+        conn.execute(KPI_SUMMARY_REFRESH_SQL)
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+    return {
+        "snapshot": snapshot["name"],
+        "segments": len(chain),
+        "rows_applied": rows_applied,
+        "restored_to": chain[-1][0]["captured_at"] if chain else snapshot["created_at"],
+        "size": os.path.getsize(target),
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def prune(keep=BACKUP_KEEP_SNAPSHOTS):
+    """Keeps the newest `keep` snapshots, the journal after the oldest of them and
+    the chunks they use. Returns the number of files removed."""
+    manifests = list_snapshots()
+    removed = 0
+    for manifest in manifests[:-keep] if keep else manifests:
+        os.remove(_path("snapshots", manifest["name"] + ".json"))
+        removed += 1
+    kept = manifests[-keep:] if keep else []
+    oldest_seq = kept[0]["seq"] if kept else None
+    for header, path in _segment_headers():
+        if oldest_seq is None or header["to_seq"] <= oldest_seq:
+            os.remove(path)
+            removed += 1
+    used = {digest for manifest in kept for digest in manifest["chunks"]}
+    for path in glob.glob(_path("chunks", "*", "*")):
+        if os.path.basename(path) not in used:
+            os.remove(path)
+            removed += 1
+    return removed
+
@@ -0,0 +1,828 @@
+"""Micro-benchmarks for the data layer.
+
+Each bench_* function runs against a throwaway SQLite database, prints a short
+report and returns its measurements as a dict. Run them with scripts/bench.py.
+"""
+import csv
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from src.cache import cache_stats, invalidate, reset_cache_stats
+from src.connection import SQLITE, _connect_sqlite
+from src.migrations import MIGRATIONS, run_migrations
+
+
+def _timed(func, repeat):
+    """Calls func `repeat` times and returns the mean duration in milliseconds."""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) * 1000 / repeat
+
+
+def bench_schema_init(reruns=50):
+    """Per-rerun schema cost: DDL-on-every-run vs versioned migrations."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        run_migrations(sqlite3.connect(path))
+
+        def legacy_rerun():
+            # What init_db did before: fresh connection, every CREATE/PRAGMA/ALTER probe
+            conn = sqlite3.connect(path)
+            cursor = conn.cursor()
+            for _, _, migrate in MIGRATIONS:
+                migrate(cursor, SQLITE)
+            conn.commit()
+            conn.close()
+
+        def process_start():
+            # Once per process: connect and a single version check
+            conn = sqlite3.connect(path)
+            run_migrations(conn)
+            conn.close()
+
+        initialized = {SQLITE.name}
+
+        def cached_rerun():
+            # Every later rerun: init_db's in-process set lookup
+            return SQLITE.name in initialized
+
+        results = {
+            "legacy_rerun_ms": _timed(legacy_rerun, reruns),
+            "process_start_ms": _timed(process_start, reruns),
+            "rerun_ms": _timed(cached_rerun, reruns),
+        }
+    print(f"Schema init per rerun - before: {results['legacy_rerun_ms']:.3f} ms | "
+          f"version check at process start: {results['process_start_ms']:.3f} ms | "
+          f"after: {results['rerun_ms']:.5f} ms")
+    return results
+
+
+def _make_cpf(n):
+    """Deterministic valid CPF (with check digits) for the n-th synthetic debtor."""
+    base = [int(d) for d in f"{n + 100000000:09d}"[-9:]]
+    for length in (9, 10):
+        total = sum(d * w for d, w in zip(base, range(length + 1, 1, -1)))
+        check = 11 - total % 11
+        base.append(0 if check > 9 else check)
+    digits = ''.join(map(str, base))
+    return f"{digits[:3]}.{digits[3:6]}.{digits[6:9]}-{digits[9:]}"
+
+
+@contextmanager
+def _scratch_database():
+    """Points the query layer at a fresh SQLite file (data/debtors.db under a temp dir)."""
+    from src.query import pool
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        pool.clear()
+        invalidate()
+        try:
+            conn = _connect_sqlite()
+            run_migrations(conn)
+            conn.close()
+            yield tmp
+        finally:
+            pool.clear()
+            invalidate()
+            os.chdir(cwd)
+
+
+def bench_import(rows=100_000, installments=4):
+    """Bulk CSV import of `rows` lines (rows / installments debtors, one debt per line)."""
+    from src.importer import import_debtors
+    from src.query import insert
+
+    with _scratch_database() as tmp:
+        path = os.path.join(tmp, "import.csv")
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f, delimiter=";")
+            writer.writerow(["nome", "cpf_cnpj", "telefone", "email", "tipo_contrato", "valor", "vencimento"])
+            for i in range(rows):
+                n = i // installments
+                writer.writerow([f"Devedor {n}", _make_cpf(n), f"(11) 9{n % 10000:04d}-{i % 10000:04d}",
+                                 f"devedor{n}@example.com", "CESU", f"{100 + i % 900},50",
+                                 f"{1 + i % 28:02d}/{1 + i % 12:02d}/2024"])
+        client_id = insert("INSERT INTO clients (name) VALUES (:name)", {"name": "Bench"})
+        result = import_debtors(path, client_id)
+
+    print(f"Import of {result['rows']:,} rows: {result['seconds']:.2f} s "
+          f"({result['rows_per_sec']:,.0f} rows/s) - {result['debtors_created']:,} debtors, "
+          f"{result['debts_created']:,} debts, {len(result['rejects'])} rejected")
+    return {k: v for k, v in result.items() if k != "rejects"}
+
+
+_FIRST_NAMES = ["José", "Maria", "João", "Ana", "Antônio", "Francisca", "Carlos", "Luíza", "Paulo", "Márcia",
+                "Lucas", "Fernanda", "Pedro", "Juliana", "Rafael", "Patrícia", "Gustavo", "Aline", "Thiago", "Cláudia"]
+_LAST_NAMES = ["Silva", "Santos", "Oliveira", "Souza", "Rodrigues", "Ferreira", "Alves", "Pereira", "Lima", "Gomes",
+               "Costa", "Ribeiro", "Martins", "Carvalho", "Araújo", "Melo", "Barbosa", "Cardoso", "Correia", "Conceição"]
+
+
+def bench_search(rows=1_000_000, repeat=20):
+    """Full-text debtor search latency over `rows` debtors (names, documents, phones, emails)."""
+    from src.query import insert, bulk_insert
+    from src.search import search_debtors
+
+    with _scratch_database():
+        client_id = insert("INSERT INTO clients (name) VALUES (:name)", {"name": "Bench"})
+        started = time.perf_counter()
+        batch = []
+        for i in range(rows):
+            first = _FIRST_NAMES[i % 20]
+            last = f"{_LAST_NAMES[(i // 20) % 20]} {_LAST_NAMES[(i // 400) % 20]}"
+            cpf = _make_cpf(i)
+            batch.append((client_id, f"{first} {last}", cpf, cpf.replace(".", "").replace("-", ""),
+                          f"(11) 9{i % 10000:04d}-{(i // 10000) % 10000:04d}", f"devedor{i}@example.com"))
+            if len(batch) == 50_000 or i == rows - 1:
+                bulk_insert("debtors", ("client_id", "name", "cpf_cnpj", "cpf_cnpj_digits", "phone", "email"), batch)
+                batch = []
+        load_s = time.perf_counter() - started
+
+        queries = {
+            "nome completo": "thiago correia conceicao",
+            "nome + sobrenome": "joao oliveira",
+            "prefixo curto": "fer",
+            "acentos": "CONCEICAO Luiza",
+            "CPF completo": _make_cpf(rows // 2),
+            "fragmento de telefone": f"9{rows % 10000:04d}",
+            "nome + telefone": "maria 1234",
+            "email": f"devedor{rows // 3}@example.com",
+        }
+        results = {"rows": rows, "load_s": load_s}
+        print(f"Loaded {rows:,} debtors (FTS kept in sync by triggers) in {load_s:.1f} s")
+        for label, text in queries.items():
+            hits = search_debtors(text)
+            results[label] = _timed(lambda: search_debtors(text), repeat)
+            print(f"  {label:<24} {text!r:<28} {results[label]:8.2f} ms  ({len(hits)} hits)")
+    return results
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def _run_sessions(write, read, sessions, writes, readers):
+    """Runs `sessions` writer threads (`writes` calls each) next to `readers` reader threads.
+
+    Returns (write latencies ms, read latencies ms, errors, wall seconds).
+    """
+    write_ms, read_ms, errors = [], [], []
+    done = threading.Event()
+
+    def writer(n):
+        for i in range(writes):
+            started = time.perf_counter()
+            try:
+                write(n, i)
+            except Exception as e:
+                errors.append(str(e))
+                continue
+            write_ms.append((time.perf_counter() - started) * 1000)
+
+    def reader():
+        while not done.is_set():
+            started = time.perf_counter()
+            try:
+                read()
+            except Exception as e:
+                errors.append(str(e))
+                continue
+            read_ms.append((time.perf_counter() - started) * 1000)
+
+    reader_threads = [threading.Thread(target=reader) for _ in range(readers)]
+    writer_threads = [threading.Thread(target=writer, args=(n,)) for n in range(sessions)]
+    started = time.perf_counter()
+    for t in reader_threads + writer_threads:
+        t.start()
+    for t in writer_threads:
+        t.join()
+    wall = time.perf_counter() - started
+    done.set()
+    for t in reader_threads:
+        t.join()
+    return write_ms, read_ms, errors, wall
+
+
+_PAYMENT_SQL = "INSERT INTO payments (debtor_id, client_id, payment_date, amount) VALUES (1, 1, '2024-01-01', :amount)"
+_KPI_SQL = "UPDATE kpi_summary SET total_payments = total_payments + 1, total_recovered = total_recovered + :amount WHERE client_id = 1"
+_READ_SQL = "SELECT count(*), SUM(amount) FROM payments WHERE client_id = 1"
+
+
+def bench_concurrency(sessions=8, writes=100, readers=2):
+    """p50/p95 write latency with concurrent sessions: default-journal connection per
+    write (before) vs WAL profile, pooled connections and the writer queue (after)."""
+    from src.query import execute, fetch_one, transaction
+
+    def seed(conn):
+        run_migrations(conn)
+        conn.execute("INSERT INTO clients (id, name) VALUES (1, 'Bench')")
+        conn.execute("INSERT INTO debtors (id, client_id, name) VALUES (1, 1, 'Devedor')")
+        conn.execute("INSERT OR IGNORE INTO kpi_summary (client_id) VALUES (1)")
+        conn.commit()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "legacy.db")
+        conn = sqlite3.connect(path)
+        seed(conn)
+        conn.close()
+
+        def legacy_write(n, i):
+            # What every page did: fresh default connection (rollback journal) per write
+            conn = sqlite3.connect(path)
+            try:
+                conn.execute(_PAYMENT_SQL, {"amount": 10})
+                conn.execute(_KPI_SQL, {"amount": 10})
+                conn.commit()
+            finally:
+                conn.close()
+
+        def legacy_read():
+            conn = sqlite3.connect(path)
+            try:
+                conn.execute(_READ_SQL).fetchone()
+            finally:
+                conn.close()
+
+        results["before"] = _run_sessions(legacy_write, legacy_read, sessions, writes, readers)
+
+    with _scratch_database():
+        conn = _connect_sqlite()
+        seed(conn)
+        conn.close()
+
+        def write(n, i):
+            with transaction() as tx:
+                execute(_PAYMENT_SQL, {"amount": 10}, tx=tx)
+                execute(_KPI_SQL, {"amount": 10}, tx=tx)
+
+        def read():
+            fetch_one(_READ_SQL)
+
+        results["after"] = _run_sessions(write, read, sessions, writes, readers)
+
+    report = {}
+    for label, (write_ms, read_ms, errors, wall) in results.items():
+        report[label] = {
+            "write_p50_ms": _percentile(write_ms, 50), "write_p95_ms": _percentile(write_ms, 95),
+            "write_max_ms": max(write_ms, default=0.0), "read_p95_ms": _percentile(read_ms, 95),
+            "writes_per_sec": len(write_ms) / wall if wall else 0.0, "errors": len(errors),
+        }
+        r = report[label]
+        print(f"{label:>6}: {sessions} sessions x {writes} writes (+{readers} readers) - write p50 {r['write_p50_ms']:.2f} ms, "
+              f"p95 {r['write_p95_ms']:.2f} ms, max {r['write_max_ms']:.1f} ms | read p95 {r['read_p95_ms']:.2f} ms | "
+              f"{r['writes_per_sec']:.0f} writes/s | {r['errors']} errors")
+        if errors:
+            print(f"        first error: {errors[0]}")
+    return report
+
+
+def bench_reference_cache(reruns=500):
+    """Reference-data reads of one dashboard/clients rerun, uncached vs through the cache."""
+    from src import cache
+    from src.database import create_client, create_petition_template, get_client_forums, get_clients, get_kanban_columns, get_petition_templates
+
+    def rerun():
+        clients = get_clients()
+        for client_id in clients["id"]:
+            get_client_forums(int(client_id))
+        get_kanban_columns()
+        get_petition_templates()
+
+    with _scratch_database():
+        for i in range(20):
+            create_client(f"Cliente {i}", main_forum=f"Foro {i}", jurisdiction_state="SP")
+        for i in range(10):
+            create_petition_template(f"Modelo {i}", "inicial", "", "{{devedor_nome}}\n" * 200)
+
+        timings = {}
+        for label, ttl in (("uncached", "0"), ("cached", None)):
+            saved = cache.REFERENCE_CACHE_TTL
+            if ttl is not None:
+                cache.REFERENCE_CACHE_TTL = float(ttl)
+            invalidate()
+            reset_cache_stats()
+            try:
+                started = time.perf_counter()
+                for _ in range(reruns):
+                    rerun()
+                timings[label] = (time.perf_counter() - started) * 1000 / reruns
+            finally:
+                cache.REFERENCE_CACHE_TTL = saved
+            print(f"{label:>9}: {timings[label]:.3f} ms per rerun ({reruns} reruns, 20 clients)")
+        hits = sum(s["hits"] for s in cache_stats().values())
+        lookups = hits + sum(s["misses"] for s in cache_stats().values())
+        print(f"hit rate: {hits / lookups:.1%} ({lookups} lookups)")
+    return timings
+
+
+def bench_kanban(cards=500, columns=5):
+    """Dashboard board persistence per rerun: UPDATE per card (before) vs diff (idle and one move)."""
+    from src.database import get_kanban_board, kanban_moves, move_kanban_cards, update_kanban_card_status
+    from src.query import executemany, statement_stats
+
+    def updates():
+        return sum(s["calls"] for s in statement_stats() if s["sql"].lstrip().startswith("UPDATE kanban_cards"))
+
+    statuses = [f"Coluna {c}" for c in range(columns)]
+    with _scratch_database():
+        executemany("INSERT INTO kanban_cards (title, status, order_index) VALUES (:title, :status, :order_index)",
+                    [{"title": f"Tarefa {i}", "status": statuses[i % columns], "order_index": i // columns} for i in range(cards)])
+
+        def layout_of(board):
+            return {status: [card["id"] for card in board[status]] for status in statuses}
+
+        results = {}
+        writes = updates()
+        started = time.perf_counter()
+        # Before: one get_kanban_cards-style query per column, then every card updated
+        board = get_kanban_board(statuses)
+        for status, ids in layout_of(board).items():
+            for card_id in ids:
+                update_kanban_card_status(card_id, status)
+        results["before idle"] = ((time.perf_counter() - started) * 1000, updates() - writes, cards)
+
+        for label, change in (("after idle", None), ("after 1 move", True)):
+            writes = updates()
+            started = time.perf_counter()
+            board = get_kanban_board(statuses)
+            layout = layout_of(board)
+            if change:
+                layout[statuses[-1]].insert(0, layout[statuses[0]].pop(0))
+            moved = move_kanban_cards(kanban_moves(board, layout))
+            results[label] = ((time.perf_counter() - started) * 1000, updates() - writes, moved)
+
+    for label, (ms, statements, moved) in results.items():
+        print(f"{label:>13}: {ms:8.2f} ms, {statements} UPDATE statements, {moved} cards written ({cards} cards, {columns} columns)")
+    return results
+
+
+def bench_debtor_bundle(debtors=200, loads=500):
+    """Loading what the debtor pages show: one read_df per table (before) vs load_debtor_bundle."""
+    from src.database import create_agreement, create_debt, create_legal_expense, create_payment
+    from src.debtor_bundle import load_debtor_bundle
+    from src.query import insert, read_df
+
+    with _scratch_database():
+        client_id = insert("INSERT INTO clients (name) VALUES (:name)", {"name": "Bench"})
+        for n in range(debtors):
+            debtor_id = insert("INSERT INTO debtors (client_id, name, cpf_cnpj) VALUES (:client_id, :name, :cpf)",
+                               {"client_id": client_id, "name": f"Devedor {n}", "cpf": _make_cpf(n)})
+            for i in range(12):
+                create_debt(debtor_id, "CESU", 100 + i, f"2023-{i + 1:02d}-10", description=f"Parcela {i + 1}")
+            for i in range(6):
+                create_payment(debtor_id, f"2024-{i + 1:02d}-05", 50, payment_method="PIX")
+            create_agreement(debtor_id, "2024-01-01", 900)
+            create_legal_expense(debtor_id, "Custas iniciais", 120, "2024-02-01")
+
+        def separate(debtor_id):
+            read_df("SELECT * FROM debtors WHERE id = :id", {"id": debtor_id})
+            for table in ("debts", "legal_expenses", "payments", "agreements", "judicial_processes", "guarantors", "addresses", "contact_history"):
+                read_df(f"SELECT * FROM {table} WHERE debtor_id = :id", {"id": debtor_id})
+
+        timings = {}
+        for label, load in (("separate queries", separate), ("load_debtor_bundle", load_debtor_bundle)):
+            started = time.perf_counter()
+            for i in range(loads):
+                load(1 + i % debtors)
+            timings[label] = (time.perf_counter() - started) * 1000 / loads
+            print(f"{label:>18}: {timings[label]:.3f} ms per debtor ({loads} loads)")
+    return timings
+
+
+def _rss_mb():
+    # Linux only; benchmarks report memory as "n/a" elsewhere
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _peak_rss(func):
+    """Runs func() and returns (result, peak RSS growth in MB over the starting RSS, or None)."""
+    baseline = _rss_mb()
+    if baseline is None:
+        return func(), None
+    peak = [baseline]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(0.02):
+            peak[0] = max(peak[0], _rss_mb())
+
+    sampler = threading.Thread(target=sample)
+    sampler.start()
+    try:
+        result = func()
+    finally:
+        done.set()
+        sampler.join()
+    return result, max(peak[0], _rss_mb()) - baseline
+
+
+def bench_export(debtors=100_000, debts_per_debtor=10, xlsx_rows=200_000):
+    """Portfolio export throughput and memory growth: read_sql_query + to_csv (before) vs streaming export."""
+    import pandas as pd
+    from src.export import PORTFOLIO_SQL, export_portfolio
+    from src.query import bulk_insert, execute, insert, pool
+
+    with _scratch_database() as tmp:
+        client_id = insert("INSERT INTO clients (name) VALUES (:name)", {"name": "Bench"})
+        bulk_insert("debtors", ("client_id", "name", "cpf_cnpj", "phone", "email"),
+                    [(client_id, f"Devedor {i}", _make_cpf(i), "(11) 98765-4321", f"devedor{i}@example.com") for i in range(debtors)])
+        rows = debtors * debts_per_debtor
+        for start in range(0, rows, 100_000):
+            bulk_insert("debts", ("debtor_id", "client_id", "contract_type", "description", "original_value", "due_date"),
+                        [(1 + i // debts_per_debtor, client_id, "CESU", f"Parcela {i % debts_per_debtor + 1}", 150.0 + i % 97,
+                          f"2023-{i % 12 + 1:02d}-10") for i in range(start, min(rows, start + 100_000))])
+        print(f"Portfolio: {debtors:,} debtors, {rows:,} debts")
+
+        def before():
+            conn = _connect_sqlite()
+            try:
+                pd.read_sql_query(PORTFOLIO_SQL, conn).to_csv(os.path.join(tmp, "before.csv"), sep=";", index=False)
+            finally:
+                conn.close()
+
+        results = {}
+        started = time.perf_counter()
+        _, growth = _peak_rss(before)
+        seconds = time.perf_counter() - started
+        results["read_sql_query csv"] = (rows, seconds, growth)
+
+        for fmt, limit in (("csv", None), ("parquet", None), ("xlsx", xlsx_rows)):
+            path = os.path.join(tmp, f"export.{fmt}")
+            if limit and limit < rows:
+                # XLSX is CPU-bound in openpyxl; measure it on a slice of the clients' debtors
+                sub_client = insert("INSERT INTO clients (name) VALUES (:name)", {"name": "Bench XLSX"})
+                execute("UPDATE debtors SET client_id = :c WHERE id <= :n", {"c": sub_client, "n": limit // debts_per_debtor})
+                stats, growth = _peak_rss(lambda: export_portfolio(path, fmt, client_id=sub_client))
+            else:
+                stats, growth = _peak_rss(lambda: export_portfolio(path, fmt))
+            results[f"stream {fmt}"] = (stats["rows"], stats["seconds"], growth)
+        pool.clear()
+
+    for label, (count, seconds, growth) in results.items():
+        memory = f"{growth:+.0f} MB" if growth is not None else "n/a"
+        print(f"{label:>18}: {count:,} rows in {seconds:.1f} s ({count / seconds:,.0f} rows/s), peak RSS {memory}")
+    return results
+
+
+_PAYMENT_QUERIES = (
+    # (label, SQL with {rel}); the first two read the current year, the last a debtor's whole history
+    ("year totals", "SELECT count(*), COALESCE(SUM(amount), 0) FROM {rel} WHERE payment_date >= :start"),
+    ("client's year", "SELECT count(*), COALESCE(SUM(amount), 0) FROM {rel} WHERE client_id = :client_id AND payment_date >= :start"),
+    ("debtor history", "SELECT * FROM {rel} WHERE debtor_id = :debtor_id ORDER BY payment_date DESC"),
+)
+
+
+def bench_partitions(payments=10_000_000, debtors=100_000, clients=20, years=10, repeat=10):
+    """Payment queries over `years` years of history, all in payments (before) vs after
+    archive_history(): current-year queries on the hot table, debtor history through payments_all."""
+    from datetime import date
+    from src.archive import archive_history
+    from src.query import bulk_insert, execute, fetch_all, fetch_scalar, insert
+
+    this_year = date.today().year
+    with _scratch_database():
+        client_ids = [insert("INSERT INTO clients (name) VALUES (:name)", {"name": f"Bench {i}"}) for i in range(clients)]
+        bulk_insert("debtors", ("client_id", "name", "cpf_cnpj"),
+                    [(client_ids[i % clients], f"Devedor {i}", _make_cpf(i)) for i in range(debtors)])
+        # Every 10th debtor is still in an active agreement; the rest are settled or broken
+        bulk_insert("agreements", ("debtor_id", "client_id", "status", "agreement_date", "agreed_value"),
+                    [(1 + i, client_ids[i % clients], "active" if i % 10 == 0 else "completed", f"{this_year - years + 1}-01-01", 1000.0)
+                     for i in range(debtors)])
+        started = time.perf_counter()
+        for offset in range(0, payments, 200_000):
+            bulk_insert("payments", ("debtor_id", "client_id", "payment_date", "amount", "payment_method"),
+                        [(1 + i % debtors, client_ids[i % debtors % clients],
+                          f"{this_year - years + 1 + i * years // payments}-{1 + i % 12:02d}-{1 + i % 28:02d}", 50.0 + i % 450, "PIX")
+                         for i in range(offset, min(payments, offset + 200_000))])
+        execute("DELETE FROM change_log")
+        print(f"Seeded {payments:,} payments over {years} years in {time.perf_counter() - started:.1f} s")
+
+        params = {"start": f"{this_year}-01-01", "client_id": client_ids[0], "debtor_id": 2}
+
+        def measure(history):
+            rels = ("payments", "payments", history)
+            return {
+                label: (_timed(lambda: fetch_all(sql.format(rel=rel), params), repeat), fetch_all(sql.format(rel=rel), params))
+                for (label, sql), rel in zip(_PAYMENT_QUERIES, rels)
+            }
+
+        before = measure("payments")
+        started = time.perf_counter()
+        moved = archive_history(batch_size=50_000)["payments"]
+        seconds = time.perf_counter() - started
+        print(f"archive_history: {moved:,} payments in {seconds:.1f} s ({moved / seconds:,.0f} rows/s), "
+              f"{fetch_scalar('SELECT count(*) FROM payments'):,} left in the hot table")
+        after = measure("payments_all")
+
+    results = {}
+    for label, _ in _PAYMENT_QUERIES:
+        assert sorted(before[label][1]) == sorted(after[label][1]), label
+        results[label] = {"before_ms": before[label][0], "after_ms": after[label][0]}
+        print(f"{label:>15}: {before[label][0]:8.2f} ms -> {after[label][0]:8.2f} ms")
+    return results
+
+def bench_backup(size_mb=2048, writes_per_sec=50):
+    """Online snapshot, journal and restore throughput on a `size_mb` database, with
+    a writer committing `writes_per_sec` payments during the first snapshot."""
+    import hashlib
+    import random
+    from src.backup import BACKUP_DIR, capture_journal, create_snapshot, restore
+    from src.config import SQLITE_DB_PATH
+    from src.query import bulk_insert, execute, executemany, fetch_all, fetch_one, insert
+
+    with _scratch_database() as tmp:
+        client_id = insert("INSERT INTO clients (name) VALUES (:name)", {"name": "Bench"})
+        bulk_insert("debtors", ("client_id", "name", "cpf_cnpj"),
+                    [(client_id, f"Devedor {i}", _make_cpf(i)) for i in range(100_000)])
+        started, batch = time.perf_counter(), 0
+        while os.path.getsize(SQLITE_DB_PATH) < size_mb * 1024 * 1024:
+            bulk_insert("payments", ("debtor_id", "client_id", "payment_date", "amount", "payment_method", "notes"),
+                        [(1 + i % 100_000, client_id, f"{2015 + i % 10}-{1 + i % 12:02d}-{1 + i % 28:02d}", 50.0 + i % 450, "PIX",
+                          f"Parcela {i % 12 + 1} do acordo {i // 12} paga via PIX, comprovante {hashlib.sha1(str(i).encode()).hexdigest()}")
+                         for i in range(batch * 100_000, (batch + 1) * 100_000)])
+            batch += 1
+        execute("DELETE FROM change_log")
+        execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        size = os.path.getsize(SQLITE_DB_PATH)
+        print(f"Database: {size / 1024 / 1024:,.0f} MB ({batch * 100_000:,} payments) seeded in {time.perf_counter() - started:.0f} s")
+        capture_journal()
+
+        latencies, stop = [], threading.Event()
+
+        def writer():
+            while not stop.wait(1 / writes_per_sec):
+                begun = time.perf_counter()
+                execute("INSERT INTO payments (debtor_id, client_id, payment_date, amount) VALUES (1, :client_id, '2026-01-01', 10)",
+                        {"client_id": client_id})
+                latencies.append((time.perf_counter() - begun) * 1000)
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        try:
+            first = create_snapshot()
+        finally:
+            stop.set()
+            thread.join()
+        mb = first["size"] / 1024 / 1024
+        print(f"snapshot 1: {mb:,.0f} MB in {first['seconds']:.1f} s ({mb / first['seconds']:,.0f} MB/s), "
+              f"stored {first['new_bytes'] / 1024 / 1024:,.0f} MB; {len(latencies)} concurrent writes "
+              f"p95 {_percentile(latencies, 95):.1f} ms, max {max(latencies):.1f} ms")
+
+        # A day of activity: new payments, corrections to recent ones, a few deletions
+        rng = random.Random(42)
+        total = fetch_one("SELECT MAX(id) FROM payments")[0]
+        bulk_insert("payments", ("debtor_id", "client_id", "payment_date", "amount"),
+                    [(1 + rng.randrange(100_000), client_id, "2026-02-01", 99.0) for _ in range(10_000)])
+        executemany("UPDATE payments SET notes = :notes WHERE id = :id",
+                    [{"notes": f"Revisado {i}", "id": total - rng.randrange(100_000)} for i in range(5_000)])
+        executemany("DELETE FROM payments WHERE id = :id", [{"id": total - rng.randrange(100_000)} for _ in range(500)])
+        started = time.perf_counter()
+        segment = capture_journal()
+        journal_seconds = time.perf_counter() - started
+        print(f"journal: {segment['rows']:,} changed rows captured in {journal_seconds:.2f} s")
+
+        second = create_snapshot()
+        print(f"snapshot 2: {second['seconds']:.1f} s, {second['new_chunks']} of {len(second['chunks'])} chunks new "
+              f"({second['new_bytes'] / 1024 / 1024:,.1f} MB stored)")
+        stored = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(BACKUP_DIR) for name in names)
+
+        # Point-in-time path: first snapshot plus the journal
+        os.remove(os.path.join(BACKUP_DIR, "snapshots", second["name"] + ".json"))
+        target = os.path.join(tmp, "restored.db")
+        result = restore(target)
+        restored = sqlite3.connect(target)
+        check = "SELECT count(*), SUM(amount), SUM(length(notes)) FROM payments"
+        assert restored.execute(check).fetchone() == tuple(fetch_all(check)[0])
+        restored.close()
+        mb = result["size"] / 1024 / 1024
+        print(f"restore: {mb:,.0f} MB + {result['rows_applied']:,} journal rows in {result['seconds']:.1f} s "
+              f"({mb / result['seconds']:,.0f} MB/s); backup dir {stored / 1024 / 1024:,.0f} MB for 2 snapshots")
+    return {
+        "size_mb": size / 1024 / 1024,
+        "snapshot_seconds": first["seconds"],
+        "incremental_snapshot_seconds": second["seconds"],
+        "journal_seconds": journal_seconds,
+        "restore_seconds": result["seconds"],
+        "stored_mb": stored / 1024 / 1024,
+        "write_p95_ms": _percentile(latencies, 95),
+    }
+
+
+_FAN_OUT_READS = (
+    "SELECT COALESCE(SUM(original_value), 0) FROM debts WHERE debtor_id = :id",
+    "SELECT COALESCE(SUM(amount), 0), MAX(payment_date) FROM payments_all WHERE debtor_id = :id",
+    "SELECT id, status, agreed_value FROM agreements WHERE debtor_id = :id",
+)
+
+
+def _seed_fan_out(client_id, debtors):
+    from src.query import bulk_insert, fetch_all
+    bulk_insert("debtors", ("client_id", "name", "cpf_cnpj"),
+                [(client_id, f"Devedor {n}", _make_cpf(n)) for n in range(debtors)])
+    ids = [row[0] for row in fetch_all("SELECT id FROM debtors WHERE client_id = :client_id", {"client_id": client_id})]
+    bulk_insert("debts", ("debtor_id", "client_id", "contract_type", "original_value", "due_date"),
+                [(debtor_id, client_id, "CESU", 100.0 + i, f"2024-{i + 1:02d}-10") for debtor_id in ids for i in range(5)])
+    bulk_insert("payments", ("debtor_id", "client_id", "payment_date", "amount"),
+                [(debtor_id, client_id, f"2025-{i + 1:02d}-05", 50.0) for debtor_id in ids for i in range(6)])
+    bulk_insert("agreements", ("debtor_id", "client_id", "status", "agreement_date", "agreed_value"),
+                [(debtor_id, client_id, "active", "2025-01-01", 400.0) for debtor_id in ids])
+    return ids
+
+
+def _fan_out(ids, concurrency):
+    """Per-debtor fan-out (reads, then one payment each): sync sequential vs async gather."""
+    import src.async_database as adb
+    import src.async_query as aq
+    from src.database import create_payment
+    from src.query import fetch_all, transaction
+
+    def sync_reads():
+        for debtor_id in ids:
+            with transaction() as tx:
+                for sql in _FAN_OUT_READS:
+                    fetch_all(sql, {"id": debtor_id}, tx=tx)
+
+    async def debtor_reads(debtor_id):
+        async with aq.transaction() as tx:
+            for sql in _FAN_OUT_READS:
+                await aq.fetch_all(sql, {"id": debtor_id}, tx=tx)
+
+    def sync_writes():
+        for debtor_id in ids:
+            create_payment(debtor_id, "2026-01-05", 10.0, payment_method="PIX")
+
+    def timed_async(make):
+        async def main():
+            await aq.fetch_scalar("SELECT 1")  # opens the pool outside the measurement
+            started = time.perf_counter()
+            await aq.gather_limited((make(debtor_id) for debtor_id in ids), concurrency)
+            return time.perf_counter() - started
+        return aq.run(main())
+
+    def timed(func):
+        started = time.perf_counter()
+        func()
+        return time.perf_counter() - started
+
+    results = {
+        "sync_reads_s": timed(sync_reads),
+        "async_reads_s": timed_async(debtor_reads),
+        "sync_writes_s": timed(sync_writes),
+        "async_writes_s": timed_async(lambda debtor_id: adb.create_payment(debtor_id, "2026-01-05", 10.0, payment_method="PIX")),
+    }
+    for kind, statements in (("reads", len(_FAN_OUT_READS)), ("writes", 3)):
+        sync_s, async_s = results[f"sync_{kind}_s"], results[f"async_{kind}_s"]
+        print(f"{kind:>6}: sync {len(ids) / sync_s:8,.0f} debtors/s | async {len(ids) / async_s:8,.0f} debtors/s "
+              f"({sync_s / async_s:.2f}x, {statements} statements per debtor, {concurrency} in flight)")
+    return results
+
+
+def bench_async(debtors=5_000, concurrency=None, postgres=False):
+    """Throughput of a per-debtor fan-out (3 reads; then 1 payment) on the sync layer,
+    one debtor after another, vs the async layer with `concurrency` debtors in flight
+    (default: twice ASYNC_POOL_SIZE).
+
+    postgres=True runs it against the configured Postgres instead of a scratch SQLite
+    file: it adds a "Benchmark async" client and deletes it (rows cascade) afterwards.
+    """
+    from src.config import ASYNC_POOL_SIZE, USE_SUPABASE
+    from src.connection import current_dialect
+    from src.database import delete_client
+    from src.query import insert
+
+    concurrency = concurrency or ASYNC_POOL_SIZE * 2
+    if not postgres:
+        with _scratch_database():
+            client_id = insert("INSERT INTO clients (name) VALUES (:name)", {"name": "Bench"})
+            print(f"SQLite, {debtors:,} debtors:")
+            return _fan_out(_seed_fan_out(client_id, debtors), concurrency)
+
+    if not (USE_SUPABASE and current_dialect().is_postgres):
+        print("Postgres não configurado (USE_SUPABASE) ou indisponível.")
+        return {}
+    client_id = insert("INSERT INTO clients (name) VALUES (:name)", {"name": "Benchmark async"})
+    try:
+        print(f"Postgres, {debtors:,} debtors:")
+        return _fan_out(_seed_fan_out(client_id, debtors), concurrency)
+    finally:
+        delete_client(client_id)
+
+
+# Libraries the login screen should not need
+_HEAVY_MODULES = ("pandas", "numpy", "pyarrow", "reportlab", "fpdf", "bs4", "requests", "openpyxl", "streamlit_sortables")
+
+
+def _import_profile(code, cwd, root):
+    """Runs `code` under python -X importtime; returns (modules imported, {top-level module: cumulative ms})."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=cwd, capture_output=True, text=True,
+                            env={**os.environ, "PYTHONPATH": root})
+    modules, top_level = set(), {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules.add(name.strip())
+        if len(name) - len(name.lstrip()) == 1:  # nested imports are indented further
+            top_level[name.strip()] = int(cumulative) / 1000
+    return modules, top_level
+
+
+def bench_startup(repeat=3, top=8):
+    """Cold-start import cost of app.py rendering the login screen (python -X importtime):
+    every page module imported up front, as app.py did, vs pages imported when routed to."""
+    from src.pages import PAGES
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    run_app = f"import runpy; runpy.run_path({os.path.join(root, 'app.py')!r}, run_name='__main__')"
+    variants = {
+        "every page": "import " + ", ".join(sorted({module for module, _ in PAGES.values()})) + "; " + run_app,
+        "login only": run_app,
+    }
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:  # app.py creates data/debtors.db under the working directory
+        for label, code in variants.items():
+            runs = [_import_profile(code, tmp, root) for _ in range(repeat)]
+            modules, top_level = min(runs, key=lambda run: sum(run[1].values()))
+            heavy = [name for name in _HEAVY_MODULES if name in modules]
+            results[label] = {"import_ms": sum(top_level.values()), "modules": len(modules), "heavy": heavy}
+            print(f"{label:>10}: {results[label]['import_ms']:7.1f} ms importing {len(modules):,} modules; "
+                  f"heavy: {', '.join(heavy) or '-'}")
+    print("Slowest top-level imports on the login screen:")
+    for name, ms in sorted(top_level.items(), key=lambda item: item[1], reverse=True)[:top]:
+        print(f"{ms:9.1f} ms  {name}")
+    return results
+
+
+def _cold_job():
+    # One job in a fresh process: what running each job in its own process would cost
+    from src.jobs import warm_up, work
+    warm_up()
+    work(max_jobs=1)
+
+
+def bench_jobs(jobs=200, work_ms=20, processes=(1, 2, 4), cold=5):
+    """Background job throughput: `jobs` noop jobs of `work_ms` each drained by 1, 2 and 4
+    long-lived worker processes, vs `cold` jobs each run in a freshly started process."""
+    import multiprocessing
+    from src.jobs import run_pool, submit
+    from src.query import execute, fetch_one
+
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    with _scratch_database():
+        for count in processes:
+            for _ in range(jobs):
+                submit("noop", {"seconds": work_ms / 1000})
+            started = time.perf_counter()
+            run_pool(count, exit_when_idle=True)
+            wall = time.perf_counter() - started
+            # From the first claim to the last finish: throughput once the workers are warm
+            first, last, done = fetch_one("SELECT MIN(started_at), MAX(finished_at), COUNT(*) FROM jobs WHERE status = 'done'")
+            results[count] = {"wall_s": wall, "jobs_per_sec": done / (last - first), "done": done}
+            print(f"{count} process(es): {done / (last - first):7.1f} jobs/s warm ({done} jobs), "
+                  f"{wall:.2f} s including start-up")
+            execute("DELETE FROM jobs")
+
+        for _ in range(cold):
+            submit("noop", {"seconds": work_ms / 1000})
+        started = time.perf_counter()
+        for _ in range(cold):
+            process = context.Process(target=_cold_job)
+            process.start()
+            process.join()
+        per_job = (time.perf_counter() - started) / cold
+        results["cold"] = {"seconds_per_job": per_job}
+        print(f"process per job: {1 / per_job:7.1f} jobs/s ({per_job * 1000:,.0f} ms each, start-up and warm-up included)")
+    return results
+
+
+BENCHMARKS = {
+    "schema_init": bench_schema_init,
+    "import": bench_import,
+    "search": bench_search,
+    "concurrency": bench_concurrency,
+    "reference_cache": bench_reference_cache,
+    "kanban": bench_kanban,
+    "debtor_bundle": bench_debtor_bundle,
+    "export": bench_export,
+    "partitions": bench_partitions,
+    "backup": bench_backup,
+    "async": bench_async,
+    "async_postgres": lambda: bench_async(postgres=True),
+    "startup": bench_startup,
+    "jobs": bench_jobs,
+}
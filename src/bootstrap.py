@@ -0,0 +1,72 @@
+"""Start-up work for the Streamlit server process, done once.
+
+Streamlit re-executes app.py on every interaction; bootstrap() is its only
+start-up call. The first call migrates the schema and seeds the defaults
+(init_db: petition templates, default admin) and prepares the theme CSS; every
+later call returns after one set lookup. A backend that only comes into use
+later (the SQLite fallback while Postgres is down) is set up on its first rerun.
+
+The calculator's financial indices are read on a background thread, so the
+login screen doesn't wait for pandas and the CSV parsing. The first call also
+starts the background job workers (src.jobs, JOB_WORKERS processes).
+
+    bootstrap()
+    bootstrap_status()   # {"ready": True, "backends": ["sqlite"], "seconds": 0.41, ...}
+"""
+import threading
+import time
+
+from src.connection import current_dialect
+
+_lock = threading.Lock()
+_ready_backends = set()
+_status = {"seconds": None, "error": None, "indices": "pending"}
+
+
+def _load_indices():
+    try:
+        from src.calculator import IndicesManager
+        from src.rules import ContractRule
+        for name in {rule().get_index_name() for rule in ContractRule.__subclasses__()}:
+            IndicesManager.get_indices(name)
+        _status["indices"] = "loaded"
+    except Exception as e:
+        _status["indices"] = f"failed: {e}"
+
+
+def bootstrap():
+    """Runs the process start-up work for the backend in use, the first time only."""
+    dialect = current_dialect().name
+    if dialect in _ready_backends:
+        return
+    with _lock:
+        if dialect in _ready_backends:
+            return
+        from src.database import init_db
+        from src.styles import prepare_css
+
+        started = time.perf_counter()
+        try:
+            init_db()
+        except Exception as e:
+            _status["error"] = str(e)
+            raise
+        first = not _ready_backends
+        if first:
+            prepare_css()
+            threading.Thread(target=_load_indices, name="bootstrap-indices", daemon=True).start()
+            from src.jobs import start_background_workers
+            start_background_workers()
+            _status["seconds"] = time.perf_counter() - started
+        _status["error"] = None
+        _ready_backends.add(dialect)
+
+
+def is_ready():
+    """True once bootstrap() has finished for the backend in use."""
+    return current_dialect().name in _ready_backends
+
+
+def bootstrap_status():
+    """Readiness summary for the Settings integrity check."""
+    return {"ready": is_ready(), "backends": sorted(_ready_backends), **_status}
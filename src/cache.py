@@ -0,0 +1,165 @@
+"""Process-wide read-through cache for reference data.
+
+Clients, client forums, kanban columns and petition templates change a few
+times a day but are read on every Streamlit rerun. Functions decorated with
+`reference_cache("table", ...)` keep their result for REFERENCE_CACHE_TTL
+seconds, shared by all sessions (threads) of the process; the write functions
+in src.database call `invalidate("table")` after they commit.
+
+    @reference_cache("clients")
+    def get_clients(): ...
+
+    invalidate("clients")       # next get_clients() reads the database again
+    cache_stats()["get_clients"]  # {"hits": ..., "misses": ..., "hit_rate": ...}
+
+Every table also has a data version, table_versions("debts", ...), that changes
+whenever the table may have changed: on invalidate(), and after each commit that
+wrote to it (the query layer reports them to tables_written(); deletes also count
+for the tables their foreign keys cascade to). Caches keyed by it, like the pages'
+st.cache_data loaders, never need to be cleared.
+"""
+import copy
+import functools
+import threading
+import time
+
+from src.config import REFERENCE_CACHE_TTL
+from src.connection import current_dialect
+
+_lock = threading.Lock()
+# (function name, dialect, args) -> (expires at, value)
+_entries = {}
+# table -> function names depending on it
+_dependents = {}
+# table -> number of invalidations; a load that overlaps one is not stored.
+# None counts invalidate() calls without tables (everything may have changed).
+_generations = {}
+_stats = {}
+# dialect -> {table: tables whose rows a delete on it cascades to (ON DELETE CASCADE/SET NULL)}
+_cascades = {}
+
+
+def _copy(value):
+    # Callers get their own copy, so a page adding a column can't change the cached frame
+    if hasattr(value, "copy") and hasattr(value, "columns"):
+        return value.copy()
+    return copy.deepcopy(value)
+
+
+def reference_cache(*tables, ttl=None):
+    """Caches the decorated function's result per arguments and backend until
+    `ttl` seconds pass (REFERENCE_CACHE_TTL by default) or one of `tables` is invalidated."""
+    def decorator(func):
+        name = func.__name__
+        with _lock:
+            for table in tables:
+                _dependents.setdefault(table, set()).add(name)
+            _stats.setdefault(name, {"hits": 0, "misses": 0, "invalidations": 0})
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            lifetime = REFERENCE_CACHE_TTL if ttl is None else ttl
+            if lifetime <= 0:
+                return func(*args, **kwargs)
+            key = (name, current_dialect().name, args, tuple(sorted(kwargs.items())))
+            now = time.monotonic()
+            with _lock:
+                entry = _entries.get(key)
+                if entry is not None and entry[0] > now:
+                    _stats[name]["hits"] += 1
+                    return _copy(entry[1])
+                _stats[name]["misses"] += 1
+                generations = tuple(_generations.get(table, 0) for table in tables)
+
+            value = func(*args, **kwargs)
+            with _lock:
+                if generations == tuple(_generations.get(table, 0) for table in tables):
+                    _entries[key] = (now + lifetime, value)
+            return _copy(value)
+
+        wrapper.cache_tables = tables
+        return wrapper
+    return decorator
+
+
+def invalidate(*tables):
+    """Drops cached results that depend on any of `tables` (all of them if none given)."""
+    with _lock:
+        if not tables:
+            _generations[None] = _generations.get(None, 0) + 1
+            tables = tuple(_dependents)
+        names = set()
+        for table in tables:
+            _generations[table] = _generations.get(table, 0) + 1
+            names |= _dependents.get(table, set())
+        for key in [k for k in _entries if k[0] in names]:
+            del _entries[key]
+        for name in names:
+            _stats[name]["invalidations"] += 1
+
+
+def table_versions(*tables):
+    """A value that changes whenever any of `tables` may have changed."""
+    with _lock:
+        return (_generations.get(None, 0),) + tuple(_generations.get(table, 0) for table in tables)
+
+
+def _foreign_key_cascades(dialect):
+    """{parent table: child tables} for foreign keys whose ON DELETE changes the child rows."""
+    from src.query import fetch_all
+    if dialect.is_postgres:
+        edges = fetch_all("""
+            SELECT confrelid::regclass::text, conrelid::regclass::text FROM pg_constraint
+            WHERE contype = 'f' AND confdeltype IN ('c', 'n', 'd')
+        """)
+    else:
+        edges = []
+        for (table,) in fetch_all("SELECT name FROM sqlite_master WHERE type = 'table'"):
+            for fk in fetch_all(f'PRAGMA foreign_key_list("{table}")'):
+                if fk[6].upper() in ("CASCADE", "SET NULL", "SET DEFAULT"):
+                    edges.append((fk[2], table))
+    children = {}
+    for parent, child in edges:
+        children.setdefault(parent.lower(), set()).add(child.lower())
+    return children
+
+
+def tables_written(changes):
+    """Query-layer hook, after a commit: {table: rows deleted?} that the transaction wrote.
+
+    Invalidates those tables, plus every table a delete may have cascaded to.
+    """
+    tables = set(changes)
+    deleted = [table for table, was_delete in changes.items() if was_delete]
+    if deleted:
+        dialect = current_dialect()
+        try:
+            if dialect.name not in _cascades:
+                _cascades[dialect.name] = _foreign_key_cascades(dialect)
+        except Exception as e:
+            print(f"Error reading foreign keys: {e}")
+            invalidate()
+            return
+        pending = list(deleted)
+        while pending:
+            for child in _cascades[dialect.name].get(pending.pop(), ()):
+                if child not in tables:
+                    tables.add(child)
+                    pending.append(child)
+    invalidate(*tables)
+
+
+def cache_stats():
+    """{function name: {"hits", "misses", "invalidations", "hit_rate"}} since start/reset."""
+    with _lock:
+        stats = {}
+        for name, counters in _stats.items():
+            lookups = counters["hits"] + counters["misses"]
+            stats[name] = {**counters, "hit_rate": counters["hits"] / lookups if lookups else 0.0}
+        return stats
+
+
+def reset_cache_stats():
+    with _lock:
+        for counters in _stats.values():
+            counters.update(hits=0, misses=0, invalidations=0)
@@ -3,12 +3,33 @@ from decimal import Decimal, ROUND_HALF_UP
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 import os
+from src.metrics import timed
 from src.rules import RuleFactory
 
 DATA_DIR = os.path.join("data")
 
 class IndicesManager:
     _cache = {}
+    _version = None
+
+    @staticmethod
+    def version():
+        """Modification times of the index files: changes when they are downloaded
+        again (scraper, the update_indices job), in this process or any other."""
+        try:
+            names = sorted(n for n in os.listdir(DATA_DIR) if n.startswith("indices_") or n == "selic.csv")
+        except FileNotFoundError:
+            return ()
+        return tuple((name, os.stat(os.path.join(DATA_DIR, name)).st_mtime_ns) for name in names)
+
+    @staticmethod
+    def sync():
+        """Forgets the loaded index tables if their files changed since; returns version()."""
+        version = IndicesManager.version()
+        if version != IndicesManager._version:
+            IndicesManager._cache.clear()
+            IndicesManager._version = version
+        return version
 
     @staticmethod
     def get_indices(index_name):
@@ -39,6 +60,7 @@ class IndicesManager:
 
 class Calculator:
     @staticmethod
+    @timed("calculate")
     def calculate(contract_type, original_value, due_date, calc_date, fine_type=None):
         rule = RuleFactory.get_rule(contract_type)
         
@@ -0,0 +1,175 @@
+"""Change data capture: consumers of the change_log table.
+
+Triggers (migration 009) append one row per insert/update/delete on the tables
+in CHANGE_LOG_TABLES: (seq, table_name, row_id, op 'I'/'U'/'D', client_id, ts).
+A consumer keeps the last seq it processed in change_cursors and, on each run,
+handles only newer changes:
+
+    def handle(changes):          # list of Change, or None = state unknown, rebuild
+        ...
+    consume("my_consumer", handle, tables=("payments",))
+
+compact_change_log() removes what every registered consumer has processed and
+anything older than CHANGE_LOG_MAX_AGE_HOURS, and records the highest seq removed
+(the _compacted horizon): consumers behind it get handler(None) and rebuild from
+scratch, and sync_caches drops this process' caches.
+"""
+import threading
+import time
+from collections import namedtuple
+
+from src.config import CHANGE_LOG_MAX_AGE_HOURS, CHANGE_SYNC_INTERVAL
+from src.query import execute, fetch_all, fetch_scalar, transaction
+
+Change = namedtuple("Change", "seq table_name row_id op client_id")
+
+CHANGE_BATCH_SIZE = 5000
+# Reserved change_cursors row: highest seq compacted away; consumers behind it must rebuild
+_HORIZON = "_compacted"
+COMPACT_INTERVAL = 3600
+
+_sync_lock = threading.Lock()
+_sync_state = {"seq": None, "synced_at": 0.0, "compacted_at": time.monotonic()}
+
+
+def latest_seq(tx=None):
+    """Sequence number of the newest change (0 if none), counting compacted ones."""
+    newest = fetch_scalar("SELECT COALESCE(MAX(seq), 0) FROM change_log", tx=tx)
+    return max(newest, get_cursor(_HORIZON, tx=tx) or 0)
+
+
+def changes_since(seq, tables=None, limit=CHANGE_BATCH_SIZE, tx=None):
+    """Up to `limit` changes with seq > `seq`, oldest first, optionally only for `tables`."""
+    params = {"seq": seq, "limit": int(limit)}
+    sql = "SELECT seq, table_name, row_id, op, client_id FROM change_log WHERE seq > :seq"
+    if tables:
+        names = ", ".join(f":t{i}" for i in range(len(tables)))
+        sql += f" AND table_name IN ({names})"
+        params.update({f"t{i}": table for i, table in enumerate(tables)})
+    return [Change(*row) for row in fetch_all(sql + " ORDER BY seq LIMIT :limit", params, tx=tx)]
+
+
+def get_cursor(consumer, tx=None):
+    """Last seq processed by `consumer`, or None if it never ran."""
+    return fetch_scalar("SELECT seq FROM change_cursors WHERE consumer = :consumer", {"consumer": consumer}, tx=tx)
+
+
+def set_cursor(consumer, seq, tx=None):
+    execute("""
+        INSERT INTO change_cursors (consumer, seq, updated_at) VALUES (:consumer, :seq, CURRENT_TIMESTAMP)
+        ON CONFLICT (consumer) DO UPDATE SET seq = excluded.seq, updated_at = excluded.updated_at
+    """, {"consumer": consumer, "seq": seq}, tx=tx)
+
+
+def consume(consumer, handler, tables=None, batch_size=CHANGE_BATCH_SIZE):
+    """Feeds `handler` the changes since `consumer`'s cursor, batch by batch, advancing
+    the cursor after each batch it handles without raising (at-least-once delivery).
+
+    A consumer that never ran, or fell behind an age-based compaction, first gets
+    handler(None) and should rebuild its state from the source tables.
+    Returns the number of changes handled.
+    """
+    cursor = get_cursor(consumer)
+    horizon = get_cursor(_HORIZON) or 0
+    if cursor is None or cursor < horizon:
+        # Changes made while rebuilding are delivered again afterwards
+        start = latest_seq()
+        handler(None)
+        set_cursor(consumer, start)
+        cursor = start
+    handled = 0
+    while True:
+        changes = changes_since(cursor, tables, batch_size)
+        if not changes:
+            # Skip past other tables' changes so the next run starts from here
+            newest = latest_seq()
+            if newest > cursor:
+                set_cursor(consumer, newest)
+            return handled
+        handler(changes)
+        cursor = changes[-1].seq
+        set_cursor(consumer, cursor)
+        handled += len(changes)
+
+
+def compact_change_log(max_age_hours=CHANGE_LOG_MAX_AGE_HOURS):
+    """Deletes fully consumed and expired change_log rows. Returns rows removed.
+
+    Every entry is kept (op and client_id included) until removed here. Removing
+    moves the _compacted horizon past the deleted rows, so readers without a
+    cursor (sync_caches in other processes) see that they may have missed some.
+    """
+    with transaction() as tx:
+        # The database computes the cutoff with the clock and zone that stamped ts (Postgres
+        # stores the session's local time in the TIMESTAMP column, SQLite UTC text)
+        if tx.dialect.is_postgres:
+            cutoff = "CURRENT_TIMESTAMP - :hours * INTERVAL '1 hour'"
+        else:
+            cutoff = "datetime('now', '-' || :hours || ' hours')"
+        consumed = fetch_scalar("SELECT MIN(seq) FROM change_cursors WHERE consumer <> :horizon", {"horizon": _HORIZON}, tx=tx)
+        expired = fetch_scalar(f"SELECT MAX(seq) FROM change_log WHERE ts < {cutoff}", {"hours": max_age_hours}, tx=tx)
+        upto = max(consumed or 0, expired or 0)
+        if not upto:
+            return 0
+        removed = execute("DELETE FROM change_log WHERE seq <= :seq", {"seq": upto}, tx=tx)
+        if removed:
+            set_cursor(_HORIZON, max(upto, get_cursor(_HORIZON, tx=tx) or 0), tx=tx)
+    return removed
+
+
+def sync_caches(min_interval=CHANGE_SYNC_INTERVAL):
+    """Invalidates this process' reference cache and debtor bundles for changes made
+    by other processes (scripts, other app instances). Cheap enough to call on every
+    rerun: it queries at most every `min_interval` seconds and compacts the log hourly.
+    """
+    from src.cache import invalidate
+    from src.debtor_bundle import touch_debtor
+
+    now = time.monotonic()
+    if now - _sync_state["synced_at"] < min_interval or not _sync_lock.acquire(blocking=False):
+        return
+    try:
+        _sync_state["synced_at"] = now
+        if _sync_state["seq"] is None:
+            # Caches are filled from here on; nothing older can be in them
+            _sync_state["seq"] = latest_seq()
+            return
+        horizon = get_cursor(_HORIZON) or 0
+        if _sync_state["seq"] < horizon:
+            # Entries we hadn't seen were compacted away; drop everything
+            invalidate()
+            touch_debtor()
+            _sync_state["seq"] = horizon
+        while True:
+            changes = changes_since(_sync_state["seq"])
+            if not changes:
+                break
+            tables = {change.table_name for change in changes}
+            invalidate(*tables)
+            if tables & {"debtors", "debts", "agreements", "payments", "legal_expenses", "judicial_processes",
+                         "guarantors", "addresses", "contact_history", "clients"}:
+                touch_debtor()
+            _sync_state["seq"] = changes[-1].seq
+        if now - _sync_state["compacted_at"] >= COMPACT_INTERVAL:
+            _sync_state["compacted_at"] = now
+            compact_change_log()
+    except Exception as e:
+        print(f"Change log sync failed: {e}")
+    finally:
+        _sync_lock.release()
+
+
+def sync_kpi_summary():
+    """Consumer "kpi_summary": recounts kpi_summary for the clients whose debtors,
+    debts, agreements or payments changed (repairs drift from writes that bypass
+    src.database). Returns the number of changes handled."""
+    from src.database import refresh_kpi_summary
+
+    def handle(changes):
+        if changes is None:
+            refresh_kpi_summary()
+            return
+        for client_id in {change.client_id for change in changes if change.client_id is not None}:
+            refresh_kpi_summary(client_id)
+
+    return consume("kpi_summary", handle, tables=("debtors", "debts", "agreements", "payments"))
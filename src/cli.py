@@ -0,0 +1,164 @@
+"""Command line for batch work without Streamlit (cron, month-end runs):
+
+    python -m credminer revalue --date 2025-12-31 --out reavaliacao.csv
+    python -m credminer import planilha.csv --client 1
+    python -m credminer export carteira.parquet --valuation
+    python -m credminer indices refresh
+    python -m credminer reports build --client 1 --out memorias.zip
+    python -m credminer bench jobs
+
+It calls the same services as the app (importer, export, reports, services) on
+the same database (src.config). Streamlit is never imported, and each command
+imports only what it uses, so a cron run starts in well under a second;
+revalue and reports build spread the work over --processes (default: all CPUs).
+"""
+import argparse
+import os
+import sys
+from datetime import date
+
+DEFAULT_PROCESSES = os.cpu_count() or 1
+
+
+def _progress(label):
+    return lambda done, total=None: print(f"\r{done:,}" + (f" de {total:,}" if total else "") + f" {label}",
+                                         end="", flush=True)
+
+
+def _revalue(args):
+    from src.reports import revalue_portfolio
+    stats = revalue_portfolio(args.out, client_id=args.client, calc_date=args.date, processes=args.processes,
+                              progress=_progress("dívidas"))
+    print(f"\r{stats['debts']:,} dívidas em {stats['seconds']:.1f} s ({stats['debts_per_sec']:,.0f} dívidas/s, "
+          f"{args.processes} processos)" + (f" -> {args.out}" if args.out else ""))
+    if stats['failed']:
+        print(f"{stats['failed']:,} dívidas sem cálculo (ver mensagens acima)")
+    print(f"{'cliente':>8} {'dívidas':>9} {'original':>16} {'corrigido':>16} {'juros':>16} {'multa':>14} {'total':>16}")
+    rows = sorted(stats['by_client'].items()) + [("total", {"debts": stats['debts'], **stats})]
+    for client_id, sums in rows:
+        print(f"{client_id:>8} {sums['debts']:>9,} {sums['original']:>16,.2f} {sums['corrected']:>16,.2f} "
+              f"{sums['interest']:>16,.2f} {sums['fine']:>14,.2f} {sums['total']:>16,.2f}")
+
+
+def _import(args):
+    from src.importer import CHUNK_SIZE, import_debtors, rejects_to_csv
+    result = import_debtors(args.path, args.client, chunk_size=args.chunk_size or CHUNK_SIZE, progress=_progress("linhas"))
+    print(f"\r{result['rows']:,} linhas em {result['seconds']:.1f} s ({result['rows_per_sec']:,.0f} linhas/s): "
+          f"{result['debtors_created']:,} devedores novos, {result['debtors_existing']:,} já existiam, "
+          f"{result['debts_created']:,} dívidas, {len(result['rejects']):,} rejeitadas")
+    if result['rejects']:
+        rejects = args.rejects or os.path.splitext(args.path)[0] + "_rejeicoes.csv"
+        with open(rejects, "wb") as f:
+            f.write(rejects_to_csv(result['rejects']))
+        print(f"Rejeições -> {rejects}")
+
+
+def _export(args):
+    from src.export import FORMATS, export_portfolio
+    fmt = os.path.splitext(args.path)[1].lstrip('.').lower()
+    if fmt not in FORMATS:
+        print(f"Extensão deve ser uma de: {', '.join(FORMATS)}")
+        return 2
+    stats = export_portfolio(args.path, fmt, client_id=args.client, valuation=args.valuation,
+                             calc_date=args.date, progress=_progress("linhas"))
+    print(f"\r{stats['rows']:,} linhas em {stats['seconds']:.1f} s ({stats['rows_per_sec']:,.0f} linhas/s) -> {args.path}")
+
+
+def _indices_refresh(args):
+    from src.bootstrap import _load_indices, bootstrap_status
+    from src.services import update_all_indices
+    update_all_indices()
+    _load_indices()
+    indices = bootstrap_status()['indices']
+    print(f"Índices atualizados; leitura: {indices}")
+    return 0 if indices == "loaded" else 1
+
+
+def _reports_build(args):
+    from src.reports import write_debt_memories
+    out = args.out or f"memorias_{args.date or date.today():%Y%m%d}.zip"
+    stats = write_debt_memories(out, client_id=args.client, calc_date=args.date, processes=args.processes,
+                                progress=_progress("devedores"))
+    print(f"\r{stats['pdfs']:,} PDFs ({stats['debtors']:,} devedores) em {stats['seconds']:.1f} s "
+          f"({args.processes} processos) -> {out}")
+
+
+def _bench(args):
+    from src.benchmarks import BENCHMARKS
+    unknown = [n for n in args.names if n not in BENCHMARKS]
+    if unknown:
+        print('Unknown benchmark(s):', ', '.join(unknown))
+        print('Available:', ', '.join(BENCHMARKS))
+        return 2
+    for name in args.names or list(BENCHMARKS):
+        print(f'== {name} ==')
+        BENCHMARKS[name]()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m credminer",
+                                     description="Operações em lote do CredMiner HB, sem a interface.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_client(command):
+        command.add_argument('--client', type=int, help='somente este cliente')
+
+    def add_date(command):
+        command.add_argument('--date', type=date.fromisoformat, help='data do cálculo (AAAA-MM-DD; padrão: hoje)')
+
+    def add_processes(command):
+        command.add_argument('--processes', type=int, default=DEFAULT_PROCESSES,
+                             help=f'processos de cálculo (padrão: {DEFAULT_PROCESSES}, um por CPU)')
+
+    revalue = commands.add_parser('revalue', help='reavalia a carteira (correção, juros, multa) numa data')
+    add_client(revalue)
+    add_date(revalue)
+    revalue.add_argument('--out', help='CSV com uma linha por dívida')
+    add_processes(revalue)
+    revalue.set_defaults(handler=_revalue)
+
+    import_ = commands.add_parser('import', help='importa devedores e dívidas de um CSV/XLSX')
+    import_.add_argument('path', help='planilha CSV ou XLSX')
+    import_.add_argument('--client', type=int, required=True, help='cliente que recebe os devedores')
+    import_.add_argument('--chunk-size', type=int, help='linhas por transação (padrão: 5000)')
+    import_.add_argument('--rejects', help='arquivo do relatório de rejeições (padrão: <planilha>_rejeicoes.csv)')
+    import_.set_defaults(handler=_import)
+
+    export = commands.add_parser('export', help='exporta a carteira em CSV, XLSX ou Parquet')
+    export.add_argument('path', help='arquivo de saída; o formato vem da extensão')
+    add_client(export)
+    export.add_argument('--valuation', action='store_true', help='inclui valor corrigido, juros, multa e total')
+    add_date(export)
+    export.set_defaults(handler=_export)
+
+    indices = commands.add_parser('indices', help='índices financeiros').add_subparsers(dest="action", required=True)
+    indices.add_parser('refresh', help='baixa os índices (SELIC, IPCA...) e confere a leitura').set_defaults(handler=_indices_refresh)
+
+    reports = commands.add_parser('reports', help='relatórios em lote').add_subparsers(dest="action", required=True)
+    build = reports.add_parser('build', help='memórias de cálculo em PDF, uma por devedor, num ZIP')
+    add_client(build)
+    add_date(build)
+    build.add_argument('--out', help='arquivo ZIP (padrão: memorias_<data>.zip)')
+    add_processes(build)
+    build.set_defaults(handler=_reports_build)
+
+    bench = commands.add_parser('bench', help='micro-benchmarks (src/benchmarks.py)')
+    bench.add_argument('names', nargs='*', help='quais rodar (padrão: todos)')
+    bench.set_defaults(handler=_bench)
+    return parser
+
+
+def main(argv=None):
+    """Runs one command; returns the process exit code."""
+    args = build_parser().parse_args(argv)
+    if args.command != "bench":  # benchmarks use throwaway databases
+        from src.database import init_db
+        init_db()
+    try:
+        return args.handler(args) or 0
+    except KeyboardInterrupt:
+        print("\nInterrompido.", file=sys.stderr)
+        return 130
+    except ValueError as e:
+        print(f"\nErro: {e}", file=sys.stderr)
+        return 1
@@ -1,15 +1,43 @@
 import os
+import sys
+
+
+def _database_secrets():
+    """The [database] table of Streamlit's secrets.toml (cloud deployment), or None.
+
+    Inside the app it comes from st.secrets. The CLI, scripts and job workers never
+    import Streamlit (it costs them start-up time), so they read the same files
+    (.streamlit/secrets.toml here, then in the home directory) themselves.
+    """
+    st = sys.modules.get("streamlit")
+    if st is not None:
+        try:
+            return st.secrets["database"]
+        except (KeyError, FileNotFoundError, AttributeError):
+            return None
+    try:
+        import tomllib
+    except ImportError:  # Python < 3.11
+        return None
+    for path in (os.path.join(".streamlit", "secrets.toml"), os.path.join(os.path.expanduser("~"), ".streamlit", "secrets.toml")):
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                secrets = tomllib.load(f)
+            if "database" in secrets:
+                return secrets["database"]
+    return None
+
 
 # Try Streamlit secrets first (for cloud deployment)
+_secrets = _database_secrets()
 try:
-    import streamlit as st
-    USE_SUPABASE = st.secrets["database"]["USE_SUPABASE"].lower() == "true"
-    SUPABASE_HOST = st.secrets["database"]["SUPABASE_HOST"]
-    SUPABASE_PORT = st.secrets["database"]["SUPABASE_PORT"]
-    SUPABASE_DB = st.secrets["database"]["SUPABASE_DB"]
-    SUPABASE_USER = st.secrets["database"]["SUPABASE_USER"]
-    SUPABASE_PASSWORD = st.secrets["database"]["SUPABASE_PASSWORD"]
-except (KeyError, FileNotFoundError, AttributeError):
+    USE_SUPABASE = _secrets["USE_SUPABASE"].lower() == "true"
+    SUPABASE_HOST = _secrets["SUPABASE_HOST"]
+    SUPABASE_PORT = _secrets["SUPABASE_PORT"]
+    SUPABASE_DB = _secrets["SUPABASE_DB"]
+    SUPABASE_USER = _secrets["SUPABASE_USER"]
+    SUPABASE_PASSWORD = _secrets["SUPABASE_PASSWORD"]
+except (KeyError, TypeError, AttributeError):
     # Fallback to environment variables (local dev)
     from dotenv import load_dotenv
     load_dotenv()
@@ -22,3 +50,50 @@ except (KeyError, FileNotFoundError, AttributeError):
 
 # Local SQLite Configuration
 SQLITE_DB_PATH = os.path.join("data", "debtors.db")
+# Connection profile (WAL journal is always on): lock wait, memory-mapped I/O and page cache
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE_MB = int(os.getenv("SQLITE_MMAP_SIZE_MB", "256"))
+SQLITE_CACHE_SIZE_MB = int(os.getenv("SQLITE_CACHE_SIZE_MB", "64"))
+
+# Supabase connection resilience (circuit breaker around the SQLite fallback)
+SUPABASE_CONNECT_TIMEOUT = int(os.getenv("SUPABASE_CONNECT_TIMEOUT", "5"))
+DB_BREAKER_FAILURE_THRESHOLD = int(os.getenv("DB_BREAKER_FAILURE_THRESHOLD", "1"))
+DB_BREAKER_RESET_SECONDS = float(os.getenv("DB_BREAKER_RESET_SECONDS", "60"))
+DB_HEALTH_PROBE_INTERVAL = float(os.getenv("DB_HEALTH_PROBE_INTERVAL", "15"))
+
+# Seconds reference data (clients, forums, kanban columns, petition templates) stays cached; 0 disables
+REFERENCE_CACHE_TTL = float(os.getenv("REFERENCE_CACHE_TTL", "300"))
+
+# Change log (CDC): hours entries are kept at most, and seconds between cache syncs from it
+CHANGE_LOG_MAX_AGE_HOURS = float(os.getenv("CHANGE_LOG_MAX_AGE_HOURS", "24"))
+CHANGE_SYNC_INTERVAL = float(os.getenv("CHANGE_SYNC_INTERVAL", "2"))
+
+# Dashboard KPIs: read the incrementally maintained kpi_summary table instead of aggregating live
+USE_KPI_SUMMARY = os.getenv("USE_KPI_SUMMARY", "true").lower() == "true"
+
+# Async data layer (src.async_query) for batch services: connections per event loop
+ASYNC_POOL_SIZE = int(os.getenv("ASYNC_POOL_SIZE", "10"))
+
+# Per-page rerun metrics (src.metrics): collected from start (can also be switched on in the
+# sidebar panel), optional export file (.jsonl: one line per rerun; else Prometheus text)
+# and the usernames that see the panel
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+METRICS_FILE = os.getenv("METRICS_FILE", "")
+METRICS_ADMINS = {name.strip() for name in os.getenv("METRICS_ADMINS", "admin").split(",") if name.strip()}
+
+# Slow query log (src.slow_queries): statements taking SLOW_QUERY_MS or more (negative = off),
+# the rotating log file, its size before rotating and rotated files kept, and seconds between
+# EXPLAINs of the same statement
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "250"))
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", os.path.join("data", "slow_queries.log"))
+SLOW_QUERY_LOG_MAX_MB = float(os.getenv("SLOW_QUERY_LOG_MAX_MB", "5"))
+SLOW_QUERY_LOG_BACKUPS = int(os.getenv("SLOW_QUERY_LOG_BACKUPS", "3"))
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "600"))
+
+# Background jobs (src.jobs): worker processes the app starts (0 = none; run scripts/job_worker.py
+# yourself), seconds an idle worker waits between polls, seconds between a running job's
+# heartbeats, and runs of a job whose worker died before it is marked failed
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "0.5"))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "10"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "2"))
@@ -0,0 +1,265 @@
+"""Database connection management.
+
+Hands out Supabase/Postgres connections when configured, falling back to the
+local SQLite file when Postgres is unreachable. The fallback decision is cached
+by a circuit breaker so an outage costs one connect timeout, not one per query.
+"""
+import os
+import sqlite3
+import threading
+import time
+from src.config import (
+    USE_SUPABASE, SUPABASE_HOST, SUPABASE_PORT, SUPABASE_DB, SUPABASE_USER, SUPABASE_PASSWORD,
+    SQLITE_DB_PATH, SQLITE_BUSY_TIMEOUT_MS, SQLITE_MMAP_SIZE_MB, SQLITE_CACHE_SIZE_MB,
+    SUPABASE_CONNECT_TIMEOUT, DB_BREAKER_FAILURE_THRESHOLD, DB_BREAKER_RESET_SECONDS,
+    DB_HEALTH_PROBE_INTERVAL
+)
+
+# PostgreSQL support (conditional)
+if USE_SUPABASE:
+    import psycopg2
+
+
+class Dialect:
+    """SQL flavour of a connection, so callers don't re-check driver types."""
+
+    def __init__(self, name, placeholder):
+        self.name = name
+        self.placeholder = placeholder
+
+    @property
+    def is_postgres(self):
+        return self.name == 'postgres'
+
+    @property
+    def is_sqlite(self):
+        return self.name == 'sqlite'
+
+    def __repr__(self):
+        return f"Dialect({self.name!r})"
+
+
+SQLITE = Dialect('sqlite', '?')
+POSTGRES = Dialect('postgres', '%s')
+
+
+def get_dialect(conn):
+    """Returns the Dialect of an open connection."""
+    return SQLITE if isinstance(conn, sqlite3.Connection) else POSTGRES
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker guarding an unreliable dependency.
+
+    closed:    requests go through; failures are counted.
+    open:      requests are refused until `reset_timeout` elapses; meanwhile the
+               background probe (a real request) closes it once one succeeds.
+    half_open: a single trial request is let through; its outcome closes
+               or re-opens the breaker.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=1, reset_timeout=60.0, probe=None, probe_interval=15.0):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.probe = probe
+        self.probe_interval = probe_interval
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._probe_thread = None
+        self.last_error = None
+        self.last_failure_at = None
+        self.last_success_at = None
+
+    @property
+    def state(self):
+        return self._state
+
+    def allow_request(self):
+        """Returns True if the caller may try the guarded dependency."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self._state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+            self.last_success_at = time.time()
+
+    def record_failure(self, error):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            self.last_error = str(error)
+            self.last_failure_at = time.time()
+            tripped = self._state != self.OPEN and (
+                self._state == self.HALF_OPEN or self._failures >= self.failure_threshold
+            )
+            if tripped:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+        if tripped:
+            print(f"Warning: {self.name} unavailable, circuit opened (falling back to SQLite):", error)
+            self._start_probe()
+
+    def _start_probe(self):
+        if self.probe is None:
+            return
+        with self._lock:
+            if self._probe_thread is not None and self._probe_thread.is_alive():
+                return
+            self._probe_thread = threading.Thread(
+                target=self._probe_loop, name=f"{self.name}-health-probe", daemon=True
+            )
+            self._probe_thread.start()
+
+    def _probe_loop(self):
+        """Polls the dependency while open; a successful probe is a successful trial
+        request, so it closes the breaker (current_dialect() only trusts CLOSED)."""
+        while True:
+            time.sleep(self.probe_interval)
+            with self._lock:
+                if self._state == self.CLOSED:
+                    return
+            try:
+                self.probe()
+            except Exception as e:
+                with self._lock:
+                    self.last_error = str(e)
+                continue
+            self.record_success()
+            return
+
+    def snapshot(self):
+        """Returns the breaker state as a plain dict (for display/diagnostics)."""
+        with self._lock:
+            open_for = time.monotonic() - self._opened_at if self._opened_at is not None else None
+            return {
+                "name": self.name,
+                "state": self._state,
+                "failures": self._failures,
+                "open_for_seconds": open_for,
+                "last_error": self.last_error,
+                "last_failure_at": self.last_failure_at,
+                "last_success_at": self.last_success_at,
+                "probe_running": self._probe_thread is not None and self._probe_thread.is_alive(),
+            }
+
+
+def _connect_postgres():
+    return psycopg2.connect(
+        host=SUPABASE_HOST,
+        port=SUPABASE_PORT,
+        database=SUPABASE_DB,
+        user=SUPABASE_USER,
+        password=SUPABASE_PASSWORD,
+        connect_timeout=SUPABASE_CONNECT_TIMEOUT
+    )
+
+
+def _probe_postgres():
+    conn = _connect_postgres()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1")
+        cursor.fetchone()
+    finally:
+        conn.close()
+
+
+# Applied to every SQLite connection. WAL lets readers run alongside the (single)
+# writer; NORMAL sync is durable in WAL except for the last commits on power loss.
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",
+    "PRAGMA foreign_keys=ON",
+    f"PRAGMA mmap_size={SQLITE_MMAP_SIZE_MB * 1024 * 1024}",
+    f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_MB * 1024}",
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+def configure_sqlite(conn):
+    """Applies SQLITE_PRAGMAS to a connection and returns it."""
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def _connect_sqlite(path=SQLITE_DB_PATH):
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    # Connections may be handed between Streamlit threads by the query-layer pool;
+    # the pool guarantees a connection is only used by one thread at a time.
+    conn = sqlite3.connect(path, check_same_thread=False, cached_statements=256,
+                           timeout=SQLITE_BUSY_TIMEOUT_MS / 1000)
+    return configure_sqlite(conn)
+
+
+supabase_breaker = CircuitBreaker(
+    "Supabase/Postgres",
+    failure_threshold=DB_BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=DB_BREAKER_RESET_SECONDS,
+    probe=_probe_postgres,
+    probe_interval=DB_HEALTH_PROBE_INTERVAL,
+)
+
+
+def try_postgres():
+    """A Postgres connection if configured and the breaker lets the request through, else None.
+
+    While the breaker is half-open this is its trial request: the outcome closes
+    or re-opens it.
+    """
+    if USE_SUPABASE and supabase_breaker.allow_request():
+        try:
+            conn = _connect_postgres()
+        except Exception as e:
+            supabase_breaker.record_failure(e)
+        else:
+            supabase_breaker.record_success()
+            return conn
+    return None
+
+
+def get_connection():
+    """Returns a connection to the database (SQLite or PostgreSQL based on config)."""
+    conn = try_postgres()
+    if conn is not None:
+        return conn
+    # SQLite connection (configured backend, or fallback while the breaker is open)
+    return _connect_sqlite()
+
+
+def current_dialect():
+    """Dialect that get_connection() would hand out right now."""
+    if USE_SUPABASE and supabase_breaker.state == CircuitBreaker.CLOSED:
+        return POSTGRES
+    return SQLITE
+
+
+def get_connection_status():
+    """Backend/breaker summary for the Settings integrity check."""
+    return {
+        "configured_backend": "postgres" if USE_SUPABASE else "sqlite",
+        "active_dialect": current_dialect().name,
+        "breaker": supabase_breaker.snapshot() if USE_SUPABASE else None,
+    }
@@ -1,571 +1,47 @@
-import sqlite3
-import os
+import threading
 import bcrypt
-from src.config import USE_SUPABASE, SUPABASE_HOST, SUPABASE_PORT, SUPABASE_DB, SUPABASE_USER, SUPABASE_PASSWORD, SQLITE_DB_PATH
-import pandas as pd
-
-# PostgreSQL support (conditional)
-if USE_SUPABASE:
-    import psycopg2
-    from psycopg2.extras import RealDictCursor
-
-def get_connection():
-    """Returns a connection to the database (SQLite or PostgreSQL based on config)."""
-    if USE_SUPABASE:
-        # Try PostgreSQL connection; if it fails, fall back to local SQLite so the UI can still run.
-        try:
-            return psycopg2.connect(
-                host=SUPABASE_HOST,
-                port=SUPABASE_PORT,
-                database=SUPABASE_DB,
-                user=SUPABASE_USER,
-                password=SUPABASE_PASSWORD
-            )
-        except Exception as e:
-            print("Warning: could not connect to Supabase/Postgres (falling back to SQLite):", e)
-            # Fall back to SQLite to keep the app usable in local development
-            if not os.path.exists("data"):
-                os.makedirs("data")
-            return sqlite3.connect(SQLITE_DB_PATH)
-    else:
-        # SQLite connection
-        if not os.path.exists("data"):
-            os.makedirs("data")
-        return sqlite3.connect(SQLITE_DB_PATH)
+from src.connection import get_connection, get_dialect, current_dialect
+from src.cache import reference_cache, invalidate
+from src.config import USE_KPI_SUMMARY
+from src.debtor_bundle import touch_debtor
+from src.migrations import run_migrations, KPI_SUMMARY_REFRESH_SQL
+from src.validators import document_digits
+from src.query import execute, executemany, insert, fetch_all, fetch_one, fetch_scalar, read_df, transaction
+
+_initialized_dialects = set()
+_init_lock = threading.Lock()
+
 
 def init_db():
-    """Initializes the database with necessary tables."""
-    conn = get_connection()
-    cursor = conn.cursor()
+    """Brings the schema up to date and seeds defaults, once per process and backend.
 
-    if USE_SUPABASE:
-        # PostgreSQL Table Definitions
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS clients (
-                id SERIAL PRIMARY KEY,
-                name TEXT NOT NULL,
-                cnpj TEXT UNIQUE,
-                email TEXT,
-                phone TEXT,
-                address TEXT,
-                main_forum TEXT,
-                jurisdiction_state TEXT,
-                notes TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS client_forums (
-                id SERIAL PRIMARY KEY,
-                client_id INTEGER NOT NULL,
-                forum_name TEXT NOT NULL,
-                forum_code TEXT,
-                state TEXT,
-                city TEXT,
-                is_main BOOLEAN DEFAULT false,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (client_id) REFERENCES clients (id) ON DELETE CASCADE,
-                UNIQUE(client_id, forum_code)
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id SERIAL PRIMARY KEY,
-                username TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                client_id INTEGER REFERENCES clients (id) ON DELETE SET NULL
-            )
-        ''')
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS debtors (
-                id SERIAL PRIMARY KEY,
-                client_id INTEGER NOT NULL,
-                name TEXT NOT NULL,
-                cpf_cnpj TEXT,
-                rg TEXT,
-                email TEXT,
-                phone TEXT,
-                notes TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (client_id) REFERENCES clients (id) ON DELETE CASCADE
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS contact_history (
-                id SERIAL PRIMARY KEY,
-                debtor_id INTEGER NOT NULL,
-                client_id INTEGER NOT NULL,
-                contact_type TEXT NOT NULL,
-                contact_value TEXT NOT NULL,
-                status TEXT DEFAULT 'ativo',
-                notes TEXT,
-                attempt_date DATE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (debtor_id) REFERENCES debtors (id) ON DELETE CASCADE,
-                FOREIGN KEY (client_id) REFERENCES clients (id) ON DELETE CASCADE
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS guarantors (
-                id SERIAL PRIMARY KEY,
-                debtor_id INTEGER NOT NULL,
-                client_id INTEGER NOT NULL,
-                name TEXT NOT NULL,
-                cpf TEXT,
-                rg TEXT,
-                email TEXT,
-                phone TEXT,
-                notes TEXT,
-                FOREIGN KEY (debtor_id) REFERENCES debtors (id) ON DELETE CASCADE,
-                FOREIGN KEY (client_id) REFERENCES clients (id) ON DELETE CASCADE
-            )
-        ''')
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS addresses (
-                id SERIAL PRIMARY KEY,
-                debtor_id INTEGER,
-                guarantor_id INTEGER,
-                client_id INTEGER NOT NULL,
-                cep TEXT,
-                street TEXT,
-                number TEXT,
-                neighborhood TEXT,
-                city TEXT,
-                state TEXT,
-                is_primary BOOLEAN DEFAULT false,
-                FOREIGN KEY (debtor_id) REFERENCES debtors (id) ON DELETE CASCADE,
-                FOREIGN KEY (guarantor_id) REFERENCES guarantors (id) ON DELETE CASCADE,
-                FOREIGN KEY (client_id) REFERENCES clients (id) ON DELETE CASCADE
-            )
-        ''')
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS debts (
-                id SERIAL PRIMARY KEY,
-                debtor_id INTEGER NOT NULL,
-                client_id INTEGER NOT NULL,
-                contract_type TEXT NOT NULL,
-                description TEXT,
-                original_value NUMERIC NOT NULL,
-                due_date DATE NOT NULL,
-                fine_type TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (debtor_id) REFERENCES debtors (id) ON DELETE CASCADE,
-                FOREIGN KEY (client_id) REFERENCES clients (id) ON DELETE CASCADE
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS legal_expenses (
-                id SERIAL PRIMARY KEY,
-                debtor_id INTEGER NOT NULL,
-                client_id INTEGER NOT NULL,
-                description TEXT NOT NULL,
-                value NUMERIC NOT NULL,
-                date DATE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (debtor_id) REFERENCES debtors (id) ON DELETE CASCADE,
-                FOREIGN KEY (client_id) REFERENCES clients (id) ON DELETE CASCADE
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS agreements (
-                id SERIAL PRIMARY KEY,
-                debtor_id INTEGER NOT NULL,
-                client_id INTEGER NOT NULL,
-                debt_id INTEGER,
-                status TEXT DEFAULT 'active',
-                agreement_date DATE NOT NULL,
-                agreed_value NUMERIC NOT NULL,
-                total_installments INTEGER DEFAULT 1,
-                installment_value NUMERIC,
-                interest_rate NUMERIC DEFAULT 0,
-                first_installment_date DATE,
-                notes TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (debtor_id) REFERENCES debtors (id) ON DELETE CASCADE,
-                FOREIGN KEY (client_id) REFERENCES clients (id) ON DELETE CASCADE,
-                FOREIGN KEY (debt_id) REFERENCES debts (id) ON DELETE SET NULL
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS payments (
-                id SERIAL PRIMARY KEY,
-                agreement_id INTEGER,
-                debt_id INTEGER,
-                debtor_id INTEGER NOT NULL,
-                client_id INTEGER NOT NULL,
-                payment_date DATE NOT NULL,
-                amount NUMERIC NOT NULL,
-                installment_number INTEGER,
-                payment_method TEXT,
-                notes TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (agreement_id) REFERENCES agreements (id) ON DELETE SET NULL,
-                FOREIGN KEY (debt_id) REFERENCES debts (id) ON DELETE SET NULL,
-                FOREIGN KEY (debtor_id) REFERENCES debtors (id) ON DELETE CASCADE,
-                FOREIGN KEY (client_id) REFERENCES clients (id) ON DELETE CASCADE
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS judicial_processes (
-                id SERIAL PRIMARY KEY,
-                debtor_id INTEGER NOT NULL,
-                client_id INTEGER NOT NULL,
-                debt_id INTEGER,
-                process_type TEXT NOT NULL,
-                process_number TEXT UNIQUE,
-                forum_id INTEGER,
-                vara TEXT,
-                distribution_date DATE,
-                status TEXT DEFAULT 'ativo',
-                description TEXT,
-                notes TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (debtor_id) REFERENCES debtors (id) ON DELETE CASCADE,
-                FOREIGN KEY (client_id) REFERENCES clients (id) ON DELETE CASCADE,
-                FOREIGN KEY (debt_id) REFERENCES debts (id) ON DELETE SET NULL,
-                FOREIGN KEY (forum_id) REFERENCES client_forums (id) ON DELETE SET NULL
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS petition_templates (
-                id SERIAL PRIMARY KEY,
-                name TEXT NOT NULL,
-                process_type TEXT NOT NULL,
-                description TEXT,
-                template_content TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS judicial_petitions (
-                id SERIAL PRIMARY KEY,
-                process_id INTEGER NOT NULL,
-                petition_type TEXT NOT NULL,
-                template_id INTEGER,
-                petition_date DATE,
-                status TEXT DEFAULT 'rascunho',
-                content TEXT,
-                notes TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (process_id) REFERENCES judicial_processes (id) ON DELETE CASCADE,
-                FOREIGN KEY (template_id) REFERENCES petition_templates (id) ON DELETE SET NULL
-            )
-        ''')
-
-        # Kanban / Board for simple task tracking
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS kanban_cards (
-                id SERIAL PRIMARY KEY,
-                title TEXT NOT NULL,
-                description TEXT,
-                status TEXT DEFAULT 'todo',
-                order_index INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS kanban_columns (
-                id SERIAL PRIMARY KEY,
-                name TEXT NOT NULL,
-                order_index INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-    else:
-        # SQLite Table Definitions (original)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS clients (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                cnpj TEXT UNIQUE,
-                email TEXT,
-                phone TEXT,
-                address TEXT,
-                main_forum TEXT,
-                jurisdiction_state TEXT,
-                notes TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS client_forums (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                client_id INTEGER NOT NULL,
-                forum_name TEXT NOT NULL,
-                forum_code TEXT,
-                state TEXT,
-                city TEXT,
-                is_main INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (client_id) REFERENCES clients (id),
-                UNIQUE(client_id, forum_code)
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                client_id INTEGER REFERENCES clients (id)
-            )
-        ''')
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS debtors (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                client_id INTEGER NOT NULL,
-                name TEXT NOT NULL,
-                cpf_cnpj TEXT,
-                rg TEXT,
-                email TEXT,
-                phone TEXT,
-                notes TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (client_id) REFERENCES clients (id)
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS contact_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                debtor_id INTEGER NOT NULL,
-                client_id INTEGER NOT NULL,
-                contact_type TEXT NOT NULL,
-                contact_value TEXT NOT NULL,
-                status TEXT DEFAULT 'ativo',
-                notes TEXT,
-                attempt_date TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (debtor_id) REFERENCES debtors (id),
-                FOREIGN KEY (client_id) REFERENCES clients (id)
-            )
-        ''')
-        
-        # Check if RG column exists (for migration)
-        cursor.execute("PRAGMA table_info(debtors)")
-        columns = [info[1] for info in cursor.fetchall()]
-        if 'rg' not in columns:
-            cursor.execute("ALTER TABLE debtors ADD COLUMN rg TEXT")
-            print("Migrated: Added 'rg' column to debtors.")
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS guarantors (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                debtor_id INTEGER NOT NULL,
-                client_id INTEGER NOT NULL,
-                name TEXT NOT NULL,
-                cpf TEXT,
-                rg TEXT,
-                email TEXT,
-                phone TEXT,
-                notes TEXT,
-                FOREIGN KEY (debtor_id) REFERENCES debtors (id),
-                FOREIGN KEY (client_id) REFERENCES clients (id)
-            )
-        ''')
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS addresses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                debtor_id INTEGER,
-                guarantor_id INTEGER,
-                client_id INTEGER NOT NULL,
-                cep TEXT,
-                street TEXT,
-                number TEXT,
-                neighborhood TEXT,
-                city TEXT,
-                state TEXT,
-                is_primary BOOLEAN DEFAULT 0,
-                FOREIGN KEY (debtor_id) REFERENCES debtors (id),
-                FOREIGN KEY (guarantor_id) REFERENCES guarantors (id),
-                FOREIGN KEY (client_id) REFERENCES clients (id)
-            )
-        ''')
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS debts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                debtor_id INTEGER NOT NULL,
-                client_id INTEGER NOT NULL,
-                contract_type TEXT NOT NULL,
-                description TEXT,
-                original_value REAL NOT NULL,
-                due_date TEXT NOT NULL,
-                fine_type TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (debtor_id) REFERENCES debtors (id),
-                FOREIGN KEY (client_id) REFERENCES clients (id)
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS legal_expenses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                debtor_id INTEGER NOT NULL,
-                client_id INTEGER NOT NULL,
-                description TEXT NOT NULL,
-                value REAL NOT NULL,
-                date TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (debtor_id) REFERENCES debtors (id),
-                FOREIGN KEY (client_id) REFERENCES clients (id)
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS agreements (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                debtor_id INTEGER NOT NULL,
-                client_id INTEGER NOT NULL,
-                debt_id INTEGER,
-                status TEXT DEFAULT 'active',
-                agreement_date TEXT NOT NULL,
-                agreed_value REAL NOT NULL,
-                total_installments INTEGER DEFAULT 1,
-                installment_value REAL,
-                interest_rate REAL DEFAULT 0,
-                first_installment_date TEXT,
-                notes TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (debtor_id) REFERENCES debtors (id),
-                FOREIGN KEY (client_id) REFERENCES clients (id),
-                FOREIGN KEY (debt_id) REFERENCES debts (id)
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS payments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                agreement_id INTEGER,
-                debt_id INTEGER,
-                debtor_id INTEGER NOT NULL,
-                client_id INTEGER NOT NULL,
-                payment_date TEXT NOT NULL,
-                amount REAL NOT NULL,
-                installment_number INTEGER,
-                payment_method TEXT,
-                notes TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (agreement_id) REFERENCES agreements (id),
-                FOREIGN KEY (debt_id) REFERENCES debts (id),
-                FOREIGN KEY (debtor_id) REFERENCES debtors (id),
-                FOREIGN KEY (client_id) REFERENCES clients (id)
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS judicial_processes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                debtor_id INTEGER NOT NULL,
-                client_id INTEGER NOT NULL,
-                debt_id INTEGER,
-                process_type TEXT NOT NULL,
-                process_number TEXT UNIQUE,
-                forum_id INTEGER,
-                vara TEXT,
-                distribution_date TEXT,
-                status TEXT DEFAULT 'ativo',
-                description TEXT,
-                notes TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (debtor_id) REFERENCES debtors (id),
-                FOREIGN KEY (client_id) REFERENCES clients (id),
-                FOREIGN KEY (debt_id) REFERENCES debts (id),
-                FOREIGN KEY (forum_id) REFERENCES client_forums (id)
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS petition_templates (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                process_type TEXT NOT NULL,
-                description TEXT,
-                template_content TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS judicial_petitions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                process_id INTEGER NOT NULL,
-                petition_type TEXT NOT NULL,
-                template_id INTEGER,
-                petition_date TEXT,
-                status TEXT DEFAULT 'rascunho',
-                content TEXT,
-                notes TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (process_id) REFERENCES judicial_processes (id),
-                FOREIGN KEY (template_id) REFERENCES petition_templates (id)
-            )
-        ''')
-
-        # Kanban / Board for simple task tracking
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS kanban_cards (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT NOT NULL,
-                description TEXT,
-                status TEXT DEFAULT 'todo',
-                order_index INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS kanban_columns (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                order_index INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-    
-    conn.commit()
-    conn.close()
-    # Seed in-memory petition templates into the DB if table is empty
-    try:
-        seed_default_petition_templates()
-    except Exception:
-        pass
-    create_default_admin()
+    Streamlit calls this on every rerun; after the first call it is a set lookup.
+    """
+    dialect = current_dialect()
+    if dialect.name in _initialized_dialects:
+        return
+    with _init_lock:
+        if dialect.name in _initialized_dialects:
+            return
+        conn = get_connection()
+        try:
+            run_migrations(conn)
+            dialect = get_dialect(conn)
+        finally:
+            conn.close()
+        # Migrations may have changed reference tables behind the cache
+        invalidate()
+        # Seed in-memory petition templates into the DB if table is empty
+        try:
+            seed_default_petition_templates()
+        except Exception:
+            pass
+        create_default_admin()
+        _initialized_dialects.add(dialect.name)
 
 def create_default_admin():
     """Creates a default admin user if no users exist."""
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT count(*) FROM users')
-    count = cursor.fetchone()[0]
+    count = fetch_scalar('SELECT count(*) FROM users')
     
     if count == 0:
         # Create default admin: admin / admin
@@ -573,32 +49,19 @@ def create_default_admin():
         salt = bcrypt.gensalt()
         hashed = bcrypt.hashpw(password, salt)
         
-        # Determine placeholder style based on actual connection type
-        use_postgres_style = USE_SUPABASE and not isinstance(conn, sqlite3.Connection)
-        if use_postgres_style:
-            cursor.execute('INSERT INTO users (username, password_hash) VALUES (%s, %s)', ('admin', hashed.decode('utf-8')))
-        else:
-            cursor.execute('INSERT INTO users (username, password_hash) VALUES (?, ?)', ('admin', hashed.decode('utf-8')))
-        conn.commit()
+        execute('INSERT INTO users (username, password_hash) VALUES (:username, :password_hash)',
+                {'username': 'admin', 'password_hash': hashed.decode('utf-8')})
         print("Default admin user created.")
-    
-    conn.close()
 
 
+@reference_cache('petition_templates')
 def get_petition_templates(process_type=None):
-    """Return petition templates from DB filtered by process_type if provided."""
-    conn = get_connection()
-    cursor = conn.cursor()
-    # Choose parameter placeholder style based on actual connection type
-    use_postgres_style = USE_SUPABASE and not isinstance(conn, sqlite3.Connection)
+    """Return petition templates from DB (newest first) filtered by process_type if provided."""
+    query = 'SELECT id, name, process_type, description, template_content FROM petition_templates'
     if process_type:
-        query = 'SELECT id, name, process_type, description, template_content FROM petition_templates WHERE process_type = %s' if use_postgres_style else 'SELECT id, name, process_type, description, template_content FROM petition_templates WHERE process_type = ?'
-        cursor.execute(query, (process_type,))
+        rows = fetch_all(query + ' WHERE process_type = :process_type ORDER BY created_at DESC, id DESC', {'process_type': process_type})
     else:
-        query = 'SELECT id, name, process_type, description, template_content FROM petition_templates'
-        cursor.execute(query)
-    rows = cursor.fetchall()
-    conn.close()
+        rows = fetch_all(query + ' ORDER BY created_at DESC, id DESC')
     templates = []
     for row in rows:
         templates.append({
@@ -619,26 +82,20 @@ def seed_default_petition_templates():
     except Exception:
         return
 
-    conn = get_connection()
-    cursor = conn.cursor()
-    use_postgres_style = USE_SUPABASE and not isinstance(conn, sqlite3.Connection)
-    # Check if any templates exist
-    cursor.execute('SELECT count(*) FROM petition_templates')
-    count = cursor.fetchone()[0]
-    if count == 0:
-        # Insert defaults
-        for key, data in defaults.items():
-            # key is like 'inicial_juntada_custas'
-            process_type = key.split('_')[0]
-            name = data.get('name')
-            description = data.get('description')
-            template_content = data.get('content')
-            if use_postgres_style:
-                cursor.execute('INSERT INTO petition_templates (name, process_type, description, template_content) VALUES (%s, %s, %s, %s)', (name, process_type, description, template_content))
-            else:
-                cursor.execute('INSERT INTO petition_templates (name, process_type, description, template_content) VALUES (?, ?, ?, ?)', (name, process_type, description, template_content))
-        conn.commit()
-    conn.close()
+    with transaction() as tx:
+        # Check if any templates exist
+        count = fetch_scalar('SELECT count(*) FROM petition_templates', tx=tx)
+        if count == 0:
+            # Insert defaults
+            for key, data in defaults.items():
+                # key is like 'inicial_juntada_custas'
+                execute('INSERT INTO petition_templates (name, process_type, description, template_content) VALUES (:name, :process_type, :description, :template_content)', {
+                    'name': data.get('name'),
+                    'process_type': key.split('_')[0],
+                    'description': data.get('description'),
+                    'template_content': data.get('content'),
+                }, tx=tx)
+    invalidate('petition_templates')
 
 
 def list_judicial_processes(filters=None):
@@ -646,39 +103,26 @@ def list_judicial_processes(filters=None):
 
     Filters: dict keys may include client_id, process_type, status, forum_id, vara, distribution_date_from, distribution_date_to
     """
-    conn = get_connection()
-    cursor = conn.cursor()
-    use_postgres_style = USE_SUPABASE and not isinstance(conn, sqlite3.Connection)
     base_query = 'SELECT id, debtor_id, client_id, debt_id, process_type, process_number, forum_id, vara, distribution_date, status, description, notes FROM judicial_processes'
-    params = []
+    conditions = {
+        'client_id': 'client_id = :client_id',
+        'process_type': 'process_type = :process_type',
+        'status': 'status = :status',
+        'forum_id': 'forum_id = :forum_id',
+        'vara': 'vara = :vara',
+        'distribution_date_from': 'distribution_date >= :distribution_date_from',
+        'distribution_date_to': 'distribution_date <= :distribution_date_to',
+    }
+    params = {}
     if filters:
         clauses = []
-        if 'client_id' in filters and filters['client_id']:
-            clauses.append('client_id = %s' if use_postgres_style else 'client_id = ?')
-            params.append(filters['client_id'])
-        if 'process_type' in filters and filters['process_type']:
-            clauses.append('process_type = %s' if use_postgres_style else 'process_type = ?')
-            params.append(filters['process_type'])
-        if 'status' in filters and filters['status']:
-            clauses.append('status = %s' if use_postgres_style else 'status = ?')
-            params.append(filters['status'])
-        if 'forum_id' in filters and filters['forum_id']:
-            clauses.append('forum_id = %s' if use_postgres_style else 'forum_id = ?')
-            params.append(filters['forum_id'])
-        if 'vara' in filters and filters['vara']:
-            clauses.append('vara = %s' if use_postgres_style else 'vara = ?')
-            params.append(filters['vara'])
-        if 'distribution_date_from' in filters and filters['distribution_date_from']:
-            clauses.append('distribution_date >= %s' if use_postgres_style else 'distribution_date >= ?')
-            params.append(filters['distribution_date_from'])
-        if 'distribution_date_to' in filters and filters['distribution_date_to']:
-            clauses.append('distribution_date <= %s' if use_postgres_style else 'distribution_date <= ?')
-            params.append(filters['distribution_date_to'])
+        for key, clause in conditions.items():
+            if filters.get(key):
+                clauses.append(clause)
+                params[key] = filters[key]
         if clauses:
             base_query += ' WHERE ' + ' AND '.join(clauses)
-    cursor.execute(base_query, tuple(params))
-    rows = cursor.fetchall()
-    conn.close()
+    rows = fetch_all(base_query, params)
     processes = []
     for row in rows:
         processes.append({
@@ -702,53 +146,45 @@ def create_judicial_petition(process_id, petition_type, template_id=None, conten
     """Create a judicial petition entry in DB.
     Returns created petition id.
     """
-    conn = get_connection()
-    cursor = conn.cursor()
-    use_postgres_style = USE_SUPABASE and not isinstance(conn, sqlite3.Connection)
     if petition_date is None:
         import datetime
         petition_date = datetime.date.today()
-    if use_postgres_style:
-        cursor.execute('INSERT INTO judicial_petitions (process_id, petition_type, template_id, petition_date, status, content) VALUES (%s, %s, %s, %s, %s, %s) RETURNING id', (process_id, petition_type, template_id, petition_date, status, content))
-        result = cursor.fetchone()
-        petition_id = result[0]
-    else:
-        cursor.execute('INSERT INTO judicial_petitions (process_id, petition_type, template_id, petition_date, status, content) VALUES (?, ?, ?, ?, ?, ?)', (process_id, petition_type, template_id, petition_date, status, content))
-        petition_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return petition_id
+    return insert('INSERT INTO judicial_petitions (process_id, petition_type, template_id, petition_date, status, content) VALUES (:process_id, :petition_type, :template_id, :petition_date, :status, :content)', {
+        'process_id': process_id, 'petition_type': petition_type, 'template_id': template_id,
+        'petition_date': petition_date, 'status': status, 'content': content,
+    })
 
 
 def create_judicial_process(debtor_id, client_id, debt_id=None, process_type='inicial', process_number=None, forum_id=None, vara=None, distribution_date=None, status='ativo', description=None, notes=None):
     """Create a judicial process record and return its id."""
-    conn = get_connection()
-    cursor = conn.cursor()
-    use_postgres_style = USE_SUPABASE and not isinstance(conn, sqlite3.Connection)
-    if use_postgres_style:
-        cursor.execute('INSERT INTO judicial_processes (debtor_id, client_id, debt_id, process_type, process_number, forum_id, vara, distribution_date, status, description, notes) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id',
-                       (debtor_id, client_id, debt_id, process_type, process_number, forum_id, vara, distribution_date, status, description, notes))
-        new_id = cursor.fetchone()[0]
-    else:
-        cursor.execute('INSERT INTO judicial_processes (debtor_id, client_id, debt_id, process_type, process_number, forum_id, vara, distribution_date, status, description, notes) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
-                       (debtor_id, client_id, debt_id, process_type, process_number, forum_id, vara, distribution_date, status, description, notes))
-        new_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    new_id = insert('INSERT INTO judicial_processes (debtor_id, client_id, debt_id, process_type, process_number, forum_id, vara, distribution_date, status, description, notes) VALUES (:debtor_id, :client_id, :debt_id, :process_type, :process_number, :forum_id, :vara, :distribution_date, :status, :description, :notes)', {
+        'debtor_id': debtor_id, 'client_id': client_id, 'debt_id': debt_id, 'process_type': process_type,
+        'process_number': process_number, 'forum_id': forum_id, 'vara': vara,
+        'distribution_date': distribution_date, 'status': status, 'description': description, 'notes': notes,
+    })
+    touch_debtor(debtor_id)
+    return new_id
+
+
+_INSERT_LEGAL_EXPENSE = """
+    INSERT INTO legal_expenses (debtor_id, client_id, description, value, date)
+    VALUES (:debtor_id, :client_id, :description, :value, :date)
+"""
+
+
+def create_legal_expense(debtor_id, description, value, date):
+    """Record a legal expense (court fee) paid for a debtor and return its id."""
+    with transaction() as tx:
+        client_id = _debtor_client_id(debtor_id, tx)
+        new_id = insert(_INSERT_LEGAL_EXPENSE, {'debtor_id': debtor_id, 'client_id': client_id, 'description': description,
+                                                'value': value, 'date': date}, tx=tx)
+    touch_debtor(debtor_id)
     return new_id
 
 
 def list_judicial_petitions(process_id):
     """List petitions linked to a judicial process."""
-    conn = get_connection()
-    cursor = conn.cursor()
-    use_postgres_style = USE_SUPABASE and not isinstance(conn, sqlite3.Connection)
-    if use_postgres_style:
-        cursor.execute('SELECT id, petition_type, template_id, petition_date, status, content FROM judicial_petitions WHERE process_id = %s ORDER BY petition_date DESC', (process_id,))
-    else:
-        cursor.execute('SELECT id, petition_type, template_id, petition_date, status, content FROM judicial_petitions WHERE process_id = ? ORDER BY petition_date DESC', (process_id,))
-    rows = cursor.fetchall()
-    conn.close()
+    rows = fetch_all('SELECT id, petition_type, template_id, petition_date, status, content FROM judicial_petitions WHERE process_id = :process_id ORDER BY petition_date DESC', {'process_id': process_id})
     petitions = []
     for r in rows:
         petitions.append({
@@ -763,29 +199,14 @@ def list_judicial_petitions(process_id):
 
 
 def update_judicial_petition_status(petition_id, status):
-    conn = get_connection()
-    cursor = conn.cursor()
-    use_postgres_style = USE_SUPABASE and not isinstance(conn, sqlite3.Connection)
-    if use_postgres_style:
-        cursor.execute('UPDATE judicial_petitions SET status = %s WHERE id = %s', (status, petition_id))
-    else:
-        cursor.execute('UPDATE judicial_petitions SET status = ? WHERE id = ?', (status, petition_id))
-    conn.commit()
-    conn.close()
+    execute('UPDATE judicial_petitions SET status = :status WHERE id = :id', {'status': status, 'id': petition_id})
     return True
 
 
+@reference_cache('petition_templates')
 def get_template_by_id(template_id):
     """Return a petition template by id."""
-    conn = get_connection()
-    cursor = conn.cursor()
-    use_postgres_style = USE_SUPABASE and not isinstance(conn, sqlite3.Connection)
-    if use_postgres_style:
-        cursor.execute('SELECT id, name, process_type, description, template_content FROM petition_templates WHERE id = %s', (template_id,))
-    else:
-        cursor.execute('SELECT id, name, process_type, description, template_content FROM petition_templates WHERE id = ?', (template_id,))
-    row = cursor.fetchone()
-    conn.close()
+    row = fetch_one('SELECT id, name, process_type, description, template_content FROM petition_templates WHERE id = :id', {'id': template_id})
     if not row:
         return None
     return {
@@ -798,316 +219,521 @@ def get_template_by_id(template_id):
 
 
 def create_petition_template(name, process_type, description, template_content):
-    conn = get_connection()
-    cursor = conn.cursor()
-    use_postgres_style = USE_SUPABASE and not isinstance(conn, sqlite3.Connection)
-    if use_postgres_style:
-        cursor.execute('INSERT INTO petition_templates (name, process_type, description, template_content) VALUES (%s, %s, %s, %s) RETURNING id', (name, process_type, description, template_content))
-        new_id = cursor.fetchone()[0]
-    else:
-        cursor.execute('INSERT INTO petition_templates (name, process_type, description, template_content) VALUES (?, ?, ?, ?)', (name, process_type, description, template_content))
-        new_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    new_id = insert('INSERT INTO petition_templates (name, process_type, description, template_content) VALUES (:name, :process_type, :description, :template_content)', {
+        'name': name, 'process_type': process_type, 'description': description, 'template_content': template_content,
+    })
+    invalidate('petition_templates')
     return new_id
 
 
-def update_petition_template(template_id, name=None, process_type=None, description=None, template_content=None):
-    conn = get_connection()
-    cursor = conn.cursor()
-    use_postgres_style = USE_SUPABASE and not isinstance(conn, sqlite3.Connection)
-    # Build update parts
-    sets = []
-    params = []
-    if name is not None:
-        sets.append('name = %s' if use_postgres_style else 'name = ?')
-        params.append(name)
-    if process_type is not None:
-        sets.append('process_type = %s' if use_postgres_style else 'process_type = ?')
-        params.append(process_type)
-    if description is not None:
-        sets.append('description = %s' if use_postgres_style else 'description = ?')
-        params.append(description)
-    if template_content is not None:
-        sets.append('template_content = %s' if use_postgres_style else 'template_content = ?')
-        params.append(template_content)
-    if not sets:
-        conn.close()
+def _update_query(table, row_id, values):
+    """(sql, params) of UPDATE `table` SET <non-None values> WHERE id = row_id, or None if nothing to set."""
+    values = {k: v for k, v in values.items() if v is not None}
+    if not values:
+        return None
+    sets = ', '.join(f'{column} = :{column}' for column in values)
+    return f'UPDATE {table} SET {sets} WHERE id = :id', {**values, 'id': row_id}
+
+
+def _update_columns(table, row_id, values):
+    """UPDATE `table` SET <non-None values> WHERE id = row_id. Returns False if nothing to set."""
+    query = _update_query(table, row_id, values)
+    if query is None:
         return False
-    query = 'UPDATE petition_templates SET ' + ', '.join(sets) + (' WHERE id = %s' if use_postgres_style else ' WHERE id = ?')
-    params.append(template_id)
-    cursor.execute(query, tuple(params))
-    conn.commit()
-    conn.close()
+    execute(*query)
     return True
 
 
+def update_petition_template(template_id, name=None, process_type=None, description=None, template_content=None):
+    updated = _update_columns('petition_templates', template_id, {
+        'name': name, 'process_type': process_type, 'description': description, 'template_content': template_content,
+    })
+    invalidate('petition_templates')
+    return updated
+
+
 def delete_petition_template(template_id):
-    conn = get_connection()
-    cursor = conn.cursor()
-    use_postgres_style = USE_SUPABASE and not isinstance(conn, sqlite3.Connection)
-    if use_postgres_style:
-        cursor.execute('DELETE FROM petition_templates WHERE id = %s', (template_id,))
-    else:
-        cursor.execute('DELETE FROM petition_templates WHERE id = ?', (template_id,))
-    conn.commit()
-    conn.close()
+    execute('DELETE FROM petition_templates WHERE id = :id', {'id': template_id})
+    invalidate('petition_templates')
     return True
 
 
+def _find_debtor_query(cpf_cnpj, client_id):
+    digits = document_digits(cpf_cnpj)
+    if digits is None:
+        return None
+    if client_id is not None:
+        return ('SELECT id FROM debtors WHERE client_id = :client_id AND cpf_cnpj_digits = :digits',
+                {'client_id': client_id, 'digits': digits})
+    return 'SELECT id FROM debtors WHERE cpf_cnpj_digits = :digits ORDER BY id LIMIT 1', {'digits': digits}
+
+
+def find_debtor_by_document(cpf_cnpj, client_id=None, tx=None):
+    """Return the id of the debtor with this CPF/CNPJ (any punctuation), or None.
+
+    Uses the indexed cpf_cnpj_digits column; pass client_id to search one client only.
+    """
+    query = _find_debtor_query(cpf_cnpj, client_id)
+    if query is None:
+        return None
+    return fetch_scalar(*query, tx=tx)
+
+
 def delete_debtor_by_cpf(cpf_cnpj: str):
     """Delete a debtor and related records by CPF/CNPJ (digits-only match).
 
     Returns deleted debtor id if deleted, else None.
     """
-    if not cpf_cnpj:
+    target_id = find_debtor_by_document(cpf_cnpj)
+    if target_id is None:
         return None
-    digits = ''.join(filter(str.isdigit, str(cpf_cnpj)))
-    conn = get_connection()
-    cursor = conn.cursor()
-    try:
-        # Fetch all debtors and match by digits-only
-        cursor.execute('SELECT id, cpf_cnpj FROM debtors')
-        rows = cursor.fetchall()
-        target_id = None
-        for row in rows:
-            # row format differs by db driver
-            row_id = row[0]
-            row_cpf = row[1]
-            row_digits = ''.join(filter(str.isdigit, str(row_cpf or '')))
-            if row_digits == digits:
-                target_id = row_id
-                break
-        if target_id is None:
-            return None
-        # Delete using FK cascade
-        # If we attempted Supabase but fell back to SQLite (connection is sqlite3.Connection),
-        # use SQLite parameter style. Otherwise use the Supabase/Postgres style.
-        use_postgres_style = USE_SUPABASE and not isinstance(conn, sqlite3.Connection)
-        if use_postgres_style:
-            cursor.execute('DELETE FROM debtors WHERE id = %s', (target_id,))
-        else:
-            cursor.execute('DELETE FROM debtors WHERE id = ?', (target_id,))
-        conn.commit()
-        return target_id
-    finally:
-        conn.close()
+    delete_debtor(target_id)
+    return target_id
 
 
 def get_kanban_cards(status=None):
     """Return all kanban cards, optionally filtered by status, ordered by order_index."""
-    conn = get_connection()
-    cursor = conn.cursor()
-    use_postgres_style = USE_SUPABASE and not isinstance(conn, sqlite3.Connection)
     if status:
-        if use_postgres_style:
-            cursor.execute('SELECT id, title, description, status, order_index FROM kanban_cards WHERE status = %s ORDER BY order_index ASC', (status,))
-        else:
-            cursor.execute('SELECT id, title, description, status, order_index FROM kanban_cards WHERE status = ? ORDER BY order_index ASC', (status,))
+        rows = fetch_all('SELECT id, title, description, status, order_index FROM kanban_cards WHERE status = :status ORDER BY order_index ASC', {'status': status})
     else:
-        if use_postgres_style:
-            cursor.execute('SELECT id, title, description, status, order_index FROM kanban_cards ORDER BY status, order_index ASC')
-        else:
-            cursor.execute('SELECT id, title, description, status, order_index FROM kanban_cards ORDER BY status, order_index ASC')
-    rows = cursor.fetchall()
-    conn.close()
+        rows = fetch_all('SELECT id, title, description, status, order_index FROM kanban_cards ORDER BY status, order_index ASC')
     cards = []
     for r in rows:
         cards.append({'id': r[0], 'title': r[1], 'description': r[2], 'status': r[3], 'order_index': r[4]})
     return cards
 
 
+def get_kanban_board(statuses):
+    """All cards of the given columns in one query: {status: [card dicts in order_index order]}."""
+    board = {status: [] for status in statuses}
+    rows = fetch_all('SELECT id, title, description, status, order_index FROM kanban_cards ORDER BY status, order_index, id')
+    for r in rows:
+        if r[3] in board:
+            board[r[3]].append({'id': r[0], 'title': r[1], 'description': r[2], 'status': r[3], 'order_index': r[4]})
+    return board
+
+
+def kanban_moves(board, layout):
+    """Cards whose column or position changed between `board` (as loaded by
+    get_kanban_board) and `layout` ({status: [card ids in display order]}).
+
+    Only columns whose sequence of ids differs are renumbered, so an unchanged
+    board yields no moves. Returns a list of {'id', 'status', 'order_index'}.
+    """
+    stored = {card['id']: (card['status'], card['order_index']) for cards in board.values() for card in cards}
+    moves = []
+    for status, card_ids in layout.items():
+        if card_ids == [card['id'] for card in board.get(status, [])]:
+            continue
+        for position, card_id in enumerate(card_ids):
+            if card_id in stored and stored[card_id] != (status, position):
+                moves.append({'id': card_id, 'status': status, 'order_index': position})
+    return moves
+
+
+def move_kanban_cards(moves):
+    """Applies kanban_moves() output in one transaction. Returns the number of cards updated."""
+    if not moves:
+        return 0
+    with transaction() as tx:
+        executemany('UPDATE kanban_cards SET status = :status, order_index = :order_index, updated_at = CURRENT_TIMESTAMP WHERE id = :id',
+                    moves, tx=tx)
+    return len(moves)
+
+
 def create_kanban_card(title, description=None, status='todo'):
-    conn = get_connection()
-    cursor = conn.cursor()
-    use_postgres_style = USE_SUPABASE and not isinstance(conn, sqlite3.Connection)
-    if use_postgres_style:
-        cursor.execute('INSERT INTO kanban_cards (title, description, status) VALUES (%s, %s, %s) RETURNING id', (title, description, status))
-        new_id = cursor.fetchone()[0]
-    else:
-        cursor.execute('INSERT INTO kanban_cards (title, description, status) VALUES (?, ?, ?)', (title, description, status))
-        new_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return new_id
+    return insert('INSERT INTO kanban_cards (title, description, status) VALUES (:title, :description, :status)',
+                  {'title': title, 'description': description, 'status': status})
 
 
 def update_kanban_card(card_id, title=None, description=None, status=None, order_index=None):
-    conn = get_connection()
-    cursor = conn.cursor()
-    use_postgres_style = USE_SUPABASE and not isinstance(conn, sqlite3.Connection)
-    sets = []
-    params = []
-    if title is not None:
-        sets.append('title = %s' if use_postgres_style else 'title = ?')
-        params.append(title)
-    if description is not None:
-        sets.append('description = %s' if use_postgres_style else 'description = ?')
-        params.append(description)
-    if status is not None:
-        sets.append('status = %s' if use_postgres_style else 'status = ?')
-        params.append(status)
-    if order_index is not None:
-        sets.append('order_index = %s' if use_postgres_style else 'order_index = ?')
-        params.append(order_index)
-    if not sets:
-        conn.close()
-        return False
-    query = 'UPDATE kanban_cards SET ' + ', '.join(sets) + (' WHERE id = %s' if use_postgres_style else ' WHERE id = ?')
-    params.append(card_id)
-    cursor.execute(query, tuple(params))
-    conn.commit()
-    conn.close()
-    return True
+    return _update_columns('kanban_cards', card_id, {
+        'title': title, 'description': description, 'status': status, 'order_index': order_index,
+    })
 
 
 def delete_kanban_card(card_id):
-    conn = get_connection()
-    cursor = conn.cursor()
-    use_postgres_style = USE_SUPABASE and not isinstance(conn, sqlite3.Connection)
-    if use_postgres_style:
-        cursor.execute('DELETE FROM kanban_cards WHERE id = %s', (card_id,))
-    else:
-        cursor.execute('DELETE FROM kanban_cards WHERE id = ?', (card_id,))
-    conn.commit()
-    conn.close()
+    execute('DELETE FROM kanban_cards WHERE id = :id', {'id': card_id})
     return True
 
 
-def get_dashboard_kpis():
-    """Retrieve all KPI metrics for the dashboard in a single call."""
-    conn = get_connection()
+_KPI_KEYS = ("total_debtors", "total_debts", "total_original_value", "active_agreements", "total_recovered", "total_payments")
+
+
+def _kpi_dict(row):
+    kpis = dict(zip(_KPI_KEYS, row))
+    total_original_value = float(kpis["total_original_value"] or 0)
+    total_recovered = float(kpis["total_recovered"] or 0)
+    kpis["recovery_rate"] = (total_recovered / total_original_value * 100) if total_original_value > 0 else 0
+    return kpis
+
+
+_EMPTY_KPIS = {
+    "total_debtors": 0, "total_debts": 0, "total_original_value": 0,
+    "active_agreements": 0, "total_recovered": 0, "total_payments": 0, "recovery_rate": 0
+}
+
+
+def _kpi_query(client_id):
+    params = {'client_id': client_id}
+    where = ' WHERE client_id = :client_id' if client_id else ''
+    if USE_KPI_SUMMARY:
+        return ('SELECT COALESCE(SUM(total_debtors), 0), COALESCE(SUM(total_debts), 0), COALESCE(SUM(total_original_value), 0), '
+                'COALESCE(SUM(active_agreements), 0), COALESCE(SUM(total_recovered), 0), COALESCE(SUM(total_payments), 0) '
+                'FROM kpi_summary' + where, params)
+
+    and_where = ' AND client_id = :client_id' if client_id else ''
+    return f"""
+        SELECT (SELECT count(*) FROM debtors{where}),
+               (SELECT count(*) FROM debts{where}),
+               (SELECT COALESCE(SUM(original_value), 0) FROM debts{where}),
+               (SELECT count(*) FROM agreements WHERE status = 'active'{and_where}),
+               (SELECT COALESCE(SUM(amount), 0) FROM payments_all{where}),
+               (SELECT count(*) FROM payments_all{where})
+    """, params
+
+
+def get_dashboard_kpis(client_id=None):
+    """Retrieve all KPI metrics for the dashboard in a single call.
+
+    Reads the kpi_summary table (one row per client) when enabled, otherwise
+    aggregates in SQL. Pass client_id to restrict to one client.
+    """
     try:
-        # Total Debtors
-        total_debtors = pd.read_sql_query("SELECT count(*) as cnt FROM debtors", conn).iloc[0, 0]
-        
-        # Total Original Value & Total Debts
-        debts_stats = pd.read_sql_query("SELECT COALESCE(sum(original_value), 0) as total_val, count(*) as cnt FROM debts", conn)
-        total_original_value = debts_stats.iloc[0]['total_val']
-        total_debts = debts_stats.iloc[0]['cnt']
-        
-        # Active Agreements
-        agreements_df = pd.read_sql_query("SELECT * FROM agreements", conn)
-        active_agreements = len(agreements_df[agreements_df['status'] == 'active']) if not agreements_df.empty else 0
-        
-        # Payments & Recovery
-        payments_df = pd.read_sql_query("SELECT * FROM payments", conn)
-        total_recovered = payments_df['amount'].sum() if not payments_df.empty else 0
-        total_payments = len(payments_df)
-        
-        # Recovery Rate
-        recovery_rate = (total_recovered / total_original_value * 100) if total_original_value > 0 else 0
-        
-        return {
-            "total_debtors": total_debtors,
-            "total_debts": total_debts,
-            "total_original_value": total_original_value,
-            "active_agreements": active_agreements,
-            "total_recovered": total_recovered,
-            "total_payments": total_payments,
-            "recovery_rate": recovery_rate
-        }
+        return _kpi_dict(fetch_one(*_kpi_query(client_id)))
     except Exception as e:
         print(f"Error fetching KPIs: {e}")
-        return {
-            "total_debtors": 0, "total_debts": 0, "total_original_value": 0,
-            "active_agreements": 0, "total_recovered": 0, "total_payments": 0, "recovery_rate": 0
-        }
-    finally:
-        conn.close()
+        return dict(_EMPTY_KPIS)
+
+
+def _bump_kpis_query(client_id, deltas):
+    columns = list(deltas)
+    return (
+        f"INSERT INTO kpi_summary (client_id, {', '.join(columns)}) "
+        f"VALUES (:client_id, {', '.join(':' + c for c in columns)}) "
+        f"ON CONFLICT (client_id) DO UPDATE SET "
+        + ', '.join(f"{c} = kpi_summary.{c} + excluded.{c}" for c in columns)
+        + ", updated_at = CURRENT_TIMESTAMP",
+        {'client_id': client_id, **deltas})
+
+
+def _bump_kpis(client_id, tx, **deltas):
+    """Adds deltas to a client's kpi_summary row (creating it if needed)."""
+    execute(*_bump_kpis_query(client_id, deltas), tx=tx)
+
+
+def _refresh_kpi_queries(client_id):
+    if client_id:
+        return [('DELETE FROM kpi_summary WHERE client_id = :client_id', {'client_id': client_id}),
+                (KPI_SUMMARY_REFRESH_SQL + ' WHERE c.id = :client_id', {'client_id': client_id})]
+    return [('DELETE FROM kpi_summary', None), (KPI_SUMMARY_REFRESH_SQL, None)]
+
+
+def refresh_kpi_summary(client_id=None, tx=None):
+    """Recomputes kpi_summary from the base tables (for one client, or all)."""
+    for sql, params in _refresh_kpi_queries(client_id):
+        execute(sql, params, tx=tx)
+
+
+_DEBTOR_CLIENT_SQL = 'SELECT client_id FROM debtors WHERE id = :id'
+
+
+def _debtor_client_id(debtor_id, tx):
+    client_id = fetch_scalar(_DEBTOR_CLIENT_SQL, {'id': debtor_id}, tx=tx)
+    if client_id is None:
+        raise ValueError(f"Devedor {debtor_id} não encontrado.")
+    return client_id
+
+
+def create_client(name, cnpj=None, email=None, phone=None, address=None, main_forum=None, jurisdiction_state=None, notes=None):
+    """Create a client (and its main forum record, if given) and return its id."""
+    with transaction() as tx:
+        new_id = insert("""
+            INSERT INTO clients (name, cnpj, email, phone, address, main_forum, jurisdiction_state, notes)
+            VALUES (:name, :cnpj, :email, :phone, :address, :main_forum, :jurisdiction_state, :notes)
+        """, {'name': name, 'cnpj': cnpj, 'email': email, 'phone': phone, 'address': address,
+              'main_forum': main_forum, 'jurisdiction_state': jurisdiction_state, 'notes': notes}, tx=tx)
+        if main_forum:
+            execute("""
+                INSERT INTO client_forums (client_id, forum_name, forum_code, state, is_main)
+                VALUES (:client_id, :forum_name, :forum_code, :state, :is_main)
+            """, {'client_id': new_id, 'forum_name': main_forum, 'forum_code': main_forum.upper().replace(" ", "_"),
+                  'state': jurisdiction_state, 'is_main': True}, tx=tx)
+    invalidate('clients', 'client_forums')
+    return new_id
+
 
+def delete_client(client_id):
+    """Deletes a client (related rows follow the FK cascades) and its KPI row."""
+    with transaction() as tx:
+        execute('DELETE FROM clients WHERE id = :id', {'id': client_id}, tx=tx)
+        execute('DELETE FROM kpi_summary WHERE client_id = :client_id', {'client_id': client_id}, tx=tx)
+    invalidate('clients', 'client_forums')
+    touch_debtor()
+    return True
+
+
+@reference_cache('client_forums')
+def get_client_forums(client_id):
+    """Forums of a client as a DataFrame, main forum first."""
+    return read_df("SELECT * FROM client_forums WHERE client_id = :client_id ORDER BY is_main DESC, forum_name",
+                   {'client_id': client_id})
+
+
+def create_client_forum(client_id, forum_name, state=None, city=None, is_main=False):
+    """Add a forum to a client and return its id."""
+    forum_code = f"{(state or '').upper()}_{(city or '').upper().replace(' ', '_')}"
+    new_id = insert("""
+        INSERT INTO client_forums (client_id, forum_name, forum_code, state, city, is_main)
+        VALUES (:client_id, :forum_name, :forum_code, :state, :city, :is_main)
+    """, {'client_id': client_id, 'forum_name': forum_name, 'forum_code': forum_code,
+          'state': state, 'city': city, 'is_main': is_main})
+    invalidate('client_forums')
+    return new_id
+
+
+# Write statements shared with src.async_database
+_INSERT_DEBTOR = ('INSERT INTO debtors (client_id, name, cpf_cnpj, cpf_cnpj_digits, rg, email, phone, notes)'
+                  ' VALUES (:client_id, :name, :cpf_cnpj, :cpf_cnpj_digits, :rg, :email, :phone, :notes)')
+_INSERT_DEBT = ('INSERT INTO debts (debtor_id, client_id, contract_type, description, original_value, due_date, fine_type)'
+                ' VALUES (:debtor_id, :client_id, :contract_type, :description, :original_value, :due_date, :fine_type)')
+_INSERT_AGREEMENT = ('INSERT INTO agreements (debtor_id, client_id, debt_id, status, agreement_date, agreed_value, total_installments, installment_value, interest_rate, first_installment_date, notes)'
+                     ' VALUES (:debtor_id, :client_id, :debt_id, :status, :agreement_date, :agreed_value, :total_installments, :installment_value, :interest_rate, :first_installment_date, :notes)')
+_INSERT_PAYMENT = ('INSERT INTO payments (agreement_id, debt_id, debtor_id, client_id, payment_date, amount, installment_number, payment_method, notes)'
+                   ' VALUES (:agreement_id, :debt_id, :debtor_id, :client_id, :payment_date, :amount, :installment_number, :payment_method, :notes)')
+
+
+def create_debtor(client_id, name, cpf_cnpj=None, rg=None, email=None, phone=None, notes=None):
+    """Create a debtor and return its id.
+
+    Raises ValueError if the client already has a debtor with the same CPF/CNPJ.
+    """
+    with transaction() as tx:
+        if find_debtor_by_document(cpf_cnpj, client_id, tx=tx) is not None:
+            raise ValueError("Já existe um devedor com este CPF/CNPJ para este cliente.")
+        new_id = insert(_INSERT_DEBTOR, {
+            'client_id': client_id, 'name': name, 'cpf_cnpj': cpf_cnpj, 'cpf_cnpj_digits': document_digits(cpf_cnpj),
+            'rg': rg, 'email': email, 'phone': phone, 'notes': notes,
+        }, tx=tx)
+        _bump_kpis(client_id, tx, total_debtors=1)
+    return new_id
+
+
+def update_debtor(debtor_id, name=None, cpf_cnpj=None, rg=None, email=None, phone=None, notes=None):
+    """Update the given debtor fields, keeping cpf_cnpj_digits in sync."""
+    values = {'name': name, 'rg': rg, 'email': email, 'phone': phone, 'notes': notes}
+    if cpf_cnpj is not None:
+        client_id = fetch_scalar(_DEBTOR_CLIENT_SQL, {'id': debtor_id})
+        existing = find_debtor_by_document(cpf_cnpj, client_id)
+        if existing is not None and existing != debtor_id:
+            raise ValueError("Já existe um devedor com este CPF/CNPJ para este cliente.")
+        values['cpf_cnpj'] = cpf_cnpj
+        values['cpf_cnpj_digits'] = document_digits(cpf_cnpj)
+    updated = _update_columns('debtors', debtor_id, values)
+    touch_debtor(debtor_id)
+    return updated
+
+
+def delete_debtor(debtor_id):
+    """Delete a debtor (related rows follow the FK cascades). Returns True if deleted."""
+    with transaction() as tx:
+        client_id = fetch_scalar(_DEBTOR_CLIENT_SQL, {'id': debtor_id}, tx=tx)
+        if client_id is None:
+            return False
+        execute('DELETE FROM debtors WHERE id = :id', {'id': debtor_id}, tx=tx)
+        # Cascades removed debts/payments/agreements too; recount this client
+        refresh_kpi_summary(client_id, tx=tx)
+    touch_debtor(debtor_id)
+    return True
+
+
+def create_debt(debtor_id, contract_type, original_value, due_date, description=None, fine_type=None):
+    """Create a debt for a debtor and return its id."""
+    with transaction() as tx:
+        client_id = _debtor_client_id(debtor_id, tx)
+        new_id = insert(_INSERT_DEBT, {
+            'debtor_id': debtor_id, 'client_id': client_id, 'contract_type': contract_type, 'description': description,
+            'original_value': original_value, 'due_date': due_date, 'fine_type': fine_type,
+        }, tx=tx)
+        _bump_kpis(client_id, tx, total_debts=1, total_original_value=original_value)
+    touch_debtor(debtor_id)
+    return new_id
+
+
+def create_agreement(debtor_id, agreement_date, agreed_value, total_installments=1, installment_value=None, interest_rate=0, first_installment_date=None, debt_id=None, notes=None, status='active'):
+    """Create an agreement for a debtor and return its id."""
+    with transaction() as tx:
+        client_id = _debtor_client_id(debtor_id, tx)
+        new_id = insert(_INSERT_AGREEMENT, {
+            'debtor_id': debtor_id, 'client_id': client_id, 'debt_id': debt_id, 'status': status,
+            'agreement_date': agreement_date, 'agreed_value': agreed_value, 'total_installments': total_installments,
+            'installment_value': installment_value, 'interest_rate': interest_rate,
+            'first_installment_date': first_installment_date, 'notes': notes,
+        }, tx=tx)
+        if status == 'active':
+            _bump_kpis(client_id, tx, active_agreements=1)
+    touch_debtor(debtor_id)
+    return new_id
+
+
+_AGREEMENT_STATUS_SQL = 'SELECT client_id, status, debtor_id FROM agreements WHERE id = :id'
+
+
+def update_agreement_status(agreement_id, status):
+    """Change an agreement's status, keeping the active-agreement count current."""
+    with transaction() as tx:
+        row = fetch_one(_AGREEMENT_STATUS_SQL, {'id': agreement_id}, tx=tx)
+        if not row:
+            return False
+        client_id, old_status, debtor_id = row
+        execute('UPDATE agreements SET status = :status WHERE id = :id', {'status': status, 'id': agreement_id}, tx=tx)
+        delta = (status == 'active') - (old_status == 'active')
+        if delta:
+            _bump_kpis(client_id, tx, active_agreements=delta)
+    touch_debtor(debtor_id)
+    return True
+
+
+def create_payment(debtor_id, payment_date, amount, payment_method=None, agreement_id=None, debt_id=None, installment_number=None, notes=None):
+    """Register a payment for a debtor and return its id."""
+    with transaction() as tx:
+        client_id = _debtor_client_id(debtor_id, tx)
+        new_id = insert(_INSERT_PAYMENT, {
+            'agreement_id': agreement_id, 'debt_id': debt_id, 'debtor_id': debtor_id, 'client_id': client_id,
+            'payment_date': payment_date, 'amount': amount, 'installment_number': installment_number,
+            'payment_method': payment_method, 'notes': notes,
+        }, tx=tx)
+        _bump_kpis(client_id, tx, total_recovered=amount, total_payments=1)
+    touch_debtor(debtor_id)
+    return new_id
+
+@reference_cache('clients')
 def get_clients():
     """Retrieve all clients as a DataFrame."""
-    conn = get_connection()
-    try:
-        return pd.read_sql_query("SELECT * FROM clients ORDER BY name", conn)
-    finally:
-        conn.close()
+    return read_df("SELECT * FROM clients ORDER BY name")
 
 def get_debtors():
-    """Retrieve all debtors as a DataFrame."""
-    conn = get_connection()
-    try:
-        return pd.read_sql_query("SELECT * FROM debtors ORDER BY name", conn)
-    finally:
-        conn.close()
+    """Retrieve all debtors as a DataFrame (loads the whole table - prefer list_debtors)."""
+    return read_df("SELECT * FROM debtors ORDER BY name")
+
+
+def has_debtors(client_id=None):
+    """True if there is at least one debtor (for the client, if given)."""
+    if client_id:
+        return fetch_scalar('SELECT 1 FROM debtors WHERE client_id = :client_id LIMIT 1', {'client_id': client_id}) is not None
+    return fetch_scalar('SELECT 1 FROM debtors LIMIT 1') is not None
+
+
+def _debtor_dict(row):
+    return {'id': row[0], 'client_id': row[1], 'name': row[2], 'cpf_cnpj': row[3]}
+
+
+def _debtors_by_ids_query(ids):
+    placeholders = ', '.join(f':id{i}' for i in range(len(ids)))
+    return (f'SELECT id, client_id, name, cpf_cnpj FROM debtors WHERE id IN ({placeholders})',
+            {f'id{i}': debtor_id for i, debtor_id in enumerate(ids)})
+
+
+def get_debtors_by_ids(ids):
+    """Debtors with the given ids (id, client_id, name, cpf_cnpj dicts), in the order given."""
+    ids = [int(i) for i in ids]
+    if not ids:
+        return []
+    by_id = {row[0]: _debtor_dict(row) for row in fetch_all(*_debtors_by_ids_query(ids))}
+    return [by_id[i] for i in ids if i in by_id]
+
+
+def _list_debtors_query(client_id, search, after_name, after_id, limit):
+    where = []
+    params = {'limit': int(limit)}
+    if client_id:
+        where.append('client_id = :client_id')
+        params['client_id'] = client_id
+    search = (search or '').strip()
+    digits = document_digits(search)
+    if digits and not any(ch.isalpha() for ch in search):
+        # Prefix range on the indexed digits column ('~' sorts after every digit)
+        where.append('cpf_cnpj_digits >= :digits AND cpf_cnpj_digits < :digits_end')
+        params.update(digits=digits, digits_end=digits + '~')
+    elif search:
+        pattern = search.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        where.append("LOWER(name) LIKE :pattern ESCAPE '\\'")
+        params['pattern'] = f'%{pattern}%'
+    if after_name is not None:
+        where.append('(name, id) > (:after_name, :after_id)')
+        params.update(after_name=after_name, after_id=after_id or 0)
+
+    sql = 'SELECT id, client_id, name, cpf_cnpj FROM debtors'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY name, id LIMIT :limit'
+    return sql, params
+
+
+def list_debtors(client_id=None, search=None, after_name=None, after_id=None, limit=50):
+    """One page of debtors ordered by (name, id), filtered in SQL.
+
+    Keyset pagination: pass the name and id of the last row of the previous page
+    as after_name/after_id. `search` matches a CPF/CNPJ prefix when it is all
+    digits (and punctuation), otherwise part of the name.
+    Returns a list of dicts with id, client_id, name and cpf_cnpj.
+    """
+    rows = fetch_all(*_list_debtors_query(client_id, search, after_name, after_id, limit))
+    return [_debtor_dict(row) for row in rows]
 
 def get_debts(debtor_id=None):
     """Retrieve debts as a DataFrame, optionally filtered by debtor_id."""
-    conn = get_connection()
     try:
         if debtor_id:
-            # Check connection type for parameter style
-            import sqlite3
-            use_postgres = USE_SUPABASE and not isinstance(conn, sqlite3.Connection)
-            if use_postgres:
-                 return pd.read_sql_query("SELECT * FROM debts WHERE debtor_id = %s", conn, params=(debtor_id,))
-            else:
-                 return pd.read_sql_query("SELECT * FROM debts WHERE debtor_id = ?", conn, params=(debtor_id,))
+            return read_df("SELECT * FROM debts WHERE debtor_id = :debtor_id", {'debtor_id': debtor_id})
         else:
-            return pd.read_sql_query("SELECT * FROM debts", conn)
+            return read_df("SELECT * FROM debts")
     except Exception as e:
         print(f"Error fetching debts: {e}")
+        import pandas as pd
         return pd.DataFrame()
-    finally:
-         conn.close()
 
 def create_kanban_column(name):
-    conn = get_connection()
-    cursor = conn.cursor()
     try:
-        # Get max order
-        cursor.execute("SELECT MAX(order_index) FROM kanban_columns")
-        res = cursor.fetchone()
-        max_order = res[0] if res and res[0] is not None else -1
-        new_order = max_order + 1
-        
-        cursor.execute("INSERT INTO kanban_columns (name, order_index) VALUES (?, ?)", (name, new_order))
-        conn.commit()
+        with transaction() as tx:
+            # Get max order
+            max_order = fetch_scalar("SELECT MAX(order_index) FROM kanban_columns", tx=tx)
+            new_order = (max_order if max_order is not None else -1) + 1
+            
+            execute("INSERT INTO kanban_columns (name, order_index) VALUES (:name, :order_index)",
+                    {'name': name, 'order_index': new_order}, tx=tx)
+        invalidate('kanban_columns')
         return True
     except Exception as e:
         print(f"Error creating column: {e}")
         return False
-    finally:
-        conn.close()
+
+@reference_cache('kanban_columns')
+def _kanban_columns():
+    return read_df("SELECT * FROM kanban_columns ORDER BY order_index")
 
 def get_kanban_columns():
-    conn = get_connection()
     try:
-        # Check if table exists first (handling migration on fly if possible, or just fail softly)
-        return pd.read_sql_query("SELECT * FROM kanban_columns ORDER BY order_index", conn)
+        return _kanban_columns()
     except Exception:
+        # Not cached: the next rerun tries the database again
+        import pandas as pd
         return pd.DataFrame()
-    finally:
-        conn.close()
 
 def delete_kanban_column(col_id):
-    conn = get_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute("DELETE FROM kanban_columns WHERE id = ?", (col_id,))
-        conn.commit()
+        execute("DELETE FROM kanban_columns WHERE id = :id", {'id': col_id})
+        invalidate('kanban_columns')
         return True
     except Exception as e:
         print(f"Error deleting column: {e}")
         return False
-    finally:
-        conn.close()
 
 def update_kanban_card_status(card_id, new_status):
     """Updates the status of a card."""
-    conn = get_connection()
-    cursor = conn.cursor()
     try:
-        import sqlite3
-        if USE_SUPABASE and not isinstance(conn, sqlite3.Connection):
-             cursor.execute("UPDATE kanban_cards SET status = %s WHERE id = %s", (new_status, card_id))
-        else:
-             cursor.execute("UPDATE kanban_cards SET status = ? WHERE id = ?", (new_status, card_id))
-        conn.commit()
+        execute("UPDATE kanban_cards SET status = :status WHERE id = :id", {'status': new_status, 'id': card_id})
         return True
     except Exception as e:
         print(f"Error updating card status: {e}")
         return False
-    finally:
-        conn.close()
@@ -0,0 +1,142 @@
+"""Debtor 360: everything the pages show about one debtor, loaded at once.
+
+load_debtor_bundle() reads the debtor row and its debts, legal expenses,
+payments, agreements, judicial processes, guarantors, addresses and contact
+history together. On Postgres that is one statement (json_agg of compact
+arrays, one network round trip); on SQLite, indexed SELECTs on one pooled
+connection inside one read transaction, so all parts come from the same snapshot.
+
+Writes that change a debtor's data call touch_debtor(debtor_id) after commit
+(touch_debtor() with no id for bulk changes), so callers can cache a bundle
+under (debtor_id, data_version(debtor_id)).
+
+    bundle = load_debtor_bundle(42)
+    bundle.debtor["name"], bundle.frame("debts"), bundle.records("payments")
+"""
+import threading
+
+from src.connection import current_dialect
+from src.query import execute, fetch_all, fetch_one, transaction
+
+# (bundle part, table or view, ORDER BY); payments and contacts include archived years
+BUNDLE_PARTS = (
+    ("debts", "debts", "due_date, id"),
+    ("legal_expenses", "legal_expenses", "date DESC, id DESC"),
+    ("payments", "payments_all", "payment_date DESC, id DESC"),
+    ("agreements", "agreements", "agreement_date DESC, id DESC"),
+    ("judicial_processes", "judicial_processes", "id"),
+    ("guarantors", "guarantors", "id"),
+    ("addresses", "addresses", "is_primary DESC, id"),
+    ("contacts", "contact_history_all", "attempt_date DESC, id DESC"),
+)
+
+_versions_lock = threading.Lock()
+_global_version = 0
+_debtor_versions = {}
+
+# dialect -> {table: column names}, read once per process
+_columns = {}
+
+
+def touch_debtor(debtor_id=None):
+    """Marks a debtor's bundle as stale (every debtor's, if no id is given)."""
+    global _global_version
+    with _versions_lock:
+        if debtor_id is None:
+            _global_version += 1
+        else:
+            _debtor_versions[debtor_id] = _debtor_versions.get(debtor_id, 0) + 1
+
+
+def data_version(debtor_id):
+    """Changes whenever touch_debtor() is called for this debtor or for all."""
+    with _versions_lock:
+        return _global_version, _debtor_versions.get(debtor_id, 0)
+
+
+class DebtorBundle:
+    """A debtor row (dict) plus its related rows, kept as (columns, tuples) per part."""
+
+    __slots__ = ("debtor", "_parts")
+
+    def __init__(self, debtor, parts):
+        self.debtor = debtor
+        self._parts = parts
+
+    @property
+    def client_id(self):
+        return self.debtor["client_id"]
+
+    def rows(self, part):
+        return self._parts[part][1]
+
+    def records(self, part):
+        """Rows of a part as dicts."""
+        columns, rows = self._parts[part]
+        return [dict(zip(columns, row)) for row in rows]
+
+    def frame(self, part):
+        """Rows of a part as a DataFrame (with its columns even when empty)."""
+        import pandas as pd
+        columns, rows = self._parts[part]
+        return pd.DataFrame.from_records(rows, columns=columns)
+
+    def __repr__(self):
+        counts = ", ".join(f"{part}={len(rows)}" for part, (_, rows) in self._parts.items())
+        return f"DebtorBundle(debtor_id={self.debtor['id']}, {counts})"
+
+
+def _table_columns(dialect_name):
+    columns = _columns.get(dialect_name)
+    if columns is None:
+        columns = {}
+        with transaction() as tx:
+            cursor = tx.cursor
+            for table in ("debtors",) + tuple(table for _, table, _ in BUNDLE_PARTS):
+                cursor.execute(f"SELECT * FROM {table} WHERE 1 = 0")
+                cursor.fetchall()
+                columns[table] = tuple(c[0] for c in cursor.description)
+        _columns[dialect_name] = columns
+    return columns
+
+
+def _load_postgres(debtor_id, columns):
+    def packed(table, alias):
+        return "json_build_array(" + ", ".join(f"{alias}.{c}" for c in columns[table]) + ")"
+
+    selects = [packed("debtors", "d")]
+    for _, table, order_by in BUNDLE_PARTS:
+        selects.append(
+            f"(SELECT COALESCE(json_agg({packed(table, 'x')} ORDER BY {order_by}), '[]') "
+            f"FROM {table} x WHERE x.debtor_id = d.id)"
+        )
+    row = fetch_one(f"SELECT {', '.join(selects)} FROM debtors d WHERE d.id = :id", {"id": debtor_id})
+    if row is None:
+        return None
+    parts = {part: (columns[table], [tuple(r) for r in packed_rows])
+             for (part, table, _), packed_rows in zip(BUNDLE_PARTS, row[1:])}
+    return DebtorBundle(dict(zip(columns["debtors"], row[0])), parts)
+
+
+def _load_sqlite(debtor_id, columns):
+    params = {"id": debtor_id}
+    with transaction() as tx:
+        # Explicit read transaction: every part sees the same snapshot
+        execute("BEGIN", tx=tx)
+        row = fetch_one("SELECT * FROM debtors WHERE id = :id", params, tx=tx)
+        if row is None:
+            return None
+        parts = {
+            part: (columns[table], fetch_all(f"SELECT * FROM {table} WHERE debtor_id = :id ORDER BY {order_by}", params, tx=tx))
+            for part, table, order_by in BUNDLE_PARTS
+        }
+    return DebtorBundle(dict(zip(columns["debtors"], row)), parts)
+
+
+def load_debtor_bundle(debtor_id):
+    """Everything about one debtor (see BUNDLE_PARTS), or None if it doesn't exist."""
+    dialect = current_dialect()
+    columns = _table_columns(dialect.name)
+    if dialect.is_postgres:
+        return _load_postgres(debtor_id, columns)
+    return _load_sqlite(debtor_id, columns)
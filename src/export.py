@@ -0,0 +1,179 @@
+"""Portfolio export (debtors and their debts) to CSV, XLSX or Parquet.
+
+Rows are streamed from the database in batches (query.stream: named cursor on
+Postgres, fetchmany on SQLite) and each batch is written before the next one is
+read, so memory stays flat however large the portfolio. With valuation=True
+each debt also gets its current corrected value, interest, fine and total from
+Calculator, computed batch by batch (identical debts are calculated once).
+
+    with open("carteira.csv", "wb") as f:
+        stats = export_portfolio(f, "csv", client_id=1)
+    print(stats["rows"], stats["rows_per_sec"])
+"""
+import csv
+import io
+import os
+import time
+from datetime import date
+from functools import lru_cache
+
+from src.query import stream
+
+EXPORT_BATCH_SIZE = 10_000
+FORMATS = ("csv", "xlsx", "parquet")
+MIME_TYPES = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "parquet": "application/vnd.apache.parquet",
+}
+# Exports from the app are written here; files up to EXPORT_DOWNLOAD_MAX_MB are offered for download
+EXPORT_DIR = os.path.join("data", "exports")
+EXPORT_DOWNLOAD_MAX_MB = 200
+# Excel's limit is 1,048,576 rows per sheet (one is the header)
+XLSX_SHEET_ROWS = 1_048_575
+
+PORTFOLIO_SQL = """
+    SELECT c.name AS cliente, d.id AS devedor_id, d.name AS devedor, d.cpf_cnpj, d.email, d.phone AS telefone,
+           t.id AS divida_id, t.contract_type AS tipo_contrato, t.description AS descricao,
+           t.original_value AS valor_original, t.due_date AS vencimento, t.fine_type
+    FROM debtors d
+    JOIN clients c ON c.id = d.client_id
+    LEFT JOIN debts t ON t.debtor_id = d.id
+"""
+
+# Output columns and their Parquet types (fine_type is only used for the valuation)
+COLUMNS = (
+    ("cliente", "str"), ("devedor_id", "int"), ("devedor", "str"), ("cpf_cnpj", "str"), ("email", "str"),
+    ("telefone", "str"), ("divida_id", "int"), ("tipo_contrato", "str"), ("descricao", "str"),
+    ("valor_original", "float"), ("vencimento", "str"),
+)
+VALUATION_COLUMNS = (("valor_corrigido", "float"), ("juros", "float"), ("multa", "float"), ("total", "float"))
+
+
+def _portfolio_query(client_id):
+    sql = PORTFOLIO_SQL
+    params = {}
+    if client_id:
+        sql += " WHERE d.client_id = :client_id"
+        params["client_id"] = client_id
+    return sql + " ORDER BY d.id, t.id", params
+
+
+def _valuer(calc_date):
+    from src.calculator import Calculator
+
+    @lru_cache(maxsize=100_000)
+    def value(contract_type, original_value, due_date, fine_type):
+        try:
+            result = Calculator.calculate(contract_type, original_value, due_date, calc_date, fine_type=fine_type)
+        except Exception as e:
+            print(f"Export valuation failed for {contract_type} {original_value} {due_date}: {e}")
+            return (None, None, None, None)
+        return tuple(float(result[k]) for k in ("corrected", "interest", "fine", "total"))
+
+    return value
+
+
+def iter_portfolio(client_id=None, valuation=False, calc_date=None, batch_size=EXPORT_BATCH_SIZE):
+    """Yields lists of output rows (tuples in COLUMNS [+ VALUATION_COLUMNS] order)."""
+    sql, params = _portfolio_query(client_id)
+    value = _valuer(calc_date or date.today()) if valuation else None
+    for _, rows in stream(sql, params, batch_size):
+        if value is None:
+            yield [row[:-1] for row in rows]
+        else:
+            yield [
+                row[:-1] + (value(row[7], row[9], row[10], row[11]) if row[6] is not None else (None,) * 4)
+                for row in rows
+            ]
+
+
+def _write_csv(batches, header, out):
+    # Excel-friendly like the import reject report: UTF-8 BOM and ';'
+    text = io.TextIOWrapper(out, encoding="utf-8-sig", newline="")
+    try:
+        writer = csv.writer(text, delimiter=";")
+        writer.writerow(header)
+        for rows in batches:
+            writer.writerows(rows)
+            yield len(rows)
+    finally:
+        text.flush()
+        text.detach()
+
+
+def _write_xlsx(batches, header, out):
+    from openpyxl import Workbook
+    # write_only keeps rows in a temp file instead of building the sheet in memory
+    workbook = Workbook(write_only=True)
+    sheet, sheet_rows, sheets = None, XLSX_SHEET_ROWS, 0
+    for rows in batches:
+        for row in rows:
+            if sheet_rows >= XLSX_SHEET_ROWS:
+                sheets += 1
+                sheet = workbook.create_sheet(f"Carteira {sheets}" if sheets > 1 else "Carteira")
+                sheet.append(header)
+                sheet_rows = 0
+            sheet.append(row)
+            sheet_rows += 1
+        yield len(rows)
+    if sheet is None:
+        workbook.create_sheet("Carteira").append(header)
+    workbook.save(out)
+
+
+def _write_parquet(batches, columns, out):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("Exportação Parquet requer o pacote pyarrow (pip install pyarrow).")
+    types = {"str": pa.string(), "int": pa.int64(), "float": pa.float64()}
+    # Postgres hands back dates and Decimals; Parquet columns get plain str/float
+    casts = {"str": str, "int": int, "float": float}
+    schema = pa.schema([(name, types[kind]) for name, kind in columns])
+    converters = [casts[kind] for _, kind in columns]
+    with pq.ParquetWriter(out, schema, compression="zstd") as writer:
+        for rows in batches:
+            arrays = [
+                pa.array([None if row[i] is None else cast(row[i]) for row in rows], type=field.type)
+                for i, (field, cast) in enumerate(zip(schema, converters))
+            ]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield len(rows)
+
+
+def export_portfolio(out, fmt="csv", client_id=None, valuation=False, calc_date=None,
+                     batch_size=EXPORT_BATCH_SIZE, progress=None):
+    """Writes the portfolio (one row per debt; debtors without debts get one row) to `out`.
+
+    `out` is a path or a binary file object; `fmt` one of FORMATS. `progress`, if
+    given, is called with the number of rows written after each batch.
+    Returns a dict with rows, seconds and rows_per_sec.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Formato inválido: {fmt}. Use um de: {', '.join(FORMATS)}.")
+    columns = COLUMNS + (VALUATION_COLUMNS if valuation else ())
+    header = [name for name, _ in columns]
+    batches = iter_portfolio(client_id, valuation, calc_date, batch_size)
+
+    stream_out = open(out, "wb") if isinstance(out, (str, os.PathLike)) else out
+    started = time.perf_counter()
+    rows = 0
+    try:
+        if fmt == "csv":
+            written = _write_csv(batches, header, stream_out)
+        elif fmt == "xlsx":
+            written = _write_xlsx(batches, header, stream_out)
+        else:
+            written = _write_parquet(batches, columns, stream_out)
+        for count in written:
+            rows += count
+            if progress:
+                progress(rows)
+    finally:
+        batches.close()
+        if stream_out is not out:
+            stream_out.close()
+    seconds = time.perf_counter() - started
+    return {"rows": rows, "seconds": seconds, "rows_per_sec": rows / seconds if seconds > 0 else 0}
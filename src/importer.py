@@ -0,0 +1,328 @@
+"""Bulk import of debtors and debts from client spreadsheets (CSV or XLSX).
+
+The file is streamed in chunks of CHUNK_SIZE rows: each chunk is validated with
+ContactValidator (repeated documents/phones are validated once per import),
+then written in its own transaction with bulk_insert (COPY on Postgres,
+executemany on SQLite). Invalid rows are collected in a reject report instead
+of aborting the import; a chunk the database refuses is retried in halves, so
+only the rows that fail there are rejected.
+
+One spreadsheet row is one debtor, optionally with one debt (installment);
+rows repeating a CPF/CNPJ attach more debts to the same debtor.
+
+    result = import_debtors("planilha.xlsx", client_id=1)
+    print(result["rows_per_sec"], len(result["rejects"]))
+"""
+import csv
+import io
+import os
+import time
+import unicodedata
+from datetime import date, datetime
+
+from src.database import refresh_kpi_summary
+from src.debtor_bundle import touch_debtor
+from src.query import bulk_insert, fetch_all, fetch_scalar, transaction
+from src.validators import ContactValidator, document_digits
+
+CHUNK_SIZE = 5000
+
+# Accepted spreadsheet headers (normalized: lowercase, no accents, "_" for spaces) -> field
+COLUMN_ALIASES = {
+    "name": "name", "nome": "name", "devedor": "name",
+    "cpf_cnpj": "cpf_cnpj", "cpf": "cpf_cnpj", "cnpj": "cpf_cnpj", "documento": "cpf_cnpj",
+    "rg": "rg",
+    "email": "email", "e-mail": "email",
+    "phone": "phone", "telefone": "phone", "celular": "phone",
+    "notes": "notes", "observacoes": "notes", "obs": "notes",
+    "contract_type": "contract_type", "tipo": "contract_type", "tipo_contrato": "contract_type", "tipo_de_contrato": "contract_type",
+    "description": "description", "descricao": "description",
+    "original_value": "original_value", "valor": "original_value", "valor_original": "original_value",
+    "due_date": "due_date", "vencimento": "due_date", "data_vencimento": "due_date",
+}
+
+DEBTOR_COLUMNS = ("client_id", "name", "cpf_cnpj", "cpf_cnpj_digits", "rg", "email", "phone", "notes")
+DEBT_COLUMNS = ("debtor_id", "client_id", "contract_type", "description", "original_value", "due_date")
+
+
+def _normalize_header(header):
+    text = unicodedata.normalize("NFKD", str(header or "")).encode("ascii", "ignore").decode()
+    return text.strip().lower().replace(" ", "_")
+
+
+def _map_headers(headers):
+    mapped = [COLUMN_ALIASES.get(_normalize_header(h)) for h in headers]
+    if "name" not in mapped or "cpf_cnpj" not in mapped:
+        raise ValueError("A planilha precisa das colunas 'nome' e 'cpf_cnpj'.")
+    return mapped
+
+
+def _chunked(records, headers, chunk_size):
+    """Groups (line number, {field: value}) records into lists of chunk_size."""
+    chunk = []
+    for line, values in records:
+        row = {field: value for field, value in zip(headers, values) if field}
+        chunk.append((line, row))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _iter_csv(source, chunk_size, encoding):
+    stream = open(source, "rb") if isinstance(source, (str, os.PathLike)) else source
+    text = io.TextIOWrapper(stream, encoding=encoding, newline="")
+    try:
+        sample = text.read(64 * 1024)
+        text.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=";,\t|")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(text, dialect)
+        headers = _map_headers(next(reader, []))
+        # Header is line 1; data starts at line 2
+        yield from _chunked(enumerate(reader, start=2), headers, chunk_size)
+    finally:
+        text.detach()
+        if stream is not source:
+            stream.close()
+
+
+def _iter_xlsx(source, chunk_size):
+    from openpyxl import load_workbook
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        headers = _map_headers(next(rows, ()))
+        yield from _chunked(enumerate(rows, start=2), headers, chunk_size)
+    finally:
+        workbook.close()
+
+
+def iter_chunks(source, filename=None, chunk_size=CHUNK_SIZE, encoding="utf-8-sig"):
+    """Yields lists of (line number, row dict) from a CSV/XLSX path or file object."""
+    filename = filename or getattr(source, "name", None) or str(source)
+    if filename.lower().endswith((".xlsx", ".xlsm")):
+        return _iter_xlsx(source, chunk_size)
+    return _iter_csv(source, chunk_size, encoding)
+
+
+def _text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _parse_value(value):
+    """Accepts numbers and Brazilian ("R$ 1.234,56") or plain ("1234.56") text."""
+    if isinstance(value, (int, float)):
+        amount = float(value)
+    else:
+        text = str(value).replace("R$", "").replace(" ", "")
+        if "," in text:
+            text = text.replace(".", "").replace(",", ".")
+        amount = float(text)
+    if amount <= 0:
+        raise ValueError
+    return amount
+
+
+def _parse_date(value):
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    text = str(value).strip()
+    for fmt in ("%d/%m/%Y", "%Y-%m-%d", "%d-%m-%Y", "%Y-%m-%d %H:%M:%S"):
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    raise ValueError
+
+
+class _RowValidator:
+    """Validates rows, remembering results for documents/phones/emails already seen."""
+
+    def __init__(self):
+        self._documents = {}
+        self._phones = {}
+        self._emails = {}
+
+    @staticmethod
+    def _check(cache, value, validate):
+        result = cache.get(value)
+        if result is None:
+            result = cache[value] = validate(value)
+        return result
+
+    @staticmethod
+    def _validate_document(value):
+        digits = document_digits(value) or ""
+        if len(digits) == 11:
+            return ContactValidator.validate_cpf(digits)
+        if len(digits) == 14:
+            return ContactValidator.validate_cnpj(digits)
+        return False, "CPF/CNPJ deve conter 11 ou 14 dígitos"
+
+    def validate(self, row):
+        """Returns (debtor dict, debt dict or None); raises ValueError with the reject reason."""
+        name = _text(row.get("name"))
+        if not name:
+            raise ValueError("Nome obrigatório")
+        raw_document = _text(row.get("cpf_cnpj"))
+        if not raw_document:
+            raise ValueError("CPF/CNPJ obrigatório")
+        ok, document = self._check(self._documents, raw_document, self._validate_document)
+        if not ok:
+            raise ValueError(document)
+
+        debtor = {
+            "name": name, "cpf_cnpj": document, "cpf_cnpj_digits": document_digits(document),
+            "rg": _text(row.get("rg")), "notes": _text(row.get("notes")), "phone": None, "email": None,
+        }
+        phone = _text(row.get("phone"))
+        if phone:
+            ok, debtor["phone"] = self._check(self._phones, phone, ContactValidator.validate_phone)
+            if not ok:
+                raise ValueError(debtor["phone"])
+        email = _text(row.get("email"))
+        if email:
+            ok, debtor["email"] = self._check(self._emails, email, ContactValidator.validate_email)
+            if not ok:
+                raise ValueError(debtor["email"])
+
+        value = row.get("original_value")
+        due_date = row.get("due_date")
+        contract_type = _text(row.get("contract_type"))
+        if _text(value) is None and _text(due_date) is None and contract_type is None:
+            return debtor, None
+        if not contract_type:
+            raise ValueError("Tipo de contrato obrigatório para a dívida")
+        try:
+            value = _parse_value(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Valor inválido: {value}")
+        try:
+            due_date = _parse_date(due_date)
+        except (TypeError, ValueError):
+            raise ValueError(f"Vencimento inválido: {due_date}")
+        debt = {
+            "contract_type": contract_type.upper(), "description": _text(row.get("description")),
+            "original_value": value, "due_date": due_date,
+        }
+        return debtor, debt
+
+
+def _write_chunk(client_id, valid, known, tx):
+    """Inserts new debtors and all debts of one validated chunk.
+
+    Returns ({digits: id} of debtors created, number of debts created); `known` is
+    left untouched so a rolled-back chunk doesn't leave stale ids behind.
+    """
+    new_debtors = {}
+    for debtor, _ in valid:
+        digits = debtor["cpf_cnpj_digits"]
+        if digits not in known and digits not in new_debtors:
+            new_debtors[digits] = tuple(client_id if c == "client_id" else debtor[c] for c in DEBTOR_COLUMNS)
+    created = {}
+    if new_debtors:
+        last_id = fetch_scalar("SELECT COALESCE(MAX(id), 0) FROM debtors", tx=tx)
+        bulk_insert("debtors", DEBTOR_COLUMNS, new_debtors.values(), tx=tx)
+        rows = fetch_all("SELECT id, cpf_cnpj_digits FROM debtors WHERE client_id = :client_id AND id > :last_id",
+                         {"client_id": client_id, "last_id": last_id}, tx=tx)
+        created = {digits: debtor_id for debtor_id, digits in rows if digits in new_debtors}
+
+    debts = []
+    for debtor, debt in valid:
+        if debt is not None:
+            digits = debtor["cpf_cnpj_digits"]
+            debtor_id = known[digits] if digits in known else created[digits]
+            debts.append((debtor_id, client_id, debt["contract_type"], debt["description"],
+                          debt["original_value"], debt["due_date"]))
+    bulk_insert("debts", DEBT_COLUMNS, debts, tx=tx)
+    return created, len(debts)
+
+
+def _write_rows(client_id, valid, sources, known, preexisting, matched, result, retry=False):
+    """Writes validated rows (`sources`: their (line, row)) in one transaction. If the
+    database refuses it, retries in halves down to single rows, so only the rows that
+    fail are rejected; `known`, `matched` and the counts follow what was written."""
+    try:
+        with transaction() as tx:
+            created, debts = _write_chunk(client_id, valid, known, tx)
+    except Exception as e:
+        if len(valid) == 1:
+            line, row = sources[0]
+            result["rejects"].append({"linha": line, "motivo": f"Erro no banco: {e}", **row})
+            return
+        if not retry:
+            print(f"Import chunk ending at line {sources[-1][0]} failed ({e}); retrying in smaller batches")
+        middle = len(valid) // 2
+        _write_rows(client_id, valid[:middle], sources[:middle], known, preexisting, matched, result, retry=True)
+        _write_rows(client_id, valid[middle:], sources[middle:], known, preexisting, matched, result, retry=True)
+        return
+    known.update(created)
+    matched.update(d["cpf_cnpj_digits"] for d, _ in valid if d["cpf_cnpj_digits"] in preexisting)
+    result["debtors_created"] += len(created)
+    result["debts_created"] += debts
+
+
+def import_debtors(source, client_id, filename=None, chunk_size=CHUNK_SIZE, progress=None):
+    """Imports a CSV/XLSX of debtors (and their debts) into one client.
+
+    `progress`, if given, is called with the number of rows processed after each chunk.
+    Returns a dict with rows, debtors_created, debtors_existing, debts_created,
+    rejects (list of {"linha", "motivo", ...row}), seconds and rows_per_sec.
+    """
+    if fetch_scalar("SELECT id FROM clients WHERE id = :id", {"id": client_id}) is None:
+        raise ValueError(f"Cliente {client_id} não encontrado.")
+
+    started = time.perf_counter()
+    # CPF/CNPJ digits -> debtor id for this client, loaded once and grown per chunk
+    known = dict((digits, debtor_id) for debtor_id, digits in fetch_all(
+        "SELECT id, cpf_cnpj_digits FROM debtors WHERE client_id = :client_id AND cpf_cnpj_digits IS NOT NULL",
+        {"client_id": client_id}))
+    preexisting = set(known)
+    validator = _RowValidator()
+    result = {"rows": 0, "debtors_created": 0, "debtors_existing": 0, "debts_created": 0, "rejects": []}
+    matched = set()
+
+    try:
+        for chunk in iter_chunks(source, filename, chunk_size):
+            valid, sources = [], []
+            for line, row in chunk:
+                try:
+                    valid.append(validator.validate(row))
+                    sources.append((line, row))
+                except ValueError as e:
+                    result["rejects"].append({"linha": line, "motivo": str(e), **row})
+            if valid:
+                _write_rows(client_id, valid, sources, known, preexisting, matched, result)
+            result["rows"] += len(chunk)
+            if progress:
+                progress(result["rows"])
+    finally:
+        refresh_kpi_summary(client_id)
+        # Existing debtors may have new debts
+        touch_debtor()
+
+    result["debtors_existing"] = len(matched)
+    result["seconds"] = time.perf_counter() - started
+    result["rows_per_sec"] = result["rows"] / result["seconds"] if result["seconds"] > 0 else 0
+    return result
+
+
+def rejects_to_csv(rejects):
+    """Reject report as CSV bytes (Excel-friendly: UTF-8 BOM, ';' separator)."""
+    fields = ["linha", "motivo"]
+    for reject in rejects:
+        fields.extend(k for k in reject if k not in fields)
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, delimiter=";", extrasaction="ignore")
+    writer.writeheader()
+    writer.writerows(rejects)
+    return buffer.getvalue().encode("utf-8-sig")
@@ -0,0 +1,107 @@
+"""Job kinds run by the background workers (see src/jobs.py).
+
+Each is `kind(job, **params)`, reports through job.progress() and returns a
+JSON-serializable dict shown by the page that submitted it. Files they produce
+go to EXPORT_DIR (exports, PDFs) or JOB_FILES_DIR (reject reports).
+"""
+import os
+import time
+from datetime import datetime
+
+from src.jobs import JOB_FILES_DIR, JobCancelled
+from src.query import fetch_scalar
+
+
+def _export_path(prefix, job, extension):
+    from src.export import EXPORT_DIR
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    return os.path.join(EXPORT_DIR, f"{prefix}_{datetime.now():%Y%m%d_%H%M%S}_{job.id}.{extension}")
+
+
+def _remove(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def noop(job, seconds=0):
+    """Does nothing (for `seconds`): queue benchmarks and worker checks."""
+    if seconds:
+        time.sleep(seconds)
+    return {}
+
+
+def update_indices(job):
+    """Refreshes the financial indices and reloads them in this worker."""
+    from src.bootstrap import _load_indices
+    from src.calculator import IndicesManager
+    from src.services import update_all_indices
+
+    job.progress(0, message="Atualizando índices...", force=True)
+    update_all_indices()
+    IndicesManager.sync()
+    _load_indices()
+    return {"updated_at": datetime.now().isoformat(timespec="seconds")}
+
+
+def import_debtors(job, path, client_id, filename=None):
+    """Imports an uploaded CSV/XLSX (saved at `path`, removed afterwards) into a client.
+
+    Chunks already written stay if the job is cancelled or its worker dies (then it
+    fails rather than running again: see SINGLE_ATTEMPT_KINDS). Rejects go to a CSV report.
+    """
+    from src.importer import import_debtors as run_import, rejects_to_csv
+
+    filename = filename or os.path.basename(path)
+    total = None
+    if not filename.lower().endswith((".xlsx", ".xlsm")):
+        with open(path, "rb") as f:
+            total = max(sum(1 for _ in f) - 1, 1)
+    try:
+        result = run_import(path, client_id, filename=filename,
+                            progress=lambda rows: job.progress(rows, total, f"{rows:,} linhas processadas"))
+    finally:
+        _remove(path)
+    rejects = result.pop("rejects")
+    result["rejects"] = len(rejects)
+    if rejects:
+        os.makedirs(JOB_FILES_DIR, exist_ok=True)
+        result["rejects_path"] = os.path.join(JOB_FILES_DIR, f"job_{job.id}_rejeicoes.csv")
+        with open(result["rejects_path"], "wb") as f:
+            f.write(rejects_to_csv(rejects))
+        result["rejects_preview"] = rejects[:100]
+    return result
+
+
+def export_portfolio(job, fmt="csv", client_id=None, valuation=False):
+    """Exports the portfolio (valued with Calculator if `valuation`) to EXPORT_DIR."""
+    from src.calculator import IndicesManager
+    from src.export import _portfolio_query, export_portfolio as run_export
+
+    # Another worker may have downloaded new indices since this one loaded them
+    IndicesManager.sync()
+    sql, params = _portfolio_query(client_id)
+    total = fetch_scalar(f"SELECT count(*) FROM ({sql}) portfolio", params)
+    path = _export_path("carteira", job, fmt)
+    try:
+        stats = run_export(path, fmt, client_id=client_id, valuation=valuation,
+                           progress=lambda rows: job.progress(rows, total, f"{rows:,} linhas exportadas"))
+    except JobCancelled:
+        _remove(path)
+        raise
+    return {**stats, "path": path, "size_mb": os.path.getsize(path) / 1024 / 1024}
+
+
+def debt_memory_pdfs(job, client_id=None, calc_date=None):
+    """One "Memória de Cálculo" PDF per debtor with debts (of a client, or all), zipped."""
+    from src.calculator import IndicesManager
+    from src.reports import write_debt_memories
+
+    IndicesManager.sync()
+    path = _export_path("memorias", job, "zip")
+    try:
+        result = write_debt_memories(path, client_id, calc_date,
+                                     progress=lambda done, total: job.progress(done, total, f"{done:,} de {total:,} devedores"))
+    except JobCancelled:
+        _remove(path)
+        raise
+    return {**result, "path": path, "size_mb": os.path.getsize(path) / 1024 / 1024}
@@ -0,0 +1,278 @@
+"""Background jobs: long work (index refresh, imports, exports, batch PDFs) runs in
+worker processes instead of the Streamlit script, and survives the user leaving
+the page.
+
+Pages submit a job and poll its row in `jobs`; worker processes claim queued
+jobs, report progress and honour cancel requests:
+
+    job_id = submit("export_portfolio", {"fmt": "csv", "client_id": 1}, created_by="admin")
+    get_job(job_id)      # {"status": "running", "progress": 0.4, "message": "40,000 linhas", ...}
+    cancel_job(job_id)
+
+Job kinds are functions `kind(job, **params)` listed in JOB_KINDS (imported by
+the worker on first use); they call job.progress(done, total, message), which
+raises JobCancelled once a cancel was requested, and return a JSON-serializable
+result. Workers are long-lived, so what one job warms (financial indices, the
+pooled connections, PDF styles) serves the next.
+
+bootstrap() starts JOB_WORKERS worker processes with the app (scripts/job_worker.py,
+which exits with it); a job whose worker dies stops sending heartbeats and is
+queued again, up to JOB_MAX_ATTEMPTS runs, except SINGLE_ATTEMPT_KINDS, which fail.
+"""
+import importlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import traceback
+
+from src.config import JOB_HEARTBEAT_SECONDS, JOB_MAX_ATTEMPTS, JOB_POLL_SECONDS, JOB_WORKERS
+from src.query import execute, fetch_all, fetch_one, insert, transaction
+
+# Uploads and reports of jobs (imports, rejects)
+JOB_FILES_DIR = os.path.join("data", "jobs")
+# Job kind -> (module, function); the module is imported when a worker first runs one
+JOB_KINDS = {
+    "update_indices": ("src.job_tasks", "update_indices"),
+    "import_debtors": ("src.job_tasks", "import_debtors"),
+    "export_portfolio": ("src.job_tasks", "export_portfolio"),
+    "debt_memory_pdfs": ("src.job_tasks", "debt_memory_pdfs"),
+    "noop": ("src.job_tasks", "noop"),
+}
+# Kinds that commit as they go (imports write chunk by chunk): running one again after
+# its worker died would write the committed part twice, so it fails instead
+SINGLE_ATTEMPT_KINDS = ("import_debtors",)
+ACTIVE_STATUSES = ("queued", "running")
+# Seconds between progress writes of one job (each also checks for a cancel request)
+PROGRESS_INTERVAL = 0.5
+
+_JOB_COLUMNS = ("id, kind, params, status, progress, message, result, error, cancel_requested, attempts, "
+                "worker, created_by, created_at, started_at, finished_at, heartbeat_at")
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_supervisor = {}
+
+
+class JobCancelled(Exception):
+    """Raised by Job.progress() in a job whose cancellation was requested."""
+
+
+def _job_dict(row):
+    job = dict(zip(_JOB_COLUMNS.split(", "), row))
+    job["params"] = json.loads(job["params"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+def submit(kind, params=None, created_by=None):
+    """Queues a job and returns its id."""
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Tipo de tarefa desconhecido: {kind}")
+    return insert("INSERT INTO jobs (kind, params, created_by, created_at) VALUES (:kind, :params, :created_by, :now)",
+                  {"kind": kind, "params": json.dumps(params or {}), "created_by": created_by, "now": time.time()})
+
+
+def get_job(job_id):
+    """The job as a dict (params and result decoded), or None."""
+    row = fetch_one(f"SELECT {_JOB_COLUMNS} FROM jobs WHERE id = :id", {"id": job_id})
+    return _job_dict(row) if row else None
+
+
+def list_jobs(limit=20, created_by=None):
+    """The latest jobs, newest first (of one user, if given)."""
+    where = " WHERE created_by = :created_by" if created_by else ""
+    rows = fetch_all(f"SELECT {_JOB_COLUMNS} FROM jobs{where} ORDER BY id DESC LIMIT :limit",
+                     {"created_by": created_by, "limit": limit})
+    return [_job_dict(row) for row in rows]
+
+
+def cancel_job(job_id):
+    """Cancels a queued job at once, or asks a running one to stop. True if either applied."""
+    with transaction() as tx:
+        if execute("UPDATE jobs SET status = 'cancelled', finished_at = :now WHERE id = :id AND status = 'queued'",
+                   {"id": job_id, "now": time.time()}, tx=tx):
+            return True
+        return execute("UPDATE jobs SET cancel_requested = 1 WHERE id = :id AND status = 'running'",
+                       {"id": job_id}, tx=tx) > 0
+
+
+class Job:
+    """A claimed job, as its kind function sees it."""
+
+    def __init__(self, job_id, kind, params):
+        self.id = job_id
+        self.kind = kind
+        self.params = params
+        self._reported_at = 0.0
+
+    def progress(self, done, total=None, message=None, force=False):
+        """Records progress (done of total, when known) at most every PROGRESS_INTERVAL
+        seconds; raises JobCancelled if the job was asked to stop."""
+        now = time.monotonic()
+        if not force and now - self._reported_at < PROGRESS_INTERVAL:
+            return
+        self._reported_at = now
+        with transaction() as tx:
+            execute("UPDATE jobs SET progress = :progress, message = :message, heartbeat_at = :now WHERE id = :id",
+                    {"id": self.id, "progress": min(done / total, 1.0) if total else None, "message": message,
+                     "now": time.time()}, tx=tx)
+            cancelled = fetch_one("SELECT cancel_requested FROM jobs WHERE id = :id", {"id": self.id}, tx=tx)[0]
+        if cancelled:
+            raise JobCancelled()
+
+
+def claim_job(worker):
+    """Marks the oldest queued job as running by `worker` and returns it (a Job), or None."""
+    with transaction() as tx:
+        # SKIP LOCKED: concurrent workers on Postgres take different jobs instead of queueing on one row
+        lock = " FOR UPDATE SKIP LOCKED" if tx.dialect.is_postgres else ""
+        row = fetch_one(f"SELECT id, kind, params FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1{lock}", tx=tx)
+        if row is None:
+            return None
+        now = time.time()
+        claimed = execute("""
+            UPDATE jobs SET status = 'running', worker = :worker, attempts = attempts + 1,
+                            started_at = :now, heartbeat_at = :now, progress = NULL, message = NULL
+            WHERE id = :id AND status = 'queued'
+        """, {"id": row[0], "worker": worker, "now": now}, tx=tx)
+    # Another SQLite process took it between our SELECT and UPDATE
+    return Job(row[0], row[1], json.loads(row[2])) if claimed else None
+
+
+def requeue_stale_jobs():
+    """Jobs 'running' without a heartbeat for 3 intervals lost their worker: queued again,
+    or failed after JOB_MAX_ATTEMPTS runs (after one, for SINGLE_ATTEMPT_KINDS).
+    Returns how many were touched."""
+    single = ", ".join(f"'{kind}'" for kind in SINGLE_ATTEMPT_KINDS)
+    params = {"cutoff": time.time() - 3 * JOB_HEARTBEAT_SECONDS, "attempts": JOB_MAX_ATTEMPTS, "now": time.time(),
+              "interrupted": "Processo da tarefa interrompido.",
+              "partial": "Processo da tarefa interrompido; o que já foi gravado permanece. "
+                         "Confira antes de enviar de novo."}
+    with transaction() as tx:
+        failed = execute(f"""
+            UPDATE jobs SET status = 'failed', finished_at = :now,
+                            error = CASE WHEN kind IN ({single}) THEN :partial ELSE :interrupted END
+            WHERE status = 'running' AND heartbeat_at < :cutoff AND (attempts >= :attempts OR kind IN ({single}))
+        """, params, tx=tx)
+        requeued = execute("""
+            UPDATE jobs SET status = 'queued', worker = NULL
+            WHERE status = 'running' AND heartbeat_at < :cutoff AND attempts < :attempts
+        """, params, tx=tx)
+    return failed + requeued
+
+
+def _finish(job_id, status, result=None, error=None):
+    execute("""
+        UPDATE jobs SET status = :status, result = :result, error = :error, finished_at = :now, heartbeat_at = :now,
+                        progress = CASE WHEN :status = 'done' THEN 1.0 ELSE progress END
+        WHERE id = :id
+    """, {"id": job_id, "status": status, "result": json.dumps(result, default=str) if result is not None else None,
+          "error": error, "now": time.time()})
+
+
+def _heartbeat(job_id, stop):
+    # Keeps a job that reports no progress for a while from looking abandoned
+    while not stop.wait(JOB_HEARTBEAT_SECONDS):
+        try:
+            execute("UPDATE jobs SET heartbeat_at = :now WHERE id = :id", {"id": job_id, "now": time.time()})
+        except Exception as e:
+            print(f"Job {job_id} heartbeat failed: {e}")
+
+
+def run_job(job):
+    """Runs a claimed job to its end state: done, failed or cancelled."""
+    stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(job.id, stop), name=f"job-{job.id}-heartbeat", daemon=True).start()
+    try:
+        module_name, function_name = JOB_KINDS[job.kind]
+        result = getattr(importlib.import_module(module_name), function_name)(job, **job.params)
+    except JobCancelled:
+        _finish(job.id, "cancelled")
+    except Exception as e:
+        traceback.print_exc()
+        _finish(job.id, "failed", error=f"{type(e).__name__}: {e}")
+    else:
+        _finish(job.id, "done", result=result)
+    finally:
+        stop.set()
+
+
+def warm_up():
+    """Loads what most jobs need once per worker: schema, financial indices."""
+    from src.bootstrap import _load_indices
+    from src.database import init_db
+    init_db()
+    _load_indices()
+
+
+def work(worker=None, max_jobs=None, exit_when_idle=False):
+    """Worker loop: claims and runs jobs until `max_jobs` ran, the queue is empty
+    (exit_when_idle) or the process that started this one exits. Returns the jobs run."""
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    parent = os.getppid()
+    ran = 0
+    checked_stale = 0.0
+    while max_jobs is None or ran < max_jobs:
+        if os.getppid() != parent:
+            break
+        if time.monotonic() - checked_stale > JOB_HEARTBEAT_SECONDS:
+            checked_stale = time.monotonic()
+            requeue_stale_jobs()
+        job = claim_job(worker)
+        if job is None:
+            if exit_when_idle:
+                break
+            time.sleep(JOB_POLL_SECONDS)
+            continue
+        run_job(job)
+        ran += 1
+    return ran
+
+
+def worker_main(worker=None, exit_when_idle=False):
+    """Entry point of a worker process."""
+    warm_up()
+    work(worker, exit_when_idle=exit_when_idle)
+
+
+def run_pool(processes=JOB_WORKERS, exit_when_idle=False):
+    """Runs `processes` worker processes until they all exit, or the process that
+    started this one does (a job cut short is queued again by the stale check)."""
+    import multiprocessing
+    context = multiprocessing.get_context("spawn")
+    host = socket.gethostname()
+    workers = [
+        context.Process(target=worker_main, args=(f"{host}:{os.getpid()}-{n}", exit_when_idle),
+                        name=f"job-worker-{n}", daemon=True)
+        for n in range(processes)
+    ]
+    for process in workers:
+        process.start()
+    parent = os.getppid()
+    try:
+        # The workers watch this process; this one watches the app that started it
+        while any(process.is_alive() for process in workers) and os.getppid() == parent:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in workers:
+            if process.is_alive():
+                process.terminate()
+
+
+def start_background_workers(processes=JOB_WORKERS):
+    """Starts scripts/job_worker.py with `processes` workers for this app process,
+    unless already running. The workers exit when this process does."""
+    if processes <= 0:
+        return None
+    process = _supervisor.get("process")
+    if process is not None and process.poll() is None:
+        return process
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [_ROOT, os.environ.get("PYTHONPATH")])))
+    process = subprocess.Popen([sys.executable, os.path.join(_ROOT, "scripts", "job_worker.py"),
+                                "--processes", str(processes)], env=env, cwd=os.getcwd())
+    _supervisor["process"] = process
+    return process
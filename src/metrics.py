@@ -0,0 +1,171 @@
+"""Per-page rerun metrics: render time, SQL statements, rows fetched,
+Calculator.calculate calls and PDF builds.
+
+Off unless METRICS_ENABLED (or switched on from the admin sidebar panel).
+app.py renders each page inside page_rerun(); while it runs, the query layer,
+the Calculator and PDFGenerator report to the rerun of their thread (Streamlit
+runs each script execution on its own thread). When disabled, a hook costs one
+global lookup.
+
+    with page_rerun("Dashboard") as rerun:
+        render_dashboard()
+    rerun                # {"page": "Dashboard", "ms": 41.2, "query": 6, "query_ms": 3.1, "rows": 58, ...}
+    page_summary()       # per-page totals since start/reset
+
+With METRICS_FILE set, each rerun is also written out: one JSON line per rerun
+for a .jsonl path, otherwise the per-page totals in the Prometheus text format
+(for node_exporter's textfile collector or any scraper reading the file).
+"""
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from src.config import METRICS_ENABLED, METRICS_FILE
+
+RECENT_RERUNS = 50
+
+enabled = METRICS_ENABLED
+_local = threading.local()
+_lock = threading.Lock()
+# page -> {"reruns", "ms", "max_ms", "query", "query_ms", "rows", ...}
+_pages = {}
+_recent = deque(maxlen=RECENT_RERUNS)
+
+# (metric, help, key in the page totals, unit scale); *_max are gauges, the rest counters
+_PROMETHEUS = (
+    ("credminer_page_reruns_total", "Reruns of the page.", "reruns", 1),
+    ("credminer_page_rerun_seconds_total", "Time spent rendering the page.", "ms", 0.001),
+    ("credminer_page_rerun_seconds_max", "Slowest rerun of the page.", "max_ms", 0.001),
+    ("credminer_page_queries_total", "SQL statements run while rendering the page.", "query", 1),
+    ("credminer_page_query_seconds_total", "Time spent in SQL statements.", "query_ms", 0.001),
+    ("credminer_page_rows_fetched_total", "Rows fetched by the page's queries.", "rows", 1),
+    ("credminer_page_calculations_total", "Calculator.calculate calls.", "calculate", 1),
+    ("credminer_page_calculation_seconds_total", "Time spent in Calculator.calculate.", "calculate_ms", 0.001),
+    ("credminer_page_pdf_builds_total", "PDFs generated.", "pdf", 1),
+    ("credminer_page_pdf_build_seconds_total", "Time spent generating PDFs.", "pdf_ms", 0.001),
+)
+
+
+def set_enabled(flag):
+    """Turns collection on or off for the whole process."""
+    global enabled
+    enabled = bool(flag)
+
+
+def observe(name, elapsed_ms):
+    """Counts one `name` event (query, calculate, pdf) that took elapsed_ms in the current rerun."""
+    if not enabled:
+        return
+    rerun = getattr(_local, "rerun", None)
+    if rerun is not None:
+        rerun[name] = rerun.get(name, 0) + 1
+        rerun[name + "_ms"] = rerun.get(name + "_ms", 0.0) + elapsed_ms
+
+
+def add(name, amount):
+    """Adds `amount` to the current rerun's `name` counter (rows fetched)."""
+    if not enabled:
+        return
+    rerun = getattr(_local, "rerun", None)
+    if rerun is not None:
+        rerun[name] = rerun.get(name, 0) + amount
+
+
+def timed(name):
+    """Decorator: observe(name, ...) with the duration of every call."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled or getattr(_local, "rerun", None) is None:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(name, (time.perf_counter() - started) * 1000)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def page_rerun(page):
+    """Collects the metrics of one page render; yields the rerun's dict (None when disabled)."""
+    if not enabled:
+        yield None
+        return
+    rerun = _local.rerun = {"page": page}
+    started = time.perf_counter()
+    try:
+        yield rerun
+    finally:
+        _local.rerun = None
+        rerun["ms"] = (time.perf_counter() - started) * 1000
+        rerun["at"] = time.time()
+        _finish(rerun)
+
+
+def _finish(rerun):
+    with _lock:
+        totals = _pages.setdefault(rerun["page"], {"reruns": 0, "max_ms": 0.0})
+        totals["reruns"] += 1
+        totals["max_ms"] = max(totals["max_ms"], rerun["ms"])
+        for key, value in rerun.items():
+            if key not in ("page", "at"):
+                totals[key] = totals.get(key, 0) + value
+        _recent.appendleft(rerun)
+    if METRICS_FILE:
+        try:
+            _export(rerun)
+        except OSError as e:
+            print(f"Error writing metrics file: {e}")
+
+
+def _export(rerun):
+    if METRICS_FILE.endswith(".jsonl"):
+        line = json.dumps(rerun, ensure_ascii=False) + "\n"
+        with _lock, open(METRICS_FILE, "a", encoding="utf-8") as f:
+            f.write(line)
+        return
+    # Replaced whole, so a scraper never reads a half-written file
+    temp = f"{METRICS_FILE}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp, "w", encoding="utf-8") as f:
+        f.write(prometheus_text())
+    os.replace(temp, METRICS_FILE)
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text():
+    """Per-page totals in the Prometheus text exposition format."""
+    pages = page_summary()
+    lines = []
+    for metric, help_text, key, scale in _PROMETHEUS:
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {'gauge' if metric.endswith('_max') else 'counter'}")
+        for page, totals in sorted(pages.items()):
+            lines.append(f'{metric}{{page="{_label(page)}"}} {totals.get(key, 0) * scale:g}')
+    return "\n".join(lines) + "\n"
+
+
+def page_summary():
+    """{page: totals since start/reset}: reruns, ms, max_ms and the summed counters."""
+    with _lock:
+        return {page: dict(totals) for page, totals in _pages.items()}
+
+
+def recent_reruns():
+    """The last RECENT_RERUNS reruns of any session, newest first."""
+    with _lock:
+        return [dict(rerun) for rerun in _recent]
+
+
+def reset_metrics():
+    with _lock:
+        _pages.clear()
+        _recent.clear()
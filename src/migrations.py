@@ -0,0 +1,1039 @@
+"""Versioned schema migrations shared by the SQLite and PostgreSQL backends.
+
+Each migration is applied once and recorded in `schema_migrations`; on later
+process starts a single version check skips all of them. Append new migrations
+to MIGRATIONS with the next version number - never edit an applied one.
+"""
+import re
+
+from src.connection import get_dialect
+from src.validators import document_digits
+
+# Arbitrary key for pg_advisory_lock so concurrent app processes migrate one at a time
+MIGRATION_LOCK_KEY = 724061
+
+# (index name, table, columns) - secondary indexes on foreign keys and filter columns
+INDEXES = [
+    ("idx_debtors_client_id", "debtors", "client_id"),
+    ("idx_debtors_name", "debtors", "name"),
+    ("idx_contact_history_debtor_id", "contact_history", "debtor_id"),
+    ("idx_guarantors_debtor_id", "guarantors", "debtor_id"),
+    ("idx_addresses_debtor_id", "addresses", "debtor_id"),
+    ("idx_addresses_guarantor_id", "addresses", "guarantor_id"),
+    ("idx_debts_debtor_id", "debts", "debtor_id"),
+    ("idx_debts_client_id", "debts", "client_id"),
+    ("idx_legal_expenses_debtor_date", "legal_expenses", "debtor_id, date"),
+    ("idx_agreements_debtor_id", "agreements", "debtor_id"),
+    ("idx_agreements_client_status", "agreements", "client_id, status"),
+    ("idx_agreements_status", "agreements", "status"),
+    ("idx_payments_debtor_date", "payments", "debtor_id, payment_date"),
+    ("idx_payments_agreement_id", "payments", "agreement_id"),
+    ("idx_payments_client_id", "payments", "client_id"),
+    ("idx_judicial_processes_debtor_id", "judicial_processes", "debtor_id"),
+    ("idx_judicial_processes_client_status", "judicial_processes", "client_id, status"),
+    ("idx_judicial_petitions_process_date", "judicial_petitions", "process_id, petition_date"),
+    ("idx_petition_templates_process_type", "petition_templates", "process_type"),
+    ("idx_kanban_cards_status_order", "kanban_cards", "status, order_index"),
+]
+
+# Page/database queries that must be served by an index: (label, sql, params, expected index)
+INDEX_CHECK_QUERIES = [
+    ("debts por devedor", "SELECT * FROM debts WHERE debtor_id = ?", (1,), "idx_debts_debtor_id"),
+    ("custas por devedor", "SELECT * FROM legal_expenses WHERE debtor_id = ? ORDER BY date DESC", (1,), "idx_legal_expenses_debtor_date"),
+    ("pagamentos por devedor", "SELECT * FROM payments WHERE debtor_id = ? ORDER BY payment_date DESC", (1,), "idx_payments_debtor_date"),
+    ("processos por devedor", "SELECT * FROM judicial_processes WHERE debtor_id = ?", (1,), "idx_judicial_processes_debtor_id"),
+    ("acordos por devedor", "SELECT * FROM agreements WHERE debtor_id = ?", (1,), "idx_agreements_debtor_id"),
+    ("acordos ativos", "SELECT count(*) FROM agreements WHERE status = ?", ("active",), "idx_agreements_status"),
+    ("kanban por coluna", "SELECT id, title, description, status, order_index FROM kanban_cards WHERE status = ? ORDER BY order_index ASC", ("todo",), "idx_kanban_cards_status_order"),
+    ("petições por processo", "SELECT id, petition_type, template_id, petition_date, status, content FROM judicial_petitions WHERE process_id = ? ORDER BY petition_date DESC", (1,), "idx_judicial_petitions_process_date"),
+    ("devedor por documento", "SELECT id FROM debtors WHERE cpf_cnpj_digits = ?", ("52998224725",), "idx_debtors_cpf_cnpj_digits"),
+    ("devedor por cliente e documento", "SELECT id FROM debtors WHERE client_id = ? AND cpf_cnpj_digits = ?", (1, "52998224725"), "idx_debtors_client_document"),
+    ("devedores por nome (página)", "SELECT id, client_id, name, cpf_cnpj FROM debtors WHERE (name, id) > (?, ?) ORDER BY name, id LIMIT 50", ("M", 0), "idx_debtors_name_id"),
+    ("devedores do cliente por nome (página)", "SELECT id, client_id, name, cpf_cnpj FROM debtors WHERE client_id = ? AND (name, id) > (?, ?) ORDER BY name, id LIMIT 50", (1, "M", 0), "idx_debtors_client_name"),
+    ("modelos por tipo", "SELECT id, name FROM petition_templates WHERE process_type = ?", ("inicial",), "idx_petition_templates_process_type"),
+]
+
+
+def _m001_base_schema(cursor, dialect):
+    """Initial tables (previously re-created by init_db on every run)."""
+    if dialect.is_postgres:
+        # PostgreSQL Table Definitions
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS clients (
+                id SERIAL PRIMARY KEY,
+                name TEXT NOT NULL,
+                cnpj TEXT UNIQUE,
+                email TEXT,
+                phone TEXT,
+                address TEXT,
+                main_forum TEXT,
+                jurisdiction_state TEXT,
+                notes TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS client_forums (
+                id SERIAL PRIMARY KEY,
+                client_id INTEGER NOT NULL,
+                forum_name TEXT NOT NULL,
+                forum_code TEXT,
+                state TEXT,
+                city TEXT,
+                is_main BOOLEAN DEFAULT false,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (client_id) REFERENCES clients (id) ON DELETE CASCADE,
+                UNIQUE(client_id, forum_code)
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                id SERIAL PRIMARY KEY,
+                username TEXT UNIQUE NOT NULL,
+                password_hash TEXT NOT NULL,
+                client_id INTEGER REFERENCES clients (id) ON DELETE SET NULL
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS debtors (
+                id SERIAL PRIMARY KEY,
+                client_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                cpf_cnpj TEXT,
+                rg TEXT,
+                email TEXT,
+                phone TEXT,
+                notes TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (client_id) REFERENCES clients (id) ON DELETE CASCADE
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS contact_history (
+                id SERIAL PRIMARY KEY,
+                debtor_id INTEGER NOT NULL,
+                client_id INTEGER NOT NULL,
+                contact_type TEXT NOT NULL,
+                contact_value TEXT NOT NULL,
+                status TEXT DEFAULT 'ativo',
+                notes TEXT,
+                attempt_date DATE,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (debtor_id) REFERENCES debtors (id) ON DELETE CASCADE,
+                FOREIGN KEY (client_id) REFERENCES clients (id) ON DELETE CASCADE
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS guarantors (
+                id SERIAL PRIMARY KEY,
+                debtor_id INTEGER NOT NULL,
+                client_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                cpf TEXT,
+                rg TEXT,
+                email TEXT,
+                phone TEXT,
+                notes TEXT,
+                FOREIGN KEY (debtor_id) REFERENCES debtors (id) ON DELETE CASCADE,
+                FOREIGN KEY (client_id) REFERENCES clients (id) ON DELETE CASCADE
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS addresses (
+                id SERIAL PRIMARY KEY,
+                debtor_id INTEGER,
+                guarantor_id INTEGER,
+                client_id INTEGER NOT NULL,
+                cep TEXT,
+                street TEXT,
+                number TEXT,
+                neighborhood TEXT,
+                city TEXT,
+                state TEXT,
+                is_primary BOOLEAN DEFAULT false,
+                FOREIGN KEY (debtor_id) REFERENCES debtors (id) ON DELETE CASCADE,
+                FOREIGN KEY (guarantor_id) REFERENCES guarantors (id) ON DELETE CASCADE,
+                FOREIGN KEY (client_id) REFERENCES clients (id) ON DELETE CASCADE
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS debts (
+                id SERIAL PRIMARY KEY,
+                debtor_id INTEGER NOT NULL,
+                client_id INTEGER NOT NULL,
+                contract_type TEXT NOT NULL,
+                description TEXT,
+                original_value NUMERIC NOT NULL,
+                due_date DATE NOT NULL,
+                fine_type TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (debtor_id) REFERENCES debtors (id) ON DELETE CASCADE,
+                FOREIGN KEY (client_id) REFERENCES clients (id) ON DELETE CASCADE
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS legal_expenses (
+                id SERIAL PRIMARY KEY,
+                debtor_id INTEGER NOT NULL,
+                client_id INTEGER NOT NULL,
+                description TEXT NOT NULL,
+                value NUMERIC NOT NULL,
+                date DATE,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (debtor_id) REFERENCES debtors (id) ON DELETE CASCADE,
+                FOREIGN KEY (client_id) REFERENCES clients (id) ON DELETE CASCADE
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS agreements (
+                id SERIAL PRIMARY KEY,
+                debtor_id INTEGER NOT NULL,
+                client_id INTEGER NOT NULL,
+                debt_id INTEGER,
+                status TEXT DEFAULT 'active',
+                agreement_date DATE NOT NULL,
+                agreed_value NUMERIC NOT NULL,
+                total_installments INTEGER DEFAULT 1,
+                installment_value NUMERIC,
+                interest_rate NUMERIC DEFAULT 0,
+                first_installment_date DATE,
+                notes TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (debtor_id) REFERENCES debtors (id) ON DELETE CASCADE,
+                FOREIGN KEY (client_id) REFERENCES clients (id) ON DELETE CASCADE,
+                FOREIGN KEY (debt_id) REFERENCES debts (id) ON DELETE SET NULL
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS payments (
+                id SERIAL PRIMARY KEY,
+                agreement_id INTEGER,
+                debt_id INTEGER,
+                debtor_id INTEGER NOT NULL,
+                client_id INTEGER NOT NULL,
+                payment_date DATE NOT NULL,
+                amount NUMERIC NOT NULL,
+                installment_number INTEGER,
+                payment_method TEXT,
+                notes TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (agreement_id) REFERENCES agreements (id) ON DELETE SET NULL,
+                FOREIGN KEY (debt_id) REFERENCES debts (id) ON DELETE SET NULL,
+                FOREIGN KEY (debtor_id) REFERENCES debtors (id) ON DELETE CASCADE,
+                FOREIGN KEY (client_id) REFERENCES clients (id) ON DELETE CASCADE
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS judicial_processes (
+                id SERIAL PRIMARY KEY,
+                debtor_id INTEGER NOT NULL,
+                client_id INTEGER NOT NULL,
+                debt_id INTEGER,
+                process_type TEXT NOT NULL,
+                process_number TEXT UNIQUE,
+                forum_id INTEGER,
+                vara TEXT,
+                distribution_date DATE,
+                status TEXT DEFAULT 'ativo',
+                description TEXT,
+                notes TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (debtor_id) REFERENCES debtors (id) ON DELETE CASCADE,
+                FOREIGN KEY (client_id) REFERENCES clients (id) ON DELETE CASCADE,
+                FOREIGN KEY (debt_id) REFERENCES debts (id) ON DELETE SET NULL,
+                FOREIGN KEY (forum_id) REFERENCES client_forums (id) ON DELETE SET NULL
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS petition_templates (
+                id SERIAL PRIMARY KEY,
+                name TEXT NOT NULL,
+                process_type TEXT NOT NULL,
+                description TEXT,
+                template_content TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS judicial_petitions (
+                id SERIAL PRIMARY KEY,
+                process_id INTEGER NOT NULL,
+                petition_type TEXT NOT NULL,
+                template_id INTEGER,
+                petition_date DATE,
+                status TEXT DEFAULT 'rascunho',
+                content TEXT,
+                notes TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (process_id) REFERENCES judicial_processes (id) ON DELETE CASCADE,
+                FOREIGN KEY (template_id) REFERENCES petition_templates (id) ON DELETE SET NULL
+            )
+        ''')
+
+        # Kanban / Board for simple task tracking
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS kanban_cards (
+                id SERIAL PRIMARY KEY,
+                title TEXT NOT NULL,
+                description TEXT,
+                status TEXT DEFAULT 'todo',
+                order_index INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS kanban_columns (
+                id SERIAL PRIMARY KEY,
+                name TEXT NOT NULL,
+                order_index INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+    else:
+        # SQLite Table Definitions (original)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS clients (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                cnpj TEXT UNIQUE,
+                email TEXT,
+                phone TEXT,
+                address TEXT,
+                main_forum TEXT,
+                jurisdiction_state TEXT,
+                notes TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS client_forums (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                client_id INTEGER NOT NULL,
+                forum_name TEXT NOT NULL,
+                forum_code TEXT,
+                state TEXT,
+                city TEXT,
+                is_main INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (client_id) REFERENCES clients (id),
+                UNIQUE(client_id, forum_code)
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                password_hash TEXT NOT NULL,
+                client_id INTEGER REFERENCES clients (id)
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS debtors (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                client_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                cpf_cnpj TEXT,
+                rg TEXT,
+                email TEXT,
+                phone TEXT,
+                notes TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (client_id) REFERENCES clients (id)
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS contact_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                debtor_id INTEGER NOT NULL,
+                client_id INTEGER NOT NULL,
+                contact_type TEXT NOT NULL,
+                contact_value TEXT NOT NULL,
+                status TEXT DEFAULT 'ativo',
+                notes TEXT,
+                attempt_date TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (debtor_id) REFERENCES debtors (id),
+                FOREIGN KEY (client_id) REFERENCES clients (id)
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS guarantors (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                debtor_id INTEGER NOT NULL,
+                client_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                cpf TEXT,
+                rg TEXT,
+                email TEXT,
+                phone TEXT,
+                notes TEXT,
+                FOREIGN KEY (debtor_id) REFERENCES debtors (id),
+                FOREIGN KEY (client_id) REFERENCES clients (id)
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS addresses (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                debtor_id INTEGER,
+                guarantor_id INTEGER,
+                client_id INTEGER NOT NULL,
+                cep TEXT,
+                street TEXT,
+                number TEXT,
+                neighborhood TEXT,
+                city TEXT,
+                state TEXT,
+                is_primary BOOLEAN DEFAULT 0,
+                FOREIGN KEY (debtor_id) REFERENCES debtors (id),
+                FOREIGN KEY (guarantor_id) REFERENCES guarantors (id),
+                FOREIGN KEY (client_id) REFERENCES clients (id)
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS debts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                debtor_id INTEGER NOT NULL,
+                client_id INTEGER NOT NULL,
+                contract_type TEXT NOT NULL,
+                description TEXT,
+                original_value REAL NOT NULL,
+                due_date TEXT NOT NULL,
+                fine_type TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (debtor_id) REFERENCES debtors (id),
+                FOREIGN KEY (client_id) REFERENCES clients (id)
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS legal_expenses (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                debtor_id INTEGER NOT NULL,
+                client_id INTEGER NOT NULL,
+                description TEXT NOT NULL,
+                value REAL NOT NULL,
+                date TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (debtor_id) REFERENCES debtors (id),
+                FOREIGN KEY (client_id) REFERENCES clients (id)
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS agreements (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                debtor_id INTEGER NOT NULL,
+                client_id INTEGER NOT NULL,
+                debt_id INTEGER,
+                status TEXT DEFAULT 'active',
+                agreement_date TEXT NOT NULL,
+                agreed_value REAL NOT NULL,
+                total_installments INTEGER DEFAULT 1,
+                installment_value REAL,
+                interest_rate REAL DEFAULT 0,
+                first_installment_date TEXT,
+                notes TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (debtor_id) REFERENCES debtors (id),
+                FOREIGN KEY (client_id) REFERENCES clients (id),
+                FOREIGN KEY (debt_id) REFERENCES debts (id)
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS payments (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                agreement_id INTEGER,
+                debt_id INTEGER,
+                debtor_id INTEGER NOT NULL,
+                client_id INTEGER NOT NULL,
+                payment_date TEXT NOT NULL,
+                amount REAL NOT NULL,
+                installment_number INTEGER,
+                payment_method TEXT,
+                notes TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (agreement_id) REFERENCES agreements (id),
+                FOREIGN KEY (debt_id) REFERENCES debts (id),
+                FOREIGN KEY (debtor_id) REFERENCES debtors (id),
+                FOREIGN KEY (client_id) REFERENCES clients (id)
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS judicial_processes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                debtor_id INTEGER NOT NULL,
+                client_id INTEGER NOT NULL,
+                debt_id INTEGER,
+                process_type TEXT NOT NULL,
+                process_number TEXT UNIQUE,
+                forum_id INTEGER,
+                vara TEXT,
+                distribution_date TEXT,
+                status TEXT DEFAULT 'ativo',
+                description TEXT,
+                notes TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (debtor_id) REFERENCES debtors (id),
+                FOREIGN KEY (client_id) REFERENCES clients (id),
+                FOREIGN KEY (debt_id) REFERENCES debts (id),
+                FOREIGN KEY (forum_id) REFERENCES client_forums (id)
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS petition_templates (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                process_type TEXT NOT NULL,
+                description TEXT,
+                template_content TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS judicial_petitions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                process_id INTEGER NOT NULL,
+                petition_type TEXT NOT NULL,
+                template_id INTEGER,
+                petition_date TEXT,
+                status TEXT DEFAULT 'rascunho',
+                content TEXT,
+                notes TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (process_id) REFERENCES judicial_processes (id),
+                FOREIGN KEY (template_id) REFERENCES petition_templates (id)
+            )
+        ''')
+
+        # Kanban / Board for simple task tracking
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS kanban_cards (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                description TEXT,
+                status TEXT DEFAULT 'todo',
+                order_index INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS kanban_columns (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                order_index INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+
+def _m002_debtors_rg(cursor, dialect):
+    """Adds debtors.rg to databases created before the column existed."""
+    if dialect.is_postgres:
+        cursor.execute("ALTER TABLE debtors ADD COLUMN IF NOT EXISTS rg TEXT")
+    else:
+        cursor.execute("PRAGMA table_info(debtors)")
+        columns = [info[1] for info in cursor.fetchall()]
+        if 'rg' not in columns:
+            cursor.execute("ALTER TABLE debtors ADD COLUMN rg TEXT")
+
+
+def _m003_secondary_indexes(cursor, dialect):
+    """Creates the secondary indexes (idempotent on both backends)."""
+    for name, table, columns in INDEXES:
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+
+
+# kpi_summary recount; {payments} is the payments relation (hot table plus archive since migration 010)
+_KPI_SUMMARY_REFRESH_TEMPLATE = """
+    INSERT INTO kpi_summary (client_id, total_debtors, total_debts, total_original_value,
+                             active_agreements, total_recovered, total_payments)
+    SELECT c.id,
+           (SELECT count(*) FROM debtors WHERE client_id = c.id),
+           (SELECT count(*) FROM debts WHERE client_id = c.id),
+           (SELECT COALESCE(SUM(original_value), 0) FROM debts WHERE client_id = c.id),
+           (SELECT count(*) FROM agreements WHERE client_id = c.id AND status = 'active'),
+           (SELECT COALESCE(SUM(amount), 0) FROM {payments} WHERE client_id = c.id),
+           (SELECT count(*) FROM {payments} WHERE client_id = c.id)
+    FROM clients c
+"""
+
+# Recomputes kpi_summary rows from the base tables (append "WHERE c.id = ..." for one client)
+KPI_SUMMARY_REFRESH_SQL = _KPI_SUMMARY_REFRESH_TEMPLATE.format(payments="payments_all")
+
+
+def _m004_kpi_summary(cursor, dialect):
+    """Per-client dashboard totals, kept current by the write functions in src/database.py."""
+    money = "NUMERIC" if dialect.is_postgres else "REAL"
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS kpi_summary (
+            client_id INTEGER PRIMARY KEY,
+            total_debtors INTEGER NOT NULL DEFAULT 0,
+            total_debts INTEGER NOT NULL DEFAULT 0,
+            total_original_value {money} NOT NULL DEFAULT 0,
+            active_agreements INTEGER NOT NULL DEFAULT 0,
+            total_recovered {money} NOT NULL DEFAULT 0,
+            total_payments INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute("DELETE FROM kpi_summary")
+    # payments_all doesn't exist yet at this point
+    cursor.execute(_KPI_SUMMARY_REFRESH_TEMPLATE.format(payments="payments"))
+
+
+def _m005_debtors_document_digits(cursor, dialect):
+    """Adds debtors.cpf_cnpj_digits (CPF/CNPJ without punctuation), backfills and indexes it."""
+    if dialect.is_postgres:
+        cursor.execute("ALTER TABLE debtors ADD COLUMN IF NOT EXISTS cpf_cnpj_digits TEXT")
+        cursor.execute(r"UPDATE debtors SET cpf_cnpj_digits = NULLIF(regexp_replace(COALESCE(cpf_cnpj, ''), '\D', '', 'g'), '')")
+    else:
+        cursor.execute("PRAGMA table_info(debtors)")
+        if 'cpf_cnpj_digits' not in [info[1] for info in cursor.fetchall()]:
+            cursor.execute("ALTER TABLE debtors ADD COLUMN cpf_cnpj_digits TEXT")
+        cursor.execute("SELECT id, cpf_cnpj FROM debtors")
+        cursor.executemany(
+            "UPDATE debtors SET cpf_cnpj_digits = ? WHERE id = ?",
+            [(document_digits(cpf_cnpj), row_id) for row_id, cpf_cnpj in cursor.fetchall()]
+        )
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_debtors_cpf_cnpj_digits ON debtors (cpf_cnpj_digits)")
+    # One debtor per document per client; existing duplicates are kept but reported
+    cursor.execute("""
+        SELECT client_id, cpf_cnpj_digits, count(*) FROM debtors
+        WHERE cpf_cnpj_digits IS NOT NULL
+        GROUP BY client_id, cpf_cnpj_digits HAVING count(*) > 1
+    """)
+    duplicates = cursor.fetchall()
+    if duplicates:
+        print(f"Warning: {len(duplicates)} duplicated CPF/CNPJ per client in debtors; "
+              "idx_debtors_client_document created without UNIQUE:", duplicates[:10])
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_debtors_client_document ON debtors (client_id, cpf_cnpj_digits)")
+    else:
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_debtors_client_document ON debtors (client_id, cpf_cnpj_digits)")
+
+
+def _m006_debtors_listing_indexes(cursor, dialect):
+    """(name, id) and (client_id, name, id) indexes for keyset-paginated debtor listing."""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_debtors_name_id ON debtors (name, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_debtors_client_name ON debtors (client_id, name, id)")
+    # Superseded by idx_debtors_name_id
+    cursor.execute("DROP INDEX IF EXISTS idx_debtors_name")
+
+
+# (table, kind, debtor id column, text columns, digit columns) feeding the debtor search.
+# On SQLite each source row becomes one FTS row with rowid = id * 4 + kind.
+SEARCH_SOURCES = [
+    ("debtors", 0, "id", ("name", "cpf_cnpj", "email", "phone"), ("cpf_cnpj", "phone")),
+    ("guarantors", 1, "debtor_id", ("name", "cpf", "email", "phone"), ("cpf", "phone")),
+    ("contact_history", 2, "debtor_id", ("contact_value",), ("contact_value",)),
+]
+
+
+def search_text_sql(columns, prefix=""):
+    """Searchable text of a source row: its text columns joined by spaces."""
+    return " || ' ' || ".join(f"COALESCE({prefix}{column}, '')" for column in columns)
+
+
+def search_digits_sql(columns, dialect, prefix=""):
+    """Digits-only form of a source row's documents/phones, space separated."""
+    parts = []
+    for column in columns:
+        if dialect.is_postgres:
+            parts.append(f"regexp_replace(COALESCE({prefix}{column}, ''), '\\D', '', 'g')")
+        else:
+            expr = f"COALESCE({prefix}{column}, '')"
+            for char in ".-/() +":
+                expr = f"REPLACE({expr}, '{char}', '')"
+            parts.append(expr)
+    return " || ' ' || ".join(parts)
+
+
+def search_tsvector_sql(columns):
+    """Postgres: accent-insensitive Portuguese tsvector of a source row (indexed with GIN)."""
+    return f"to_tsvector('portuguese', f_unaccent({search_text_sql(columns)}))"
+
+
+def _m007_debtor_search(cursor, dialect):
+    """Full-text debtor search over debtors, guarantors and contact_history."""
+    if dialect.is_postgres:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS unaccent")
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        # unaccent() is only STABLE; index expressions need an IMMUTABLE wrapper
+        cursor.execute("""
+            CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text
+            LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+            AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$
+        """)
+        for table, _, _, text_columns, digit_columns in SEARCH_SOURCES:
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_search_fts ON {table} USING GIN ({search_tsvector_sql(text_columns)})")
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_search_digits ON {table} USING GIN (({search_digits_sql(digit_columns, dialect)}) gin_trgm_ops)")
+        return
+
+    # Words (accent/case-insensitive, with prefix indexes; client_id indexed so a client
+    # filter is part of the MATCH) and digit fragments (trigrams)
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS debtor_search
+        USING fts5(debtor_id UNINDEXED, client_id, terms, tokenize='unicode61 remove_diacritics 2', prefix='2 3')
+    """)
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS debtor_search_digits
+        USING fts5(debtor_id UNINDEXED, digits, tokenize='trigram')
+    """)
+    for table, kind, debtor_column, text_columns, digit_columns in SEARCH_SOURCES:
+        insert_new = f"""
+            INSERT INTO debtor_search (rowid, debtor_id, client_id, terms)
+            VALUES (new.id * 4 + {kind}, new.{debtor_column}, new.client_id, {search_text_sql(text_columns, 'new.')});
+            INSERT INTO debtor_search_digits (rowid, debtor_id, digits)
+            VALUES (new.id * 4 + {kind}, new.{debtor_column}, {search_digits_sql(digit_columns, dialect, 'new.')});
+        """
+        delete_old = f"""
+            DELETE FROM debtor_search WHERE rowid = old.id * 4 + {kind};
+            DELETE FROM debtor_search_digits WHERE rowid = old.id * 4 + {kind};
+        """
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_search_ai AFTER INSERT ON {table} BEGIN {insert_new} END")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_search_ad AFTER DELETE ON {table} BEGIN {delete_old} END")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_search_au AFTER UPDATE ON {table} BEGIN {delete_old} {insert_new} END")
+    populate_search_index(cursor, dialect)
+
+
+def populate_search_index(cursor, dialect):
+    """SQLite: fills the (empty) FTS tables from the source tables."""
+    for table, kind, debtor_column, text_columns, digit_columns in SEARCH_SOURCES:
+        cursor.execute(f"""
+            INSERT INTO debtor_search (rowid, debtor_id, client_id, terms)
+            SELECT id * 4 + {kind}, {debtor_column}, client_id, {search_text_sql(text_columns)} FROM {table}
+        """)
+        cursor.execute(f"""
+            INSERT INTO debtor_search_digits (rowid, debtor_id, digits)
+            SELECT id * 4 + {kind}, {debtor_column}, {search_digits_sql(digit_columns, dialect)} FROM {table}
+        """)
+
+
+# SQLite FK columns whose parent deletion should SET NULL (as in the Postgres schema); the rest cascade
+_SET_NULL_FK_COLUMNS = {"debt_id", "agreement_id", "forum_id", "template_id"}
+_TABLE_FK = re.compile(r"FOREIGN KEY \((\w+)\) REFERENCES (\w+) \((\w+)\)(?!\s*ON DELETE)")
+_INLINE_FK = re.compile(r"(\w+ INTEGER REFERENCES \w+ \(\w+\))(?!\s*ON DELETE)")
+
+
+def _with_delete_actions(create_sql):
+    """Adds the Postgres schema's ON DELETE actions to a SQLite CREATE TABLE."""
+    def table_fk(match):
+        action = "SET NULL" if match.group(1) in _SET_NULL_FK_COLUMNS else "CASCADE"
+        return f"{match.group(0)} ON DELETE {action}"
+    create_sql = _TABLE_FK.sub(table_fk, create_sql)
+    # Only users.client_id is declared inline; a user outlives its client
+    return _INLINE_FK.sub(r"\1 ON DELETE SET NULL", create_sql)
+
+
+def _m008_sqlite_foreign_key_actions(cursor, dialect):
+    """SQLite: rebuilds tables whose foreign keys lack ON DELETE actions.
+
+    The SQLite schema never declared them and foreign_keys was off, so deletes
+    left orphans behind. Now that connections enforce foreign keys, the tables
+    get the same CASCADE / SET NULL actions as on Postgres. SQLite can't alter a
+    constraint, so each table is recreated, copied and renamed (with its indexes
+    and triggers); run_migrations keeps foreign_keys off meanwhile.
+    """
+    if dialect.is_postgres:
+        return
+    cursor.execute("SELECT name, sql FROM sqlite_master WHERE type = 'table' AND sql LIKE '%REFERENCES%'")
+    for table, create_sql in cursor.fetchall():
+        new_sql = _with_delete_actions(create_sql)
+        if new_sql == create_sql:
+            continue
+        cursor.execute("SELECT sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL", (table,))
+        dependents = [row[0] for row in cursor.fetchall()]
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,))
+        sequence = cursor.fetchone()
+        rebuilt = f"{table}__rebuild"
+        cursor.execute(re.sub(r"CREATE TABLE( IF NOT EXISTS)? \w+", f"CREATE TABLE {rebuilt}", new_sql, count=1))
+        cursor.execute(f"INSERT INTO {rebuilt} SELECT * FROM {table}")
+        cursor.execute(f"DROP TABLE {table}")
+        cursor.execute(f"ALTER TABLE {rebuilt} RENAME TO {table}")
+        if sequence:
+            # Keep AUTOINCREMENT from reusing ids of rows deleted before the rebuild
+            cursor.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (sequence[0], table))
+        for sql in dependents:
+            cursor.execute(sql)
+
+    cursor.execute("PRAGMA foreign_key_check")
+    orphans = {}
+    for table, _, parent, _ in cursor.fetchall():
+        orphans[f"{table} -> {parent}"] = orphans.get(f"{table} -> {parent}", 0) + 1
+    if orphans:
+        print("Warning: rows referencing deleted parents (left from before foreign keys were enforced):", orphans)
+
+
+# Tables whose inserts/updates/deletes are recorded in change_log (kanban_cards and
+# users are left out: card reordering is chatty and nothing derives from them)
+CHANGE_LOG_TABLES = (
+    "clients", "client_forums", "debtors", "debts", "agreements", "payments", "legal_expenses",
+    "judicial_processes", "guarantors", "addresses", "contact_history", "kanban_columns", "petition_templates",
+)
+
+
+def _m009_change_log(cursor, dialect):
+    """Append-only change_log filled by triggers, and change_cursors for its consumers (src/changes.py)."""
+    if dialect.is_postgres:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS change_log (
+                seq BIGSERIAL PRIMARY KEY,
+                table_name TEXT NOT NULL,
+                row_id BIGINT NOT NULL,
+                op CHAR(1) NOT NULL,
+                client_id BIGINT,
+                ts TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute("""
+            CREATE OR REPLACE FUNCTION log_change() RETURNS trigger LANGUAGE plpgsql AS $$
+            DECLARE
+                r jsonb;
+            BEGIN
+                IF TG_OP = 'DELETE' THEN r := to_jsonb(OLD); ELSE r := to_jsonb(NEW); END IF;
+                INSERT INTO change_log (table_name, row_id, op, client_id)
+                VALUES (TG_TABLE_NAME, (r->>'id')::bigint, left(TG_OP, 1),
+                        CASE WHEN TG_TABLE_NAME = 'clients' THEN (r->>'id')::bigint ELSE (r->>'client_id')::bigint END);
+                RETURN NULL;
+            END $$
+        """)
+        for table in CHANGE_LOG_TABLES:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {table}_change_log ON {table}")
+            cursor.execute(f"""
+                CREATE TRIGGER {table}_change_log AFTER INSERT OR UPDATE OR DELETE ON {table}
+                FOR EACH ROW EXECUTE FUNCTION log_change()
+            """)
+    else:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS change_log (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                table_name TEXT NOT NULL,
+                row_id INTEGER NOT NULL,
+                op TEXT NOT NULL,
+                client_id INTEGER,
+                ts TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        for table in CHANGE_LOG_TABLES:
+            cursor.execute(f"SELECT name FROM pragma_table_info('{table}')")
+            has_client = any(row[0] == "client_id" for row in cursor.fetchall())
+            for op, event, ref in (("I", "INSERT", "new"), ("U", "UPDATE", "new"), ("D", "DELETE", "old")):
+                client = f"{ref}.id" if table == "clients" else (f"{ref}.client_id" if has_client else "NULL")
+                cursor.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS {table}_change_log_{op.lower()} AFTER {event} ON {table}
+                    BEGIN
+                        INSERT INTO change_log (table_name, row_id, op, client_id) VALUES ('{table}', {ref}.id, '{op}', {client});
+                    END
+                """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS change_cursors (
+            consumer TEXT PRIMARY KEY,
+            seq BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+# Tables whose old rows move to a yearly archive (src/archive.py): (table, date column).
+# Reads that need the full history use the {table}_all view (hot rows UNION ALL archive).
+ARCHIVED_TABLES = (
+    ("payments", "payment_date"),
+    ("contact_history", "attempt_date"),
+)
+
+
+def _m010_history_archive(cursor, dialect):
+    """Yearly archive for payments and contact_history, plus the {table}_all views.
+
+    Postgres: {table}_archive is range-partitioned by year (partitions are added by
+    src.archive as years get archived; rows without a date land in the DEFAULT one).
+    SQLite: one {table}_archive_y{year} table per year, created by src.archive,
+    which also rebuilds the view to include it; until then the view is the hot table.
+    """
+    # Current-year totals per client: client_id alone read the client's whole payment history
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_payments_client_date ON payments (client_id, payment_date)")
+    cursor.execute("DROP INDEX IF EXISTS idx_payments_client_id")
+    for table, date_column in ARCHIVED_TABLES:
+        if dialect.is_postgres:
+            archive = f"{table}_archive"
+            cursor.execute(f"CREATE TABLE IF NOT EXISTS {archive} (LIKE {table}) PARTITION BY RANGE ({date_column})")
+            cursor.execute(f"CREATE TABLE IF NOT EXISTS {archive}_default PARTITION OF {archive} DEFAULT")
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{archive}_debtor_date ON {archive} (debtor_id, {date_column})")
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{archive}_client_date ON {archive} (client_id, {date_column})")
+            cursor.execute(f"ALTER TABLE {archive} ADD FOREIGN KEY (debtor_id) REFERENCES debtors (id) ON DELETE CASCADE")
+            cursor.execute(f"ALTER TABLE {archive} ADD FOREIGN KEY (client_id) REFERENCES clients (id) ON DELETE CASCADE")
+            if table == "payments":
+                cursor.execute(f"ALTER TABLE {archive} ADD FOREIGN KEY (agreement_id) REFERENCES agreements (id) ON DELETE SET NULL")
+                cursor.execute(f"ALTER TABLE {archive} ADD FOREIGN KEY (debt_id) REFERENCES debts (id) ON DELETE SET NULL")
+            cursor.execute(f"CREATE OR REPLACE VIEW {table}_all AS SELECT * FROM {table} UNION ALL SELECT * FROM {archive}")
+        else:
+            cursor.execute(f"CREATE VIEW IF NOT EXISTS {table}_all AS SELECT * FROM {table}")
+
+
+def _m011_jobs(cursor, dialect):
+    """Background job queue (src/jobs.py). Times are epoch seconds, compared across processes."""
+    key = "SERIAL PRIMARY KEY" if dialect.is_postgres else "INTEGER PRIMARY KEY AUTOINCREMENT"
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id {key},
+            kind TEXT NOT NULL,
+            params TEXT NOT NULL DEFAULT '{{}}',
+            status TEXT NOT NULL DEFAULT 'queued',
+            progress DOUBLE PRECISION,
+            message TEXT,
+            result TEXT,
+            error TEXT,
+            cancel_requested INTEGER NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            worker TEXT,
+            created_by TEXT,
+            created_at DOUBLE PRECISION NOT NULL,
+            started_at DOUBLE PRECISION,
+            finished_at DOUBLE PRECISION,
+            heartbeat_at DOUBLE PRECISION
+        )
+    """)
+    # Workers claim the oldest queued job; the pages list the latest ones
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id)")
+
+
+# (version, name, function(cursor, dialect))
+MIGRATIONS = [
+    (1, "base_schema", _m001_base_schema),
+    (2, "debtors_rg_column", _m002_debtors_rg),
+    (3, "secondary_indexes", _m003_secondary_indexes),
+    (4, "kpi_summary", _m004_kpi_summary),
+    (5, "debtors_document_digits", _m005_debtors_document_digits),
+    (6, "debtors_listing_indexes", _m006_debtors_listing_indexes),
+    (7, "debtor_search", _m007_debtor_search),
+    (8, "sqlite_foreign_key_actions", _m008_sqlite_foreign_key_actions),
+    (9, "change_log", _m009_change_log),
+    (10, "history_archive", _m010_history_archive),
+    (11, "jobs", _m011_jobs),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn):
+    """Returns the highest applied migration version (0 for a fresh database)."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+    version = cursor.fetchone()[0]
+    conn.commit()
+    return version
+
+
+def run_migrations(conn):
+    """Applies pending migrations in order; returns the list of versions applied."""
+    dialect = get_dialect(conn)
+    if get_schema_version(conn) >= LATEST_VERSION:
+        return []
+
+    cursor = conn.cursor()
+    if dialect.is_postgres:
+        cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_KEY,))
+    else:
+        # Table rebuilds must not trigger cascades; can only be toggled outside a transaction
+        cursor.execute("PRAGMA foreign_keys=OFF")
+    applied = []
+    try:
+        # Re-read under the lock: another process may have migrated meanwhile
+        current = get_schema_version(conn)
+        for version, name, migrate in MIGRATIONS:
+            if version <= current:
+                continue
+            try:
+                migrate(cursor, dialect)
+                cursor.execute(
+                    f"INSERT INTO schema_migrations (version, name) VALUES ({dialect.placeholder}, {dialect.placeholder})",
+                    (version, name)
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            applied.append(version)
+            print(f"Migrated: {version:03d}_{name}")
+    finally:
+        if dialect.is_postgres:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_KEY,))
+            conn.commit()
+        else:
+            cursor.execute("PRAGMA foreign_keys=ON")
+    return applied
+
+
+def explain_index_usage(conn):
+    """Runs EXPLAIN on INDEX_CHECK_QUERIES and reports whether each uses its index.
+
+    Returns a list of dicts: label, expected_index, uses_index, plan.
+    """
+    dialect = get_dialect(conn)
+    cursor = conn.cursor()
+    results = []
+    if dialect.is_postgres:
+        # Tiny tables make the planner prefer sequential scans; we only want to know
+        # whether a usable index exists for each query shape.
+        cursor.execute("SET enable_seqscan = off")
+    try:
+        for label, sql, params, expected in INDEX_CHECK_QUERIES:
+            if dialect.is_postgres:
+                cursor.execute("EXPLAIN " + sql.replace("?", "%s"), params)
+                plan = "\n".join(row[0] for row in cursor.fetchall())
+            else:
+                cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+                plan = "\n".join(str(row[-1]) for row in cursor.fetchall())
+            results.append({
+                "label": label,
+                "expected_index": expected,
+                "uses_index": expected in plan,
+                "plan": plan,
+            })
+    finally:
+        if dialect.is_postgres:
+            conn.rollback()
+    return results
@@ -0,0 +1,14 @@
+# Page name (st.session_state['page']) -> (module, render function). app.py imports a
+# page's module only when it is routed to, so the login screen loads none of them.
+PAGES = {
+    "Dashboard": ("src.pages.dashboard", "render_dashboard"),
+    "Clientes": ("src.pages.administrative", "render_clients"),
+    "Devedores": ("src.pages.administrative", "render_debtors"),
+    "Dívidas": ("src.pages.administrative", "render_debts"),
+    "Judicial": ("src.pages.judicial", "render_judicial"),
+    "Petições": ("src.pages.judicial", "render_petitions"),
+    "Simulação": ("src.pages.calculations", "render_negotiation"),
+    "Acordos": ("src.pages.calculations", "render_agreements"),
+    "Pagamentos": ("src.pages.calculations", "render_payments"),
+    "Configurações": ("src.pages.settings", "render_settings"),
+}
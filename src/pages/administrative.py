@@ -1,152 +1,126 @@
 
 import streamlit as st
 import pandas as pd
+import os
+import time
 from datetime import date
 from dateutil.relativedelta import relativedelta
-from src.database import get_connection, get_clients, get_debtors, get_debts, get_kanban_cards
+from src.database import get_clients, get_client_forums, create_client, create_client_forum, create_debtor, update_debtor, delete_debtor, delete_client, create_debt
+from src.export import EXPORT_DOWNLOAD_MAX_MB, FORMATS, MIME_TYPES
+from src.jobs import ACTIVE_STATUSES, JOB_FILES_DIR, submit
+from src.pages.common import debtor_bundle, debtor_picker, has_debtors, job_progress
 from src.validators import ContactValidator, CONTACT_STATUS_LIST
-from src.services import get_address_from_viacep
-from src.pdf_generator import PDFGenerator
 
 # --- CLIENTS PAGE ---
 def render_clients():
     st.markdown("## Gerenciar Clientes e Foros")
     st.info("Gestão multi-CNPJ com jurisdição e foros")
     
-    conn = get_connection()
-    cursor = conn.cursor()
+    tab_new_client, tab_manage_clients = st.tabs(["Novo Cliente", "Gerenciar Clientes"])
     
-    try:
-        tab_new_client, tab_manage_clients = st.tabs(["Novo Cliente", "Gerenciar Clientes"])
+    # TAB: CREATE NEW CLIENT
+    with tab_new_client:
+        st.markdown("### Cadastrar Novo Cliente")
         
-        # TAB: CREATE NEW CLIENT
-        with tab_new_client:
-            st.markdown("### Cadastrar Novo Cliente")
+        with st.form("new_client_form"):
+            col1, col2 = st.columns(2)
             
-            with st.form("new_client_form"):
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    client_name = st.text_input("Razão Social *", help="Nome da empresa/escritório")
-                    client_cnpj = st.text_input("CNPJ *", help="Ex: 00.000.000/0000-00")
-                    client_email = st.text_input("Email")
-                
-                with col2:
-                    client_phone = st.text_input("Telefone")
-                    main_forum = st.text_input("Foro Principal (Jurisdição)", help="Ex: Vara de Execução Fiscal de São Paulo")
-                    jurisdiction_state = st.selectbox("Estado da Jurisdição", ["SP", "RJ", "MG", "BA", "SC", "PR", "RS", "Outro"])
-                
-                client_address = st.text_input("Endereço Completo")
-                client_notes = st.text_area("Observações", height=80)
-                
-                submit_client = st.form_submit_button("Cadastrar Cliente")
-                
-                if submit_client:
-                    if not client_name or not client_cnpj:
-                        st.error("Preencha nome e CNPJ.")
-                    else:
-                        try:
-                            cursor.execute("""
-                                INSERT INTO clients (name, cnpj, email, phone, address, main_forum, jurisdiction_state, notes)
-                                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                            """, (client_name, client_cnpj, client_email, client_phone, client_address, main_forum, jurisdiction_state, client_notes))
-                            
-                            conn.commit()
-                            new_client_id = cursor.lastrowid
-                            
-                            # Auto-create main forum record
-                            if main_forum:
-                                cursor.execute("""
-                                    INSERT INTO client_forums (client_id, forum_name, forum_code, state, is_main)
-                                    VALUES (?, ?, ?, ?, ?)
-                                """, (new_client_id, main_forum, main_forum.upper().replace(" ", "_"), jurisdiction_state, True))
-                                conn.commit()
-                            
-                            st.success(f"Cliente '{client_name}' cadastrado com sucesso!")
-                            st.rerun()
-                        except Exception as e:
-                            st.error(f"Erro ao cadastrar: {e}")
-        
-        # TAB: MANAGE EXISTING CLIENTS
-        with tab_manage_clients:
-            st.markdown("### Clientes Registrados")
+            with col1:
+                client_name = st.text_input("Razão Social *", help="Nome da empresa/escritório")
+                client_cnpj = st.text_input("CNPJ *", help="Ex: 00.000.000/0000-00")
+                client_email = st.text_input("Email")
             
-            all_clients = pd.read_sql_query("SELECT * FROM clients ORDER BY name", conn)
+            with col2:
+                client_phone = st.text_input("Telefone")
+                main_forum = st.text_input("Foro Principal (Jurisdição)", help="Ex: Vara de Execução Fiscal de São Paulo")
+                jurisdiction_state = st.selectbox("Estado da Jurisdição", ["SP", "RJ", "MG", "BA", "SC", "PR", "RS", "Outro"])
             
-            if all_clients.empty:
-                st.info("Nenhum cliente cadastrado. Crie um novo cliente acima.")
-            else:
-                st.metric("Total de Clientes", len(all_clients))
-                
-                for idx, client in all_clients.iterrows():
-                    with st.expander(f"📋 {client['name']} ({client['cnpj']})"):
-                        col1, col2 = st.columns([0.7, 0.3])
-                        
-                        with col1:
-                            st.write(f"**Email:** {client['email']}")
-                            st.write(f"**Telefone:** {client['phone']}")
-                            st.write(f"**Foro Principal:** {client['main_forum']}")
-                            st.write(f"**Estado:** {client['jurisdiction_state']}")
-                            st.write(f"**Endereço:** {client['address']}")
-                            if client['notes']:
-                                st.write(f"**Observações:** {client['notes']}")
+            client_address = st.text_input("Endereço Completo")
+            client_notes = st.text_area("Observações", height=80)
+            
+            submit_client = st.form_submit_button("Cadastrar Cliente")
+            
+            if submit_client:
+                if not client_name or not client_cnpj:
+                    st.error("Preencha nome e CNPJ.")
+                else:
+                    try:
+                        # Also creates the main forum record
+                        create_client(client_name, client_cnpj, client_email, client_phone, client_address,
+                                      main_forum, jurisdiction_state, client_notes)
+                        st.success(f"Cliente '{client_name}' cadastrado com sucesso!")
+                        st.rerun()
+                    except Exception as e:
+                        st.error(f"Erro ao cadastrar: {e}")
+    
+    # TAB: MANAGE EXISTING CLIENTS
+    with tab_manage_clients:
+        st.markdown("### Clientes Registrados")
+        
+        all_clients = get_clients()
+        
+        if all_clients.empty:
+            st.info("Nenhum cliente cadastrado. Crie um novo cliente acima.")
+        else:
+            st.metric("Total de Clientes", len(all_clients))
+            
+            for idx, client in all_clients.iterrows():
+                with st.expander(f"📋 {client['name']} ({client['cnpj']})"):
+                    col1, col2 = st.columns([0.7, 0.3])
+                    
+                    with col1:
+                        st.write(f"**Email:** {client['email']}")
+                        st.write(f"**Telefone:** {client['phone']}")
+                        st.write(f"**Foro Principal:** {client['main_forum']}")
+                        st.write(f"**Estado:** {client['jurisdiction_state']}")
+                        st.write(f"**Endereço:** {client['address']}")
+                        if client['notes']:
+                            st.write(f"**Observações:** {client['notes']}")
+                    
+                    with col2:
+                        if st.button("🗑️ Deletar", key=f"del_client_{client['id']}"):
+                            try:
+                                delete_client(client['id'])
+                                st.success("Cliente deletado!")
+                                st.rerun()
+                            except Exception as e:
+                                st.error(f"Erro: {e}")
+                    
+                    # Client Forums
+                    st.markdown("**Foros Associados:**")
+                    client_forums = get_client_forums(client['id'])
+                    
+                    if not client_forums.empty:
+                        for fidx, forum in client_forums.iterrows():
+                            badge = "🔹 PRINCIPAL" if forum['is_main'] else "⚪ Adjacente"
+                            st.write(f"{badge} - {forum['forum_name']} ({forum['state']})")
+                    
+                    # Add new forum
+                    with st.form(f"add_forum_{client['id']}"):
+                        col_f1, col_f2 = st.columns(2)
+                        with col_f1:
+                            new_forum_name = st.text_input("Nome do Foro", key=f"forum_name_{client['id']}")
+                            new_forum_state = st.text_input("Estado", key=f"forum_state_{client['id']}")
+                        with col_f2:
+                            new_forum_city = st.text_input("Cidade", key=f"forum_city_{client['id']}")
                         
-                        with col2:
-                            if st.button("🗑️ Deletar", key=f"del_client_{client['id']}"):
+                        if st.form_submit_button("+ Adicionar Foro Adjacente"):
+                            if new_forum_name:
                                 try:
-                                    cursor.execute("DELETE FROM clients WHERE id = ?", (client['id'],))
-                                    conn.commit()
-                                    st.success("Cliente deletado!")
+                                    create_client_forum(client['id'], new_forum_name, new_forum_state, new_forum_city)
+                                    st.success(f"Foro '{new_forum_name}' adicionado!")
                                     st.rerun()
                                 except Exception as e:
                                     st.error(f"Erro: {e}")
-                        
-                        # Client Forums
-                        st.markdown("**Foros Associados:**")
-                        client_forums = pd.read_sql_query(
-                            "SELECT * FROM client_forums WHERE client_id = ? ORDER BY is_main DESC, forum_name",
-                            conn,
-                            params=(client['id'],)
-                        )
-                        
-                        if not client_forums.empty:
-                            for fidx, forum in client_forums.iterrows():
-                                badge = "🔹 PRINCIPAL" if forum['is_main'] else "⚪ Adjacente"
-                                st.write(f"{badge} - {forum['forum_name']} ({forum['state']})")
-                        
-                        # Add new forum
-                        with st.form(f"add_forum_{client['id']}"):
-                            col_f1, col_f2 = st.columns(2)
-                            with col_f1:
-                                new_forum_name = st.text_input("Nome do Foro", key=f"forum_name_{client['id']}")
-                                new_forum_state = st.text_input("Estado", key=f"forum_state_{client['id']}")
-                            with col_f2:
-                                new_forum_city = st.text_input("Cidade", key=f"forum_city_{client['id']}")
-                            
-                            if st.form_submit_button("+ Adicionar Foro Adjacente"):
-                                if new_forum_name:
-                                    try:
-                                        forum_code = f"{new_forum_state.upper()}_{new_forum_city.upper().replace(' ', '_')}"
-                                        cursor.execute("""
-                                            INSERT INTO client_forums (client_id, forum_name, forum_code, state, city, is_main)
-                                            VALUES (?, ?, ?, ?, ?, ?)
-                                        """, (client['id'], new_forum_name, forum_code, new_forum_state, new_forum_city, False))
-                                        conn.commit()
-                                        st.success(f"Foro '{new_forum_name}' adicionado!")
-                                        st.rerun()
-                                    except Exception as e:
-                                        st.error(f"Erro: {e}")
-                                else:
-                                    st.error("Digite o nome do foro.")
-    finally:
-        conn.close()
+                            else:
+                                st.error("Digite o nome do foro.")
 
 
 # --- DEBTORS PAGE ---
 def render_debtors():
     st.markdown("## Gestão de Devedores")
     
-    tab1, tab2 = st.tabs(["Novo Devedor", "Gerenciar Devedores"])
+    tab1, tab2, tab3, tab4 = st.tabs(["Novo Devedor", "Gerenciar Devedores", "Importar Planilha", "Exportar Carteira"])
     
     with tab1:
         st.markdown("### Cadastrar Novo Devedor")
@@ -175,48 +149,46 @@ def render_debtors():
                 notes = st.text_area("Observações", height=80)
                 
                 if st.form_submit_button("Salvar Devedor"):
-                    conn = get_connection()
-                    cursor = conn.cursor()
                     try:
-                        cursor.execute("INSERT INTO debtors (client_id, name, cpf_cnpj, rg, email, phone, notes) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                                       (selected_client_id, name, cpf, rg, email, phone, notes))
-                        conn.commit()
+                        create_debtor(selected_client_id, name, cpf_cnpj=cpf, rg=rg, email=email, phone=phone, notes=notes)
                         st.success("Devedor cadastrado!")
                         st.rerun()
                     except Exception as e:
                         st.error(f"Erro: {e}")
-                    finally:
-                        conn.close()
 
     with tab2:
         st.markdown("### Editar Devedor")
-        debtors = get_debtors()
-        if debtors.empty:
+        selected_debtor_id = None
+        if not has_debtors():
             st.info("Nenhum devedor cadastrado.")
         else:
-            debtor_opts = {row['id']: f"{row['name']} ({row['cpf_cnpj']})" for i, row in debtors.iterrows()}
-            selected_debtor_id = st.selectbox("Selecione o Devedor", options=debtor_opts.keys(), format_func=lambda x: debtor_opts[x])
+            selected_debtor_id = debtor_picker("edit_debtor_sel")
+        bundle = debtor_bundle(selected_debtor_id) if selected_debtor_id is not None else None
+        if bundle is not None:
             
             # Additional tabs for details
             dt_tab1, dt_tab2, dt_tab3 = st.tabs(["Dados Básicos", "Endereços", "Fiadores"])
             
             with dt_tab1:
                 # Basic Info Edit logic (omitted full logic for brevity, assuming standard CRUD)
-                 conn = get_connection()
-                 debtor = pd.read_sql_query("SELECT * FROM debtors WHERE id = ?", conn, params=(selected_debtor_id,)).iloc[0]
-                 conn.close()
+                 debtor = bundle.debtor
                  with st.form("edit_debtor_basic"):
                      new_name = st.text_input("Nome", value=debtor['name'])
                      new_cpf = st.text_input("CPF", value=debtor['cpf_cnpj'])
                      new_phone = st.text_input("Telefone", value=debtor['phone'] or "")
                      if st.form_submit_button("Salvar Alterações"):
-                         # Update logic
-                         pass
+                         try:
+                             update_debtor(selected_debtor_id, name=new_name, cpf_cnpj=new_cpf, phone=new_phone)
+                             st.success("Devedor atualizado!")
+                             st.rerun()
+                         except Exception as e:
+                             st.error(f"Erro: {e}")
                  
                  # Delete Zone
                  if st.button("EXCLUIR DEVEDOR", key="del_debtor_btn"):
-                     # Delete logic
-                     pass
+                     delete_debtor(selected_debtor_id)
+                     st.success("Devedor excluído!")
+                     st.rerun()
 
             with dt_tab2:
                 # Address Logic
@@ -226,21 +198,123 @@ def render_debtors():
                 # Guarantor Logic
                 pass
 
+    with tab3:
+        render_debtor_import()
+
+    with tab4:
+        render_portfolio_export()
+
+
+def render_debtor_import():
+    st.markdown("### Importar Devedores e Dívidas")
+    st.caption("CSV ou XLSX com as colunas: nome, cpf_cnpj e, opcionalmente, rg, email, telefone, observacoes, "
+               "tipo_contrato, descricao, valor, vencimento. Uma linha por parcela; linhas com o mesmo CPF/CNPJ "
+               "são agrupadas no mesmo devedor.")
+    clients_df = get_clients()
+    if clients_df.empty:
+        st.warning("Cadastre um cliente primeiro.")
+        return
+    client_names = dict(zip(clients_df['id'], clients_df['name']))
+    client_id = st.selectbox("Cliente", options=list(client_names), format_func=lambda x: client_names[x], key="import_client_sel")
+    uploaded = st.file_uploader("Planilha", type=["csv", "xlsx"], key="import_file")
+
+    job = job_progress("import_job")
+    busy = job is not None and job['status'] in ACTIVE_STATUSES
+    if uploaded is not None and st.button("Importar", type="primary", disabled=busy):
+        # The worker reads the file from disk and removes it when done
+        os.makedirs(JOB_FILES_DIR, exist_ok=True)
+        path = os.path.join(JOB_FILES_DIR, f"upload_{time.time_ns()}_{os.path.basename(uploaded.name)}")
+        with open(path, "wb") as f:
+            f.write(uploaded.getbuffer())
+        st.session_state["import_job"] = submit("import_debtors", {"path": path, "client_id": _job_id_param(client_id), "filename": uploaded.name},
+                                                created_by=st.session_state.get('username'))
+        st.rerun()
+
+    if job is not None and job['status'] == "done":
+        result = job['result']
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Linhas", f"{result['rows']:,}")
+        col2.metric("Devedores novos", f"{result['debtors_created']:,}")
+        col3.metric("Dívidas", f"{result['debts_created']:,}")
+        col4.metric("Rejeitadas", f"{result['rejects']:,}")
+        st.caption(f"{result['seconds']:.1f} s ({result['rows_per_sec']:,.0f} linhas/s); "
+                   f"{result['debtors_existing']:,} devedores já existiam.")
+        if result['rejects']:
+            st.dataframe(pd.DataFrame(result['rejects_preview']), use_container_width=True)
+            if os.path.exists(result['rejects_path']):
+                with open(result['rejects_path'], "rb") as f:
+                    st.download_button("Baixar relatório de rejeições", f, file_name="rejeicoes.csv", mime="text/csv")
+
+
+def render_portfolio_export():
+    st.markdown("### Exportar Carteira")
+    st.caption("Uma linha por dívida (devedores sem dívidas aparecem uma vez). O arquivo é gerado em lotes, "
+               "sem carregar a carteira inteira na memória.")
+    clients_df = get_clients()
+    client_names = {None: "Todos os clientes"}
+    client_names.update(zip(clients_df['id'], clients_df['name']))
+    col1, col2 = st.columns(2)
+    client_id = col1.selectbox("Cliente", options=list(client_names), format_func=lambda x: client_names[x], key="export_client_sel")
+    fmt = col2.selectbox("Formato", FORMATS, format_func=str.upper, key="export_format")
+    valuation = st.checkbox("Incluir valores atualizados (correção, juros e multa na data de hoje)", key="export_valuation")
+
+    job = job_progress("export_job")
+    busy = job is not None and job['status'] in ACTIVE_STATUSES
+    if st.button("Gerar Arquivo", type="primary", key="export_btn", disabled=busy):
+        st.session_state["export_job"] = submit("export_portfolio", {"fmt": fmt, "client_id": _job_id_param(client_id), "valuation": valuation},
+                                                created_by=st.session_state.get('username'))
+        st.rerun()
+    if job is not None and job['status'] == "done":
+        result = job['result']
+        st.success(f"{result['rows']:,} linhas em {result['seconds']:.1f} s ({result['rows_per_sec']:,.0f} linhas/s), {result['size_mb']:.1f} MB.")
+        _download_result(result, MIME_TYPES[job['params']['fmt']])
+
+    st.markdown("### Memórias de Cálculo em Lote")
+    st.caption("Um PDF por devedor com dívidas do cliente escolhido acima, atualizado na data de hoje, em um arquivo ZIP.")
+    job = job_progress("memory_job")
+    busy = job is not None and job['status'] in ACTIVE_STATUSES
+    if st.button("Gerar PDFs", key="memory_btn", disabled=busy):
+        st.session_state["memory_job"] = submit("debt_memory_pdfs", {"client_id": _job_id_param(client_id)},
+                                                created_by=st.session_state.get('username'))
+        st.rerun()
+    if job is not None and job['status'] == "done":
+        result = job['result']
+        st.success(f"{result['pdfs']:,} PDFs ({result['debtors']:,} devedores), {result['size_mb']:.1f} MB.")
+        _download_result(result, "application/zip")
+
+
+def _job_id_param(value):
+    # Ids from pandas are numpy integers, which job params (JSON) don't take
+    return int(value) if value is not None else None
+
+
+def _download_result(result, mime):
+    path = result['path']
+    if not os.path.exists(path):
+        st.info("O arquivo não está mais disponível no servidor.")
+    elif result['size_mb'] <= EXPORT_DOWNLOAD_MAX_MB:
+        with open(path, "rb") as f:
+            st.download_button("Baixar arquivo", f, file_name=os.path.basename(path), mime=mime, key=f"download_{path}")
+    else:
+        st.info(f"Arquivo grande demais para download pelo navegador; disponível no servidor em {path}.")
+
+
 # --- DEBTS PAGE ---
 def render_debts():
     st.markdown("## Gerenciar Dívidas")
     
-    debtors = get_debtors()
-    if debtors.empty:
+    if not has_debtors():
         st.warning("Cadastre devedores primeiro.")
         return
 
-    debtor_opts = {row['id']: f"{row['name']} ({row['cpf_cnpj']})" for i, row in debtors.iterrows()}
-    selected_debtor_id = st.selectbox("Selecione o Devedor", options=debtor_opts.keys(), format_func=lambda x: debtor_opts[x], key="debts_debtor_sel")
+    selected_debtor_id = debtor_picker("debts_debtor_sel")
+    bundle = debtor_bundle(selected_debtor_id) if selected_debtor_id is not None else None
+    if bundle is None:
+        return
     
     st.divider()
     
-    debts = get_debts(selected_debtor_id)
+    debts = bundle.frame("debts")
     
     # List Debts
     if not debts.empty:
@@ -273,8 +347,11 @@ def render_debts():
             installments = col2.number_input("Parcelas", min_value=1, value=1)
             
             if st.form_submit_button("Adicionar"):
-                conn = get_connection()
-                # Insert logic
-                conn.close()
-                st.success("Dívida Adicionada")
-                st.rerun()
+                try:
+                    for i in range(int(installments)):
+                        label = description if installments == 1 else f"{description} (parcela {i + 1}/{int(installments)})".strip()
+                        create_debt(selected_debtor_id, contract_type, val, due_date + relativedelta(months=i), description=label)
+                    st.success("Dívida Adicionada")
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"Erro: {e}")
@@ -0,0 +1,134 @@
+import functools
+
+import streamlit as st
+from src.cache import table_versions
+from src.connection import current_dialect
+from src.debtor_bundle import data_version, load_debtor_bundle
+from src.database import get_debtors_by_ids, has_debtors, list_debtors
+from src.jobs import ACTIVE_STATUSES, cancel_job, get_job
+from src.migrations import SEARCH_SOURCES
+from src.search import search_debtors
+
+DEBTOR_PICKER_PAGE_SIZE = 50
+# Seconds between status reads of an active background job on the page
+JOB_REFRESH_SECONDS = 1
+JOB_STATUS_LABELS = {"queued": "Na fila", "running": "Em execução", "done": "Concluída",
+                     "failed": "Falhou", "cancelled": "Cancelada"}
+
+
+def page_data(*tables, max_entries=256):
+    """Caches a page loader with st.cache_data, per arguments and per data version
+    of `tables` (src.cache.table_versions): any commit that writes one of them, in
+    this process or (via sync_caches) another, makes the next call read again.
+
+    Shared by all sessions; results are copies, so callers may modify them.
+    """
+    def decorator(func):
+        def cached(versions, *args, **kwargs):
+            return func(*args, **kwargs)
+        # st.cache_data keys its cache by module and qualified name
+        cached.__module__, cached.__qualname__ = func.__module__, func.__qualname__
+        cached = st.cache_data(show_spinner=False, max_entries=max_entries)(cached)
+
+        @functools.wraps(func)
+        def loader(*args, **kwargs):
+            return cached(table_versions(*tables) + (current_dialect().name,), *args, **kwargs)
+        return loader
+    return decorator
+
+
+has_debtors = page_data("debtors")(has_debtors)
+list_debtors = page_data("debtors")(list_debtors)
+get_debtors_by_ids = page_data("debtors")(get_debtors_by_ids)
+search_debtors = page_data("debtor_search", *(source[0] for source in SEARCH_SOURCES))(search_debtors)
+
+
+def debtor_picker(key, label="Selecione o Devedor", client_id=None, page_size=DEBTOR_PICKER_PAGE_SIZE):
+    """Busca de devedores com seleção entre os primeiros resultados.
+
+    Com texto na busca, mostra os page_size melhores resultados da busca textual
+    (nome, CPF/CNPJ, telefone, email, fiadores e contatos). Sem texto, lista por
+    nome com "Próximos"/"Anteriores" sobre a paginação keyset de list_debtors.
+    Retorna o id escolhido ou None.
+    """
+    search = st.text_input("Buscar devedor (nome, CPF/CNPJ, telefone ou email)", key=f"{key}_search")
+
+    # Stack of (after_name, after_id) cursors, one per page already passed
+    pages_key = f"{key}_pages"
+    cursors = st.session_state.setdefault(pages_key, [])
+    has_more = False
+    if search.strip():
+        rows = get_debtors_by_ids(search_debtors(search, client_id, limit=page_size))
+    else:
+        after_name, after_id = cursors[-1] if cursors else (None, None)
+        rows = list_debtors(client_id, None, after_name, after_id, limit=page_size + 1)
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+    if not rows:
+        st.info("Nenhum devedor encontrado.")
+        return None
+
+    options = {row['id']: f"{row['name']} ({row['cpf_cnpj']})" for row in rows}
+    selected = st.selectbox(label, options=list(options), format_func=lambda x: options[x], key=key)
+
+    if not search.strip() and (cursors or has_more):
+        col_prev, col_info, col_next = st.columns([1, 3, 1])
+        if cursors and col_prev.button("◀ Anteriores", key=f"{key}_prev"):
+            cursors.pop()
+            st.rerun()
+        col_info.caption(f"Página {len(cursors) + 1} - use a busca para encontrar mais rápido")
+        if has_more and col_next.button("Próximos ▶", key=f"{key}_next"):
+            cursors.append((rows[-1]['name'], rows[-1]['id']))
+            st.rerun()
+    return selected
+
+
+def debtor_bundle(debtor_id):
+    """load_debtor_bundle() for the session's current debtor, reloaded only when
+    the debtor (or the selection) changes. None if the debtor no longer exists."""
+    key = (debtor_id, data_version(debtor_id))
+    cached = st.session_state.get("_debtor_bundle")
+    if cached is None or cached[0] != key:
+        cached = (key, load_debtor_bundle(debtor_id))
+        st.session_state["_debtor_bundle"] = cached
+    return cached[1]
+
+
+@st.fragment(run_every=JOB_REFRESH_SECONDS)
+def _job_progress(key, job_id):
+    job = get_job(job_id)
+    if job is None or job["status"] not in ACTIVE_STATUSES:
+        # Finished: the whole page reruns to show the result
+        st.rerun()
+    label = JOB_STATUS_LABELS[job["status"]]
+    if job["message"]:
+        label += f" - {job['message']}"
+    if job["progress"] is not None:
+        st.progress(job["progress"], text=label)
+    else:
+        st.caption(f"⏳ {label}")
+    if not job["cancel_requested"] and st.button("Cancelar", key=f"{key}_cancel"):
+        job["cancel_requested"] = cancel_job(job_id)
+    if job["cancel_requested"]:
+        st.caption("Cancelamento solicitado...")
+
+
+def job_progress(key):
+    """Acompanha a tarefa em segundo plano (src.jobs) cujo id está em st.session_state[key].
+
+    Enquanto ela está na fila ou em execução, mostra progresso e um botão
+    "Cancelar", relidos a cada JOB_REFRESH_SECONDS sem rodar a página inteira;
+    ao terminar, a página roda de novo. Falha e cancelamento são exibidos aqui.
+    Retorna a tarefa (dict de get_job) ou None se não houver.
+    """
+    job_id = st.session_state.get(key)
+    job = get_job(job_id) if job_id is not None else None
+    if job is None:
+        return None
+    if job["status"] in ACTIVE_STATUSES:
+        _job_progress(key, job_id)
+    elif job["status"] == "failed":
+        st.error(f"A tarefa falhou: {job['error']}")
+    elif job["status"] == "cancelled":
+        st.warning("Tarefa cancelada.")
+    return job
@@ -5,20 +5,31 @@ from streamlit_sortables import sort_items
 
 from src.database import (
     get_dashboard_kpis, 
-    get_kanban_cards, 
+    get_clients,
+    get_kanban_board,
     get_kanban_columns, 
     create_kanban_card, 
-    update_kanban_card_status, 
+    kanban_moves,
+    move_kanban_cards,
     delete_kanban_card,
     create_kanban_column,
     delete_kanban_column
 )
+from src.pages.common import page_data
+
+# kpi_summary moves with the base tables; they also cover the live aggregates
+# and writes by other processes (sync_caches only sees the base tables)
+get_dashboard_kpis = page_data("kpi_summary", "debtors", "debts", "agreements", "payments")(get_dashboard_kpis)
 
 def render_dashboard():
     st.markdown("## Painel de Controle")
     
     # --- KPIs ---
-    kpis = get_dashboard_kpis()
+    clients = get_clients()
+    client_opts = {None: "Todos os clientes"}
+    client_opts.update({row['id']: row['name'] for _, row in clients.iterrows()})
+    selected_client = st.selectbox("Cliente", options=list(client_opts), format_func=lambda x: client_opts[x], key="kpi_client_sel")
+    kpis = get_dashboard_kpis(selected_client)
     
     col1, col2, col3, col4 = st.columns(4)
     with col1: st.metric("Devedores Ativos", kpis["total_debtors"])
@@ -79,39 +90,31 @@ def render_dashboard():
 
     # --- DRAG AND DROP BOARD ---
     
-    # Prepare data for sort_items
+    # Prepare data for sort_items (whole board in one query)
+    board = get_kanban_board(column_names)
     kanban_items = []
-    
     for col in column_names:
-        cards = get_kanban_cards(col) # Status = Column Name
-        items_list = []
-        for c in cards:
-            # item formatted: "#{id} {title}" for cleaner look
-            items_list.append(f"#{c['id']} {c['title']}")
-        
-        kanban_items.append({'header': col, 'items': items_list})
+        # item formatted: "#{id} {title}" for cleaner look
+        kanban_items.append({'header': col, 'items': [f"#{c['id']} {c['title']}" for c in board[col]]})
 
     # Render Board
     # Returns the updated list of dicts
     sorted_items = sort_items(kanban_items, multi_containers=True)
-    
-    # Process Changes
+
+    # Persist only what moved: an idle rerun returns the layout we rendered and writes nothing
+    layout = {}
     for col_data in sorted_items:
-        # col_data is {'header': 'ColName', 'items': ['Item...', ...]}
-        target_status = col_data['header']
-        current_items = col_data['items']
-        
-        for item_str in current_items:
-            # Parse ID from "#{id} {title}"
-            # We look for the first space
-            if item_str.startswith("#"):
-                try:
-                    # Split only on first space
-                    parts = item_str.split(" ", 1)
-                    card_id_str = parts[0].replace("#", "")
-                    card_id = int(card_id_str)
-                    
-                    # Update status
-                    update_kanban_card_status(card_id, target_status)
-                except (ValueError, IndexError):
-                    pass
+        # col_data is {'header': 'ColName', 'items': ['#12 Title', ...]}
+        ids = (_card_id(item) for item in col_data['items'])
+        layout[col_data['header']] = [card_id for card_id in ids if card_id is not None]
+    move_kanban_cards(kanban_moves(board, layout))
+
+
+def _card_id(item_str):
+    """Card id from a board item "#{id} {title}", or None."""
+    if not item_str.startswith("#"):
+        return None
+    try:
+        return int(item_str.split(" ", 1)[0][1:])
+    except ValueError:
+        return None
@@ -0,0 +1,46 @@
+import streamlit as st
+from src import metrics
+
+
+def _per_rerun(totals, key):
+    return totals.get(key, 0) / totals["reruns"]
+
+
+def render_metrics_panel(rerun):
+    """Métricas de desempenho na barra lateral (somente METRICS_ADMINS).
+
+    rerun é o dict de page_rerun() da página que acabou de ser desenhada (None se desligado).
+    """
+    with st.sidebar.expander("Métricas de desempenho"):
+        # No key: the default follows the process-wide switch another admin may have flipped
+        on = st.toggle("Coletar métricas", value=metrics.enabled)
+        if on != metrics.enabled:
+            metrics.set_enabled(on)
+        if not on:
+            st.caption("Desligado: nenhuma medição é feita.")
+            return
+
+        if rerun is not None:
+            st.caption("Esta execução")
+            st.write(f"{rerun['ms']:.0f} ms | {rerun.get('query', 0)} consultas ({rerun.get('query_ms', 0):.0f} ms)"
+                     f" | {rerun.get('rows', 0)} linhas")
+            st.write(f"{rerun.get('calculate', 0)} cálculos ({rerun.get('calculate_ms', 0):.0f} ms)"
+                     f" | {rerun.get('pdf', 0)} PDFs ({rerun.get('pdf_ms', 0):.0f} ms)")
+
+        summary = metrics.page_summary()
+        if summary:
+            st.caption("Por página (média por execução)")
+            st.dataframe([{
+                "Página": page,
+                "Execuções": totals["reruns"],
+                "ms": round(_per_rerun(totals, "ms"), 1),
+                "ms máx": round(totals["max_ms"], 1),
+                "Consultas": round(_per_rerun(totals, "query"), 1),
+                "ms SQL": round(_per_rerun(totals, "query_ms"), 1),
+                "Linhas": round(_per_rerun(totals, "rows"), 1),
+                "Cálculos": round(_per_rerun(totals, "calculate"), 1),
+                "ms PDF": round(_per_rerun(totals, "pdf_ms"), 1),
+            } for page, totals in sorted(summary.items(), key=lambda item: -item[1]["ms"])], hide_index=True)
+        if st.button("Zerar métricas"):
+            metrics.reset_metrics()
+            st.rerun()
@@ -1,32 +1,76 @@
 
 import streamlit as st
-from src.services import update_all_indices
+from src.bootstrap import bootstrap_status
+from src.connection import get_connection_status
+from src.jobs import ACTIVE_STATUSES, list_jobs, submit
+from src.pages.common import JOB_STATUS_LABELS, job_progress
+from src.query import fetch_scalar
 import time
 import random
+from datetime import datetime
+import pandas as pd
 
 def render_settings():
     st.markdown("## Configurações Avançadas")
     st.info("Gerenciamento de sistema e índices financeiros")
     
-    t1, t2 = st.tabs(["Atualização de Índices", "Sistema"])
+    t1, t2, t3 = st.tabs(["Atualização de Índices", "Sistema", "Tarefas"])
     
     with t1:
         st.subheader("Índices Financeiros (SELIC, IPCA, etc)")
-        if st.button("Atualizar Agora"):
-            with st.status("Atualizando...", expanded=True) as status:
-                try:
-                    res = update_all_indices()
-                    status.write("Índices atualizados.")
-                    st.success("Sucesso!")
-                except Exception as e:
-                    st.error(f"Erro: {e}")
+        job = job_progress("indices_job")
+        busy = job is not None and job['status'] in ACTIVE_STATUSES
+        if st.button("Atualizar Agora", disabled=busy):
+            st.session_state["indices_job"] = submit("update_indices", created_by=st.session_state.get('username'))
+            st.rerun()
+        if job is not None and job['status'] == "done":
+            st.success("Índices atualizados.")
     
     with t2:
         st.subheader("Zona de Perigo")
         if st.button("Teste de Integridade"):
             with st.status("Verificando...", expanded=True):
-                time.sleep(1)
-                st.write("Banco de dados: OK")
-                time.sleep(1)
+                try:
+                    started = time.perf_counter()
+                    fetch_scalar("SELECT 1")
+                    st.write(f"Banco de dados: OK ({(time.perf_counter() - started) * 1000:.0f} ms)")
+                except Exception as e:
+                    st.error(f"Banco de dados: falha ({e})")
+
+                status_info = get_connection_status()
+                st.write(f"Backend configurado: {status_info['configured_backend']} | Em uso: {status_info['active_dialect']}")
+                breaker = status_info['breaker']
+                if breaker:
+                    state_labels = {"closed": "Fechado (Supabase ativo)", "open": "Aberto (usando SQLite)", "half_open": "Semiaberto (testando Supabase)"}
+                    st.write(f"Circuit breaker: {state_labels.get(breaker['state'], breaker['state'])} | Falhas: {breaker['failures']}")
+                    if breaker['open_for_seconds'] is not None:
+                        st.write(f"Aberto há {breaker['open_for_seconds']:.0f}s | Sonda de saúde: {'ativa' if breaker['probe_running'] else 'inativa'}")
+                    if breaker['last_error']:
+                        st.caption(f"Último erro: {breaker['last_error']}")
+                boot = bootstrap_status()
+                indices_labels = {"pending": "carregando", "loaded": "carregados"}
+                st.write(f"Inicialização: {'concluída' if boot['ready'] else 'pendente'}"
+                         + (f" em {boot['seconds']:.2f}s" if boot['seconds'] is not None else "")
+                         + f" | Índices: {indices_labels.get(boot['indices'], boot['indices'])}")
+                if boot['error']:
+                    st.caption(f"Último erro: {boot['error']}")
                 st.write("Permissões: OK")
                 st.success("Sistema Íntegro.")
+
+    with t3:
+        st.subheader("Tarefas em Segundo Plano")
+        st.caption("Importações, exportações, PDFs em lote e atualização de índices rodam em processos separados.")
+        jobs = list_jobs(limit=50)
+        if not jobs:
+            st.info("Nenhuma tarefa ainda.")
+        else:
+            st.dataframe(pd.DataFrame([{
+                "ID": job['id'],
+                "Tipo": job['kind'],
+                "Situação": JOB_STATUS_LABELS.get(job['status'], job['status']),
+                "Progresso": f"{job['progress']:.0%}" if job['progress'] is not None else "",
+                "Usuário": job['created_by'] or "",
+                "Criada em": datetime.fromtimestamp(job['created_at']).strftime('%d/%m/%Y %H:%M:%S'),
+                "Duração (s)": round(job['finished_at'] - job['started_at'], 1) if job['finished_at'] and job['started_at'] else None,
+                "Erro": job['error'] or "",
+            } for job in jobs]), use_container_width=True, hide_index=True)
@@ -9,6 +9,7 @@ from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 from datetime import datetime, date
 from decimal import Decimal
 import io
+from src.metrics import timed
 
 class PDFGenerator:
     """Generate professional PDFs for CredMiner HB."""
@@ -61,6 +62,7 @@ class PDFGenerator:
             fontName='Helvetica-Bold'
         ))
 
+    @timed("pdf")
     def generate_debt_memory(self, debtor_name, debtor_cpf, debts_data, calculations_data):
         """
         Generate a "Memória de Cálculo" (Calculation Memory) PDF for debt details.
@@ -184,6 +186,7 @@ class PDFGenerator:
         buffer.seek(0)
         return buffer.getvalue()
 
+    @timed("pdf")
     def generate_agreement_report(self, debtor_name, debtor_cpf, agreement_data, payments_data=None):
         """
         Generate an Agreement Report PDF.
@@ -282,6 +285,7 @@ class PDFGenerator:
         buffer.seek(0)
         return buffer.getvalue()
 
+    @timed("pdf")
     def generate_payment_extract(self, debtor_name, debtor_cpf, period_start, period_end, payments_data):
         """
         Generate a Payment Extract PDF.
@@ -371,6 +375,7 @@ class PDFGenerator:
         buffer.seek(0)
         return buffer.getvalue()
 
+    @timed("pdf")
     def generate_petition_pdf(self, title: str, petition_text: str, metadata: dict = None):
         """
         Generate a petition PDF with a title and the petition body text. Returns bytes.
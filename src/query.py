@@ -0,0 +1,443 @@
+"""Dialect-aware query layer.
+
+SQL is written once with named parameters (`:debtor_id`) and translated per
+backend: SQLite accepts the named style natively, Postgres gets `%(name)s`.
+Statements run on pooled connections that keep a reusable cursor (and, on
+SQLite, the driver's prepared-statement cache) between calls, and every
+execution is timed.
+
+    rows = fetch_all("SELECT id, name FROM debtors WHERE client_id = :client_id", {"client_id": 1})
+
+    with transaction() as tx:
+        new_id = insert("INSERT INTO clients (name) VALUES (:name)", {"name": "ACME"}, tx=tx)
+        execute("INSERT INTO client_forums (client_id, forum_name) VALUES (:id, :forum)", {...}, tx=tx)
+"""
+import csv
+import io
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+from src import metrics
+from src.cache import tables_written
+from src.config import SLOW_QUERY_MS
+from src.connection import get_connection, get_dialect, current_dialect, try_postgres
+from src.slow_queries import log_slow_query, needs_plan
+
+logger = logging.getLogger("credminer.sql")
+
+# A quoted string literal (left untouched) or a :name placeholder not preceded by ':' (Postgres casts)
+_TOKEN = re.compile(r"'(?:[^']|'')*'|(?<!:):([A-Za-z_][A-Za-z0-9_]*)")
+
+POOL_MAX_IDLE = 8
+
+# Statements that take SQLite's write lock
+_WRITE_STATEMENT = re.compile(r"^\s*(INSERT|UPDATE|DELETE|REPLACE|CREATE|DROP|ALTER)\b", re.IGNORECASE)
+
+# Tables a statement writes: INSERT/UPDATE/DELETE targets anywhere in it (CTEs included)
+_WRITE_TARGET = re.compile(r"\b(INSERT\s+(?:OR\s+\w+\s+)?INTO|REPLACE\s+INTO|UPDATE|DELETE\s+FROM)\s+\"?(\w+)", re.IGNORECASE)
+_DDL_STATEMENT = re.compile(r"^\s*(CREATE|DROP|ALTER|PRAGMA)\b", re.IGNORECASE)
+# Words that follow UPDATE without being a table ("DO UPDATE SET", "FOR UPDATE SKIP LOCKED")
+_NOT_TABLES = {"set", "skip", "nowait", "of"}
+# Statements EXPLAIN accepts on both backends
+_EXPLAINABLE = re.compile(r"^\s*(SELECT|WITH|INSERT|UPDATE|DELETE|REPLACE|VALUES)\b", re.IGNORECASE)
+
+# SQLite allows one writer at a time. Instead of letting concurrent sessions race
+# for the file lock (and sleep in busy_timeout), write transactions in this process
+# queue here: the first write statement of a transaction takes the lock and the
+# commit/rollback releases it. Reads never take it, and under WAL never block.
+_sqlite_writer = threading.RLock()
+
+
+@lru_cache(maxsize=1024)
+def translate(sql, dialect_name):
+    """Returns `sql` with :name placeholders rewritten for the given dialect (cached)."""
+    if dialect_name == 'sqlite':
+        return sql
+
+    def replace(match):
+        if match.group(1) is None:
+            return match.group(0).replace('%', '%%')
+        return f"%({match.group(1)})s"
+
+    parts = []
+    last = 0
+    for match in _TOKEN.finditer(sql):
+        parts.append(sql[last:match.start()].replace('%', '%%'))
+        parts.append(replace(match))
+        last = match.end()
+    parts.append(sql[last:].replace('%', '%%'))
+    return ''.join(parts)
+
+
+@lru_cache(maxsize=1024)
+def written_tables(sql):
+    """(table, is_delete) pairs for the tables a DML statement writes; () for reads and DDL (cached)."""
+    if _DDL_STATEMENT.match(sql):
+        return ()
+    return tuple(sorted({
+        (match.group(2).lower(), match.group(1)[:6].upper() == "DELETE")
+        for match in _WRITE_TARGET.finditer(sql) if match.group(2).lower() not in _NOT_TABLES
+    }))
+
+
+def _note_writes(session, sql):
+    """Remembers the tables `sql` writes, to report once the transaction commits."""
+    for table, deleted in written_tables(sql):
+        if session.changes is None:
+            session.changes = {}
+        session.changes[table] = session.changes.get(table, False) or deleted
+
+
+def _adapt(params):
+    """Unwraps numpy scalars (values taken from DataFrame rows) for the DB drivers."""
+    if not params:
+        return {}
+    adapted = {}
+    for key, value in params.items():
+        if type(value).__module__ == 'numpy' and hasattr(value, 'item'):
+            value = value.item()
+        adapted[key] = value
+    return adapted
+
+
+class PooledConnection:
+    """A pooled DB connection with its dialect and a cursor reused across statements."""
+
+    __slots__ = ('conn', 'dialect', '_cursor', 'writing', 'changes')
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.dialect = get_dialect(conn)
+        self._cursor = None
+        self.writing = False
+        # {table: rows deleted?} written by the open transaction
+        self.changes = None
+
+    def begin_write(self):
+        """SQLite: waits for this process' writer slot before the transaction's first write."""
+        if self.dialect.is_sqlite and not self.writing:
+            _sqlite_writer.acquire()
+            self.writing = True
+
+    def end_write(self):
+        if self.writing:
+            self.writing = False
+            _sqlite_writer.release()
+
+    @property
+    def cursor(self):
+        if self._cursor is None:
+            self._cursor = self.conn.cursor()
+        return self._cursor
+
+    def close(self):
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """Keeps idle connections per dialect so calls don't pay a connect each time."""
+
+    def __init__(self, max_idle=POOL_MAX_IDLE):
+        self.max_idle = max_idle
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        wanted = current_dialect()
+        if wanted.is_sqlite:
+            # Postgres configured but the breaker isn't closed: idle SQLite connections
+            # would never reach get_connection(), so give the breaker its trial here
+            conn = try_postgres()
+            if conn is not None:
+                self._drop_idle('sqlite')
+                return PooledConnection(conn)
+        else:
+            # Back on Postgres: the fallback connections aren't needed anymore
+            self._drop_idle('sqlite')
+        with self._lock:
+            idle = self._idle.get(wanted.name)
+            if idle:
+                return idle.pop()
+        return PooledConnection(get_connection())
+
+    def release(self, pooled, discard=False):
+        if not discard and getattr(pooled.conn, 'closed', 0):
+            discard = True  # psycopg2 marks dropped connections as closed
+        if not discard:
+            with self._lock:
+                idle = self._idle.setdefault(pooled.dialect.name, [])
+                if len(idle) < self.max_idle:
+                    idle.append(pooled)
+                    return
+        pooled.close()
+
+    def _drop_idle(self, dialect_name):
+        with self._lock:
+            stale = self._idle.pop(dialect_name, None)
+        for pooled in stale or ():
+            pooled.close()
+
+    def clear(self):
+        with self._lock:
+            pooled_all = [p for idle in self._idle.values() for p in idle]
+            self._idle.clear()
+        for pooled in pooled_all:
+            pooled.close()
+
+
+pool = ConnectionPool()
+
+_stats_lock = threading.Lock()
+_statement_stats = {}
+
+
+def _record_timing(sql, elapsed_ms):
+    metrics.observe("query", elapsed_ms)
+    with _stats_lock:
+        stats = _statement_stats.get(sql)
+        if stats is None:
+            _statement_stats[sql] = [1, elapsed_ms, elapsed_ms]
+        else:
+            stats[0] += 1
+            stats[1] += elapsed_ms
+            if elapsed_ms > stats[2]:
+                stats[2] = elapsed_ms
+
+
+def statement_stats():
+    """Per-statement timing since process start, slowest total first.
+
+    Returns a list of dicts: sql, calls, total_ms, max_ms.
+    """
+    with _stats_lock:
+        items = [
+            {"sql": sql, "calls": s[0], "total_ms": s[1], "max_ms": s[2]}
+            for sql, s in _statement_stats.items()
+        ]
+    return sorted(items, key=lambda s: s["total_ms"], reverse=True)
+
+
+def _all(cursor):
+    rows = cursor.fetchall()
+    return rows, len(rows)
+
+
+def _one(cursor):
+    row = cursor.fetchone()
+    return row, int(row is not None)
+
+
+def _columns_and_rows(cursor):
+    rows = cursor.fetchall()
+    return ([c[0] for c in cursor.description], rows), len(rows)
+
+
+def _run(pooled, sql, params, many=False, fetch=None):
+    """Executes `sql` on the pooled cursor and returns it, or what `fetch` (_all,
+    _one...) takes from it: fetching is timed with the execution, since SQLite
+    produces rows as they are fetched."""
+    text = translate(sql, pooled.dialect.name)
+    if pooled.dialect.is_sqlite and _WRITE_STATEMENT.match(sql):
+        pooled.begin_write()
+    _note_writes(pooled, sql)
+    cursor = pooled.cursor
+    if many:
+        params = [_adapt(p) for p in params]
+    started = time.perf_counter()
+    if many:
+        cursor.executemany(text, params)
+    else:
+        cursor.execute(text, _adapt(params))
+    if fetch is None:
+        result, rows = cursor, cursor.rowcount
+    else:
+        result, rows = fetch(cursor)
+        metrics.add("rows", rows)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    _record_timing(sql, elapsed_ms)
+    logger.debug("%.2f ms [%s] %s", elapsed_ms, pooled.dialect.name, text)
+    if 0 <= SLOW_QUERY_MS <= elapsed_ms:
+        _log_slow(pooled, sql, params, many, elapsed_ms, rows)
+    return result
+
+
+def explain(pooled, sql, params=None):
+    """The backend's plan for `sql` as text lines (EXPLAIN on Postgres, EXPLAIN QUERY
+    PLAN on SQLite), in the pooled connection's transaction; None if it has none."""
+    if not _EXPLAINABLE.match(sql):
+        return None
+    cursor = pooled.conn.cursor()
+    try:
+        if pooled.dialect.is_sqlite:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, _adapt(params))
+            return [str(row[-1]) for row in cursor.fetchall()]
+        # A failed EXPLAIN must not abort the caller's transaction
+        cursor.execute("SAVEPOINT explain_plan")
+        try:
+            cursor.execute("EXPLAIN " + translate(sql, pooled.dialect.name), _adapt(params))
+            return [row[0] for row in cursor.fetchall()]
+        except Exception:
+            cursor.execute("ROLLBACK TO SAVEPOINT explain_plan")
+            raise
+        finally:
+            cursor.execute("RELEASE SAVEPOINT explain_plan")
+    finally:
+        cursor.close()
+
+
+def _log_slow(pooled, sql, params, many, elapsed_ms, rows):
+    # Logging a slow statement never fails the statement itself
+    try:
+        plan = None
+        if needs_plan(pooled.dialect.name, sql):
+            try:
+                plan = explain(pooled, sql, params[0] if many and params else params)
+            except Exception as e:
+                plan = [f"EXPLAIN failed: {e}"]
+        log_slow_query(pooled.dialect.name, sql, params, elapsed_ms, rows, plan, many)
+    except Exception as e:
+        logger.warning("Could not log slow query: %s", e)
+
+
+@contextmanager
+def transaction():
+    """Yields a pooled connection; commits on success, rolls back on error.
+
+    After a commit, the tables written get a new data version (src.cache.tables_written).
+    """
+    pooled = pool.acquire()
+    committed = discard = False
+    try:
+        yield pooled
+        pooled.conn.commit()
+        committed = True
+        if pooled.changes:
+            tables_written(pooled.changes)
+    finally:
+        if not committed:
+            # Errors, but also GeneratorExit (a stream() closed early) and KeyboardInterrupt:
+            # the connection must not go back to the pool inside an open transaction
+            try:
+                pooled.conn.rollback()
+            except Exception:
+                discard = True
+        pooled.changes = None
+        pooled.end_write()
+        pool.release(pooled, discard=discard)
+
+
+@contextmanager
+def _session(tx):
+    if tx is not None:
+        yield tx
+    else:
+        with transaction() as pooled:
+            yield pooled
+
+
+def execute(sql, params=None, tx=None):
+    """Runs a statement and returns the affected row count."""
+    with _session(tx) as pooled:
+        return _run(pooled, sql, params).rowcount
+
+
+def executemany(sql, seq_of_params, tx=None):
+    """Runs a statement once per parameter dict."""
+    with _session(tx) as pooled:
+        return _run(pooled, sql, seq_of_params, many=True).rowcount
+
+
+def bulk_insert(table, columns, rows, tx=None):
+    """Inserts many rows (sequences in `columns` order) the fastest way per backend.
+
+    Postgres streams them with COPY; SQLite uses executemany on one prepared INSERT.
+    Returns the number of rows written.
+    """
+    rows = list(rows)
+    if not rows:
+        return 0
+    with _session(tx) as pooled:
+        pooled.begin_write()
+        _note_writes(pooled, f"INSERT INTO {table}")
+        started = time.perf_counter()
+        if pooled.dialect.is_postgres:
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(rows)
+            buffer.seek(0)
+            sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+            pooled.cursor.copy_expert(sql, buffer)
+        else:
+            sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+            pooled.cursor.executemany(sql, rows)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+    _record_timing(sql, elapsed_ms)
+    logger.debug("%.2f ms [%s] %s (%d rows)", elapsed_ms, pooled.dialect.name, sql, len(rows))
+    return len(rows)
+
+
+def insert(sql, params=None, tx=None):
+    """Runs an INSERT and returns the new row id."""
+    with _session(tx) as pooled:
+        if pooled.dialect.is_postgres:
+            return _run(pooled, sql + " RETURNING id", params, fetch=_one)[0]
+        return _run(pooled, sql, params).lastrowid
+
+
+def fetch_all(sql, params=None, tx=None):
+    with _session(tx) as pooled:
+        return _run(pooled, sql, params, fetch=_all)
+
+
+def fetch_one(sql, params=None, tx=None):
+    with _session(tx) as pooled:
+        return _run(pooled, sql, params, fetch=_one)
+
+
+def fetch_scalar(sql, params=None, tx=None):
+    """Returns the first column of the first row, or None."""
+    row = fetch_one(sql, params, tx=tx)
+    return row[0] if row else None
+
+
+def stream(sql, params=None, batch_size=10_000):
+    """Yields (column names, list of row tuples) batches without loading the whole result.
+
+    Postgres uses a named (server-side) cursor, SQLite fetchmany on its own cursor.
+    The pooled connection is held until the generator is exhausted or closed.
+    """
+    with transaction() as pooled:
+        started = time.perf_counter()
+        if pooled.dialect.is_postgres:
+            cursor = pooled.conn.cursor(name=f"stream_{threading.get_ident()}_{time.monotonic_ns()}")
+            cursor.itersize = batch_size
+        else:
+            cursor = pooled.conn.cursor()
+        try:
+            cursor.execute(translate(sql, pooled.dialect.name), _adapt(params))
+            _record_timing(sql, (time.perf_counter() - started) * 1000)
+            columns = None
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                if columns is None:
+                    columns = [c[0] for c in cursor.description]
+                metrics.add("rows", len(rows))
+                yield columns, rows
+        finally:
+            cursor.close()
+
+
+def read_df(sql, params=None, tx=None):
+    """Runs a query and returns the result as a pandas DataFrame."""
+    import pandas as pd
+    with _session(tx) as pooled:
+        columns, rows = _run(pooled, sql, params, fetch=_columns_and_rows)
+    return pd.DataFrame.from_records(rows, columns=columns)
@@ -0,0 +1,181 @@
+"""Batch reports over the whole portfolio (or one client), for month-end runs.
+
+- revalue_portfolio: every debt valued with Calculator at one date, per-client
+  totals and optionally a CSV with one line per debt.
+- write_debt_memories: one "Memória de Cálculo" PDF per debtor with debts, zipped.
+
+Both are CPU-bound (Calculator, ReportLab), so with processes > 1 the batches
+are spread over that many worker processes; at most two batches per process are
+in flight, so memory stays flat like the streaming export. Used by the CLI
+(python -m credminer revalue / reports build) and the background jobs.
+
+    stats = revalue_portfolio("reavaliacao.csv", calc_date=date(2025, 12, 31), processes=8)
+    print(stats["total"], stats["debts_per_sec"])
+"""
+import csv
+import re
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from functools import lru_cache
+from multiprocessing import get_context
+
+from src.export import EXPORT_BATCH_SIZE, _valuer
+from src.query import fetch_all, stream
+
+# Debtors per batch of PDFs handed to one process
+MEMORY_BATCH_SIZE = 25
+
+REVALUE_SQL = """
+    SELECT id, debtor_id, client_id, contract_type, original_value, due_date, fine_type
+    FROM debts
+"""
+REVALUE_COLUMNS = ("divida_id", "devedor_id", "cliente_id", "tipo_contrato", "valor_original", "vencimento",
+                   "valor_corrigido", "juros", "multa", "total")
+_AMOUNTS = ("original", "corrected", "interest", "fine", "total")
+
+
+def _parallel_map(func, batches, processes, *args):
+    """Yields func(batch, *args) for each batch, in order; in worker processes if processes > 1."""
+    if processes <= 1:
+        for batch in batches:
+            yield func(batch, *args)
+        return
+    executor = ProcessPoolExecutor(processes, mp_context=get_context("spawn"))
+    pending = deque()
+    try:
+        for batch in batches:
+            pending.append(executor.submit(func, batch, *args))
+            if len(pending) >= 2 * processes:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+@lru_cache(maxsize=4)
+def _process_valuer(calc_date):
+    # One per process and date: its cache of identical debts is kept across batches
+    return _valuer(calc_date)
+
+
+def _value_batch(rows, calc_date):
+    value = _process_valuer(calc_date)
+    return [row[:6] + value(row[3], row[4], row[5], row[6]) for row in rows]
+
+
+def revalue_portfolio(out=None, client_id=None, calc_date=None, processes=1,
+                      batch_size=EXPORT_BATCH_SIZE, progress=None):
+    """Values every debt (of a client, or all) at `calc_date` (default today).
+
+    `out`, if given, is a CSV path written with REVALUE_COLUMNS. `progress` is
+    called with the number of debts valued after each batch. Returns a dict with
+    debts, failed (debts Calculator couldn't value), the original, corrected,
+    interest, fine and total sums, by_client ({client_id: same sums and debts}),
+    seconds and debts_per_sec.
+    """
+    calc_date = calc_date or date.today()
+    sql = REVALUE_SQL + (" WHERE client_id = :client_id" if client_id else "") + " ORDER BY id"
+    batches = (rows for _, rows in stream(sql, {"client_id": client_id}, batch_size))
+    totals = dict.fromkeys(_AMOUNTS, 0.0)
+    by_client = {}
+    debts = failed = 0
+    started = time.perf_counter()
+
+    f = open(out, "w", encoding="utf-8", newline="") if out else None
+    writer = csv.writer(f, delimiter=";") if f else None
+    valued_batches = _parallel_map(_value_batch, batches, processes, calc_date)
+    try:
+        if writer:
+            writer.writerow(REVALUE_COLUMNS)
+        for valued in valued_batches:
+            for row in valued:
+                client = by_client.setdefault(row[2], {"debts": 0, **dict.fromkeys(_AMOUNTS, 0.0)})
+                client["debts"] += 1
+                if row[6] is None:
+                    failed += 1
+                else:
+                    for key, amount in zip(_AMOUNTS, (float(row[4]),) + row[6:]):
+                        client[key] += amount
+                        totals[key] += amount
+            if writer:
+                writer.writerows(valued)
+            debts += len(valued)
+            if progress:
+                progress(debts)
+    finally:
+        valued_batches.close()
+        batches.close()
+        if f:
+            f.close()
+
+    seconds = time.perf_counter() - started
+    return {"debts": debts, "failed": failed, **totals, "by_client": by_client,
+            "seconds": seconds, "debts_per_sec": debts / seconds if seconds > 0 else 0}
+
+
+@lru_cache(maxsize=1)
+def pdf_generator():
+    """One PDFGenerator per process: its paragraph styles are built once, not per document."""
+    from src.pdf_generator import PDFGenerator
+    return PDFGenerator()
+
+
+def _render_memories(debtors, calc_date):
+    from src.calculator import Calculator
+
+    generator = pdf_generator()
+    rendered = []
+    for debtor_id, name, cpf_cnpj, debts in debtors:
+        rows, fines, total = [], 0, 0
+        for debt_id, description, due_date, original_value, contract_type, fine_type in debts:
+            result = Calculator.calculate(contract_type, original_value, due_date, calc_date, fine_type=fine_type)
+            fines += result["fine"]
+            total += result["total"]
+            rows.append({"id": debt_id, "description": description or "-", "due_date": str(due_date),
+                         "original_value": original_value})
+        pdf = generator.generate_debt_memory(name, cpf_cnpj or "-", rows, {
+            "selic_rate": "-", "ipca_rate": "-", "interest_rate": "-",
+            "fine_amount": f"R$ {fines:,.2f}", "total_updated": f"R$ {total:,.2f}",
+        })
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", name).strip("_")[:40]
+        rendered.append((f"{debtor_id}_{slug}.pdf", pdf))
+    return rendered
+
+
+def write_debt_memories(out, client_id=None, calc_date=None, processes=1, progress=None):
+    """Writes a zip to `out` with one calculation memory PDF per debtor with debts
+    (of a client, or all), valued at `calc_date` (default today).
+
+    `progress` is called with (debtors done, debtors with debts) after each batch.
+    Returns a dict with pdfs, debtors (all of the client's) and seconds.
+    """
+    calc_date = calc_date or date.today()
+    where = " WHERE client_id = :client_id" if client_id else ""
+    params = {"client_id": client_id}
+    debtors = fetch_all(f"SELECT id, name, cpf_cnpj FROM debtors{where} ORDER BY name, id", params)
+    debts = {}
+    for row in fetch_all(f"SELECT debtor_id, id, description, due_date, original_value, contract_type, fine_type "
+                         f"FROM debts{where} ORDER BY debtor_id, id", params):
+        debts.setdefault(row[0], []).append(row[1:])
+    with_debts = [(debtor_id, name, cpf_cnpj, debts[debtor_id]) for debtor_id, name, cpf_cnpj in debtors
+                  if debtor_id in debts]
+    batches = (with_debts[i:i + MEMORY_BATCH_SIZE] for i in range(0, len(with_debts), MEMORY_BATCH_SIZE))
+    started = time.perf_counter()
+
+    done = 0
+    rendered_batches = _parallel_map(_render_memories, batches, processes, calc_date)
+    try:
+        with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as archive:
+            for rendered in rendered_batches:
+                for name, pdf in rendered:
+                    archive.writestr(name, pdf)
+                done += len(rendered)
+                if progress:
+                    progress(done, len(with_debts))
+    finally:
+        rendered_batches.close()
+    return {"pdfs": done, "debtors": len(debtors), "seconds": time.perf_counter() - started}
@@ -0,0 +1,131 @@
+"""Ranked debtor search across debtors, guarantors and contact history.
+
+SQLite uses the FTS5 tables maintained by triggers (migration 007): words go to
+`debtor_search` (accent/case-insensitive prefixes), digit fragments of
+documents and phones to the trigram table `debtor_search_digits`. Postgres uses
+GIN expression indexes (Portuguese tsvector over unaccented text, pg_trgm over
+the digits), so there is nothing to keep in sync.
+
+    ids = search_debtors("jose silva 4321")   # best match first
+"""
+import re
+import unicodedata
+
+from src.connection import POSTGRES, current_dialect
+from src.migrations import SEARCH_SOURCES, populate_search_index, search_digits_sql, search_tsvector_sql
+from src.query import execute, fetch_all, transaction
+
+# Trigram matching needs at least 3 characters
+MIN_DIGITS = 3
+
+# SQLite ranks at most this many matching rows (first ones in rowid order), so a
+# broad term ("jo") costs the same at 10k or 1M debtors; narrower queries rank exactly.
+SEARCH_CANDIDATES = 2000
+
+
+def _strip_accents(text):
+    return unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode()
+
+
+def parse_query(text):
+    """Splits a search box string into (words, digit fragments).
+
+    A whitespace-separated token that is only digits and punctuation
+    ("529.982.247-25", "(11) 9876") is a digit fragment; anything else is
+    split into alphanumeric words (for e-mails, only the part before "@").
+    """
+    words, digits = [], []
+    for token in _strip_accents(text or "").lower().split():
+        compact = re.sub(r"[\W_]", "", token)
+        if compact.isdigit():
+            if len(compact) >= MIN_DIGITS:
+                digits.append(compact)
+        else:
+            if "@" in token:
+                # E-mail: the domain ("gmail.com") matches half the table; its local part is enough
+                token = token.split("@", 1)[0]
+            words.extend(w for w in re.split(r"[\W_]+", token) if w)
+    return words, digits
+
+
+def _sqlite_search(words, digits, client_id, limit):
+    params = {"limit": int(limit), "candidates": SEARCH_CANDIDATES}
+    word_query = []
+    if client_id:
+        word_query.append(f'client_id : "{int(client_id)}"')
+    if words:
+        word_query.append("terms : (" + " ".join(f'"{w}"*' for w in words) + ")")
+    params["words"] = " AND ".join(word_query)
+    params["digits"] = " ".join(f'"{d}"' for d in digits)
+
+    if word_query and digits:
+        # Intersect the two rowid sets (each scanned once, without bm25 - over a
+        # broad side that would be the slow part)
+        ctes = """
+            words AS MATERIALIZED (SELECT rowid, debtor_id FROM debtor_search WHERE debtor_search MATCH :words),
+            fragments AS MATERIALIZED (SELECT rowid FROM debtor_search_digits WHERE debtor_search_digits MATCH :digits),
+            hits AS MATERIALIZED (
+                SELECT debtor_id, 0 AS rank FROM words WHERE rowid IN (SELECT rowid FROM fragments) LIMIT :candidates
+            )
+        """
+    elif word_query:
+        ctes = "hits AS MATERIALIZED (SELECT debtor_id, bm25(debtor_search) AS rank FROM debtor_search WHERE debtor_search MATCH :words LIMIT :candidates)"
+    else:
+        ctes = "hits AS MATERIALIZED (SELECT debtor_id, bm25(debtor_search_digits) AS rank FROM debtor_search_digits WHERE debtor_search_digits MATCH :digits LIMIT :candidates)"
+
+    # bm25: lower is better. MATERIALIZED keeps bm25() in the FTS query (it can't be
+    # flattened into the join); the join drops rows whose debtor no longer exists.
+    sql = f"""
+        WITH {ctes}
+        SELECT hits.debtor_id FROM hits JOIN debtors d ON d.id = hits.debtor_id
+        GROUP BY hits.debtor_id ORDER BY MIN(hits.rank), MIN(d.name) LIMIT :limit
+    """
+    return [row[0] for row in fetch_all(sql, params)]
+
+
+def _postgres_search(words, digits, client_id, limit):
+    params = {"limit": int(limit)}
+    if words:
+        params["tsquery"] = " & ".join(f"{w}:*" for w in words)
+    branches = []
+    for table, _, debtor_column, text_columns, digit_columns in SEARCH_SOURCES:
+        conditions = []
+        rank = "0"
+        if words:
+            vector = search_tsvector_sql(text_columns)
+            conditions.append(f"{vector} @@ to_tsquery('portuguese', f_unaccent(:tsquery))")
+            rank = f"ts_rank({vector}, to_tsquery('portuguese', f_unaccent(:tsquery)))"
+        for i, fragment in enumerate(digits):
+            conditions.append(f"({search_digits_sql(digit_columns, POSTGRES)}) LIKE :digits_{i}")
+            params[f"digits_{i}"] = f"%{fragment}%"
+        branches.append(f"SELECT {debtor_column} AS debtor_id, {rank} AS rank FROM {table} WHERE {' AND '.join(conditions)}")
+
+    sql = f"SELECT hits.debtor_id FROM ({' UNION ALL '.join(branches)}) hits JOIN debtors d ON d.id = hits.debtor_id"
+    if client_id:
+        sql += " WHERE d.client_id = :client_id"
+        params["client_id"] = client_id
+    sql += " GROUP BY hits.debtor_id ORDER BY MAX(hits.rank) DESC, hits.debtor_id LIMIT :limit"
+    return [row[0] for row in fetch_all(sql, params)]
+
+
+def search_debtors(text, client_id=None, limit=20):
+    """Ids of the debtors best matching `text` (name, document, phone, email,
+    guarantor or contact), best first. Every word must match as a prefix and
+    every digit fragment anywhere in a document/phone of the same record.
+    """
+    words, digits = parse_query(text)
+    if not words and not digits:
+        return []
+    if current_dialect().is_postgres:
+        return _postgres_search(words, digits, client_id, limit)
+    return _sqlite_search(words, digits, client_id, limit)
+
+
+def rebuild_search_index():
+    """SQLite: repopulates the FTS tables from the source tables (after bulk fixes)."""
+    if current_dialect().is_postgres:
+        return
+    with transaction() as tx:
+        execute("DELETE FROM debtor_search", tx=tx)
+        execute("DELETE FROM debtor_search_digits", tx=tx)
+        populate_search_index(tx.cursor, tx.dialect)
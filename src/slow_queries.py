@@ -0,0 +1,169 @@
+"""Slow query log: statements that took SLOW_QUERY_MS or more, with their plan.
+
+The query layer times every statement (fetching included: SQLite produces rows
+as they are fetched). A slow one is appended to SLOW_QUERY_LOG as a JSON line:
+normalized SQL, the parameters' names and types (never their values), the row
+count, the app frames that ran it and the backend's plan (EXPLAIN on Postgres,
+EXPLAIN QUERY PLAN on SQLite), taken at most once per statement every
+SLOW_QUERY_EXPLAIN_INTERVAL seconds. The file rotates at SLOW_QUERY_LOG_MAX_MB,
+keeping SLOW_QUERY_LOG_BACKUPS old files.
+
+    PYTHONPATH=. python scripts/slow_queries.py --top 20   # statements by total time
+"""
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
+from logging.handlers import RotatingFileHandler
+
+from src.config import (SLOW_QUERY_EXPLAIN_INTERVAL, SLOW_QUERY_LOG, SLOW_QUERY_LOG_BACKUPS,
+                        SLOW_QUERY_LOG_MAX_MB)
+
+CALLER_FRAMES = 3
+
+_log = logging.getLogger("credminer.slow_sql")
+_log.propagate = False
+_lock = threading.Lock()
+# (dialect, normalized sql) -> monotonic time of its last EXPLAIN
+_explained = {}
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The query layer's own frames; the log records who called it
+_INTERNAL_FILES = {os.path.join(_ROOT, "src", name) for name in ("query.py", "async_query.py", "slow_queries.py")}
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.:])\d+(?:\.\d+)?\b")
+# :id0, :id_1 (placeholders generated per list item) -> :id
+_NUMBERED_PARAM = re.compile(r"(?<!:):([A-Za-z_][A-Za-z0-9_]*?)_?\d+\b")
+_REPEATED_ITEM = re.compile(r"(\?|:\w+)(?:\s*,\s*\1)+")
+_SPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(sql):
+    """`sql` with literals as ?, per-item placeholders and IN lists folded and
+    whitespace collapsed, so every execution of a statement groups together."""
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _NUMBERED_PARAM.sub(r":\1", sql)
+    sql = _REPEATED_ITEM.sub(r"\1, ...", sql)
+    return _SPACE.sub(" ", sql).strip()
+
+
+def _type_name(value):
+    if isinstance(value, (list, tuple)):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+
+def param_shape(params, many=False):
+    """Parameter names and types, never the values: {"id": "int"}; {"batch": n, "each": {...}} for executemany."""
+    if many:
+        params = list(params)
+        return {"batch": len(params), "each": param_shape(params[0]) if params else {}}
+    if not params:
+        return {}
+    if isinstance(params, dict):
+        return {name: _type_name(value) for name, value in params.items()}
+    return [_type_name(value) for value in params]
+
+
+def _callers():
+    """'file:line function' of the innermost app frames outside the query layer."""
+    callers = []
+    frame = sys._getframe(1)
+    while frame is not None and len(callers) < CALLER_FRAMES:
+        path = frame.f_code.co_filename
+        if path.startswith(_ROOT) and path not in _INTERNAL_FILES:
+            callers.append(f"{os.path.relpath(path, _ROOT)}:{frame.f_lineno} {frame.f_code.co_name}")
+        frame = frame.f_back
+    return callers
+
+
+def needs_plan(dialect_name, sql):
+    """True if this statement's plan wasn't logged in the last SLOW_QUERY_EXPLAIN_INTERVAL seconds."""
+    key = (dialect_name, normalize_sql(sql))
+    now = time.monotonic()
+    with _lock:
+        last = _explained.get(key)
+        if last is not None and now - last < SLOW_QUERY_EXPLAIN_INTERVAL:
+            return False
+        _explained[key] = now
+        return True
+
+
+def _logger():
+    if not _log.handlers:
+        with _lock:
+            if not _log.handlers:
+                directory = os.path.dirname(SLOW_QUERY_LOG)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                handler = RotatingFileHandler(SLOW_QUERY_LOG, maxBytes=int(SLOW_QUERY_LOG_MAX_MB * 1024 * 1024),
+                                              backupCount=SLOW_QUERY_LOG_BACKUPS, encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                _log.addHandler(handler)
+                _log.setLevel(logging.INFO)
+    return _log
+
+
+def log_slow_query(dialect_name, sql, params, elapsed_ms, rows, plan=None, many=False):
+    """Appends one slow execution to SLOW_QUERY_LOG."""
+    record = {
+        "at": datetime.now().isoformat(timespec="seconds"),
+        "dialect": dialect_name,
+        "ms": round(elapsed_ms, 2),
+        "sql": normalize_sql(sql),
+        "params": param_shape(params, many),
+        "rows": rows,
+        "callers": _callers(),
+        # Postgres prints the bound values into the plan; strings may be names or documents
+        "plan": [_STRING.sub("'?'", line) for line in plan] if plan else plan,
+    }
+    _logger().info(json.dumps(record, ensure_ascii=False))
+
+
+def read_slow_log(path=SLOW_QUERY_LOG):
+    """Yields the logged records, oldest first (rotated files included)."""
+    paths = [f"{path}.{n}" for n in range(SLOW_QUERY_LOG_BACKUPS, 0, -1)] + [path]
+    for name in paths:
+        if not os.path.exists(name):
+            continue
+        with open(name, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def summarize(records):
+    """Groups records by (dialect, sql), slowest total first.
+
+    Returns a list of dicts: dialect, sql, count, total_ms, max_ms, mean_ms, rows
+    (mean), callers ({caller: count}), plan (the latest one logged).
+    """
+    groups = {}
+    for record in records:
+        group = groups.setdefault((record["dialect"], record["sql"]), {
+            "dialect": record["dialect"], "sql": record["sql"], "count": 0, "total_ms": 0.0, "max_ms": 0.0,
+            "rows": 0, "callers": {}, "plan": None,
+        })
+        group["count"] += 1
+        group["total_ms"] += record["ms"]
+        group["max_ms"] = max(group["max_ms"], record["ms"])
+        group["rows"] += max(record.get("rows") or 0, 0)
+        if record.get("callers"):
+            caller = record["callers"][0]
+            group["callers"][caller] = group["callers"].get(caller, 0) + 1
+        if record.get("plan"):
+            group["plan"] = record["plan"]
+    for group in groups.values():
+        group["mean_ms"] = group["total_ms"] / group["count"]
+        group["rows"] = group["rows"] / group["count"]
+    return sorted(groups.values(), key=lambda g: g["total_ms"], reverse=True)
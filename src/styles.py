@@ -1,8 +1,10 @@
 
+import re
+from functools import lru_cache
+
 import streamlit as st
 
-def load_custom_css():
-    st.markdown("""
+_CUSTOM_CSS = """
     <link href="https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap" rel="stylesheet">
     <style>
         /* === PREMIUM DARK & ORANGE THEME === */
@@ -242,4 +244,17 @@ def load_custom_css():
 
         
     </style>
-    """, unsafe_allow_html=True)
+"""
+
+
+@lru_cache(maxsize=1)
+def prepare_css():
+    """The theme's <link>/<style> block without comments and indentation (built once per process)."""
+    css = re.sub(r"/\*.*?\*/", "", _CUSTOM_CSS, flags=re.DOTALL)
+    css = re.sub(r"\s*\n\s*", "", css)
+    return re.sub(r"\s*([{}:;,>])\s*", r"\1", css)
+
+
+def load_custom_css():
+    # Streamlit drops elements a rerun doesn't emit again, so this runs every rerun
+    st.markdown(prepare_css(), unsafe_allow_html=True)
@@ -1,6 +1,13 @@
 import re
 from typing import Tuple, Optional
 
+
+def document_digits(value) -> Optional[str]:
+    """CPF/CNPJ reduzido aos dígitos (forma gravada em debtors.cpf_cnpj_digits); None se vazio."""
+    digits = re.sub(r'\D', '', str(value or ''))
+    return digits or None
+
+
 class ContactValidator:
     """Valida e formata dados de contato usando regex"""
     
@@ -42,6 +49,36 @@ class ContactValidator:
         formatted = f"{cpf_clean[:3]}.{cpf_clean[3:6]}.{cpf_clean[6:9]}-{cpf_clean[9:]}"
         return True, formatted
     
+    @staticmethod
+    def validate_cnpj(cnpj: str) -> Tuple[bool, str]:
+        """
+        Valida CNPJ (14 dígitos e dígitos verificadores).
+        Retorna (is_valid, formatted_cnpj)
+        """
+        cnpj_clean = re.sub(r'\D', '', cnpj)
+        
+        if not re.match(r'^\d{14}$', cnpj_clean):
+            return False, "CNPJ deve conter 14 dígitos"
+        
+        if len(set(cnpj_clean)) == 1:
+            return False, "CNPJ inválido (dígitos iguais)"
+        
+        cnpj_list = [int(digit) for digit in cnpj_clean]
+        weights1 = [5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
+        weights2 = [6] + weights1
+        
+        digit1 = sum(d * w for d, w in zip(cnpj_list, weights1)) % 11
+        digit1 = 0 if digit1 < 2 else 11 - digit1
+        digit2 = sum(d * w for d, w in zip(cnpj_list, weights2)) % 11
+        digit2 = 0 if digit2 < 2 else 11 - digit2
+        
+        if cnpj_list[12] != digit1 or cnpj_list[13] != digit2:
+            return False, "CNPJ inválido (dígitos verificadores incorretos)"
+        
+        # Formatar: XX.XXX.XXX/XXXX-XX
+        formatted = f"{cnpj_clean[:2]}.{cnpj_clean[2:5]}.{cnpj_clean[5:8]}/{cnpj_clean[8:12]}-{cnpj_clean[12:]}"
+        return True, formatted
+    
     @staticmethod
     def validate_rg(rg: str) -> Tuple[bool, str]:
         """
@@ -86,7 +123,7 @@ class ContactValidator:
         # Formatação: (XX) XXXXX-XXXX ou (XX) XXXX-XXXX
         if len(phone_clean) == 11:
             # Celular: (XX) 9XXXX-XXXX
-            formatted = f"({phone_clean[:2]}) 9{phone_clean[3:7]}-{phone_clean[7:]}"
+            formatted = f"({phone_clean[:2]}) {phone_clean[2:7]}-{phone_clean[7:]}"
         else:
             # Fixo: (XX) XXXX-XXXX
             formatted = f"({phone_clean[:2]}) {phone_clean[2:6]}-{phone_clean[6:]}"
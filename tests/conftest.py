@@ -0,0 +1,19 @@
+import pytest
+
+from src import database
+from src.cache import invalidate
+from src.query import pool
+
+
+@pytest.fixture
+def sqlite_db(tmp_path, monkeypatch):
+    """A fresh, migrated SQLite database (data/debtors.db under a temporary directory)."""
+    monkeypatch.chdir(tmp_path)
+    pool.clear()
+    invalidate()
+    database._initialized_dialects.clear()
+    database.init_db()
+    yield tmp_path
+    pool.clear()
+    invalidate()
+    database._initialized_dialects.clear()
@@ -0,0 +1,28 @@
+"""Yearly archive of payments and contact_history (src/archive.py)."""
+from src.archive import archive_history
+from src.query import fetch_all, insert, transaction
+
+
+def _debtor_with_payment(name, agreement_statuses):
+    with transaction() as tx:
+        client_id = insert("INSERT INTO clients (name) VALUES (:name)", {"name": f"Cliente {name}"}, tx=tx)
+        debtor_id = insert("INSERT INTO debtors (client_id, name) VALUES (:client_id, :name)",
+                           {"client_id": client_id, "name": name}, tx=tx)
+        for status in agreement_statuses:
+            insert("INSERT INTO agreements (debtor_id, client_id, status, agreement_date, agreed_value) "
+                   "VALUES (:debtor_id, :client_id, :status, '2022-03-01', 500)",
+                   {"debtor_id": debtor_id, "client_id": client_id, "status": status}, tx=tx)
+        insert("INSERT INTO payments (debtor_id, client_id, payment_date, amount) VALUES (:debtor_id, :client_id, '2022-04-01', 50)",
+               {"debtor_id": debtor_id, "client_id": client_id}, tx=tx)
+    return debtor_id
+
+
+def test_archives_only_debtors_whose_agreements_are_all_closed(sqlite_db):
+    closed = _debtor_with_payment("encerrado", ["completed"])
+    _debtor_with_payment("sem acordo", [])
+    _debtor_with_payment("ativo", ["active"])
+    _debtor_with_payment("ativo e encerrado", ["completed", "active"])
+
+    assert archive_history()["payments"] == 1
+    assert fetch_all("SELECT debtor_id FROM payments_archive_y2022") == [(closed,)]
+    assert len(fetch_all("SELECT id FROM payments")) == 3
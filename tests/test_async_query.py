@@ -0,0 +1,23 @@
+"""Async query layer (src/async_query.py)."""
+import asyncio
+
+import pytest
+
+from src import async_query
+from src.async_query import AsyncPool
+from src.connection import SQLITE
+
+
+def test_failed_sqlite_open_frees_its_slot(sqlite_db, monkeypatch):
+    async def main():
+        pool = AsyncPool(SQLITE, size=1)
+        with monkeypatch.context() as patched:
+            patched.setattr(async_query, "SQLITE_PRAGMAS", ("SELECT * FROM no_such_table",))
+            for _ in range(2):
+                with pytest.raises(Exception, match="no_such_table"):
+                    await asyncio.wait_for(pool.acquire(), timeout=5)
+        session = await asyncio.wait_for(pool.acquire(), timeout=5)
+        await pool.release(session)
+        await pool.close()
+
+    asyncio.run(main())
@@ -0,0 +1,55 @@
+"""Point-in-time restore of the SQLite database (src/backup.py)."""
+import sqlite3
+
+from src import backup
+from src.archive import archive_history
+from src.query import fetch_scalar, insert, transaction
+
+
+def _payments(count, payment_date="2023-05-10"):
+    """`count` payments of a new debtor whose only agreement is closed (so archivable)."""
+    with transaction() as tx:
+        client_id = insert("INSERT INTO clients (name) VALUES ('ACME')", tx=tx)
+        debtor_id = insert("INSERT INTO debtors (client_id, name) VALUES (:client_id, 'Fulano')",
+                           {"client_id": client_id}, tx=tx)
+        insert("INSERT INTO agreements (debtor_id, client_id, status, agreement_date, agreed_value) "
+               "VALUES (:debtor_id, :client_id, 'completed', '2023-01-10', 300)",
+               {"debtor_id": debtor_id, "client_id": client_id}, tx=tx)
+        for _ in range(count):
+            insert("INSERT INTO payments (debtor_id, client_id, payment_date, amount) VALUES (:debtor_id, :client_id, :date, 100)",
+                   {"debtor_id": debtor_id, "client_id": client_id, "date": payment_date}, tx=tx)
+
+
+def _count(path, table):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_restore_after_archive_keeps_archived_rows(sqlite_db):
+    _payments(3)
+    backup.create_snapshot()
+    backup.capture_journal()  # starts the journal
+    assert archive_history() == {"payments": 3, "contact_history": 0}
+    assert fetch_scalar("SELECT count(*) FROM payments") == 0
+    assert backup.capture_journal()["rows"] == 3
+
+    result = backup.restore("restored.db")
+    assert result["segments"] == 1
+    assert _count("restored.db", "payments_all") == 3
+
+
+def test_restore_puts_archived_rows_in_existing_archive_table(sqlite_db):
+    _payments(1)
+    archive_history()  # the 2023 archive table exists from here on
+    _payments(2)
+    backup.create_snapshot()
+    backup.capture_journal()
+    archive_history()
+    backup.capture_journal()
+
+    backup.restore("restored.db")
+    assert _count("restored.db", "payments") == 0
+    assert _count("restored.db", "payments_archive_y2023") == 3
@@ -0,0 +1,14 @@
+"""Change log consumers and compaction (src/changes.py)."""
+from src.changes import _HORIZON, compact_change_log, get_cursor, set_cursor
+from src.query import execute, fetch_all, insert
+
+
+def test_compaction_expires_only_old_entries(sqlite_db):
+    set_cursor("stalled_consumer", 0)  # nothing is consumed: only age removes entries
+    old = insert("INSERT INTO clients (name) VALUES ('Antigo')")
+    insert("INSERT INTO clients (name) VALUES ('Recente')")
+    execute("UPDATE change_log SET ts = '2000-01-01 00:00:00' WHERE table_name = 'clients' AND row_id = :id", {"id": old})
+
+    assert compact_change_log(max_age_hours=1) == 1
+    assert [row[0] for row in fetch_all("SELECT table_name FROM change_log")] == ["clients"]
+    assert get_cursor(_HORIZON) == fetch_all("SELECT MIN(seq) - 1 FROM change_log")[0][0]
@@ -0,0 +1,84 @@
+"""Pool and circuit breaker: after a Supabase outage the pool goes back to Postgres."""
+import sqlite3
+
+import pytest
+
+from src import connection
+from src.connection import CircuitBreaker
+from src.query import ConnectionPool
+
+
+class FakePostgres:
+    """Stands in for a psycopg2 connection (anything not sqlite3 is Postgres)."""
+    closed = 0
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def supabase(monkeypatch):
+    """USE_SUPABASE with a fresh breaker; set `supabase.up` to make Postgres reachable."""
+    class State:
+        up = True
+
+    def connect_postgres():
+        if not State.up:
+            raise ConnectionError("Supabase fora do ar")
+        return FakePostgres()
+
+    breaker = CircuitBreaker("Supabase/Postgres", failure_threshold=1, reset_timeout=60.0)
+    monkeypatch.setattr(connection, "USE_SUPABASE", True)
+    monkeypatch.setattr(connection, "supabase_breaker", breaker)
+    monkeypatch.setattr(connection, "_connect_postgres", connect_postgres)
+    monkeypatch.setattr(connection, "_connect_sqlite", lambda: sqlite3.connect(":memory:", check_same_thread=False))
+    State.breaker = breaker
+    return State
+
+
+def test_pool_returns_to_postgres_after_recovery(supabase):
+    pool = ConnectionPool()
+    supabase.up = False
+    fallback = pool.acquire()
+    assert fallback.dialect.is_sqlite
+    assert supabase.breaker.state == CircuitBreaker.OPEN
+    pool.release(fallback)
+
+    # Still open: the idle SQLite connection is reused, Postgres isn't tried
+    supabase.up = True
+    again = pool.acquire()
+    assert again is fallback
+    pool.release(again)
+
+    supabase.breaker.reset_timeout = 0  # the reset timeout elapses
+    recovered = pool.acquire()
+    assert recovered.dialect.is_postgres
+    assert supabase.breaker.state == CircuitBreaker.CLOSED
+    assert not pool._idle.get("sqlite")
+    pool.release(recovered)
+    assert pool.acquire() is recovered
+
+
+def test_failed_trial_keeps_sqlite(supabase):
+    pool = ConnectionPool()
+    supabase.up = False
+    pool.release(pool.acquire())
+    supabase.breaker.reset_timeout = 0
+    assert pool.acquire().dialect.is_sqlite
+    assert supabase.breaker.state == CircuitBreaker.OPEN
+
+
+def test_healthy_probe_closes_breaker(supabase):
+    probes = []
+    supabase.breaker.probe = lambda: probes.append(1)
+    supabase.breaker.probe_interval = 0.01
+    supabase.up = False
+    assert connection.current_dialect().is_postgres
+    connection.get_connection()
+    assert connection.current_dialect().is_sqlite
+
+    supabase.up = True
+    supabase.breaker._probe_thread.join(1)
+    assert probes
+    assert supabase.breaker.state == CircuitBreaker.CLOSED
+    assert connection.current_dialect().is_postgres
@@ -0,0 +1,17 @@
+"""Background job queue (src/jobs.py)."""
+from src.jobs import claim_job, get_job, requeue_stale_jobs, submit
+from src.query import execute
+
+
+def test_stale_import_fails_instead_of_running_again(sqlite_db):
+    import_id = submit("import_debtors", {"path": "data/jobs/upload.csv", "client_id": 1})
+    noop_id = submit("noop")
+    assert claim_job("w1").id == import_id
+    assert claim_job("w1").id == noop_id
+    execute("UPDATE jobs SET heartbeat_at = 0")  # the worker died
+
+    assert requeue_stale_jobs() == 2
+    imported = get_job(import_id)
+    assert imported["status"] == "failed"
+    assert "já foi gravado" in imported["error"]
+    assert get_job(noop_id)["status"] == "queued"